@@ -5,6 +5,7 @@ Generated by 'django-admin startproject' using Django 5.2.5.
 
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -23,6 +24,11 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
+# Proxies delante de Django (Render pone uno). La IP del cliente es la que agregó el
+# primero de ellos en X-Forwarded-For: lo que está más a la izquierda lo escribe el
+# propio cliente. Con 0 se usa REMOTE_ADDR
+PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', 1))
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -37,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'registro.middleware.CompresionAPIMiddleware', # gzip/brotli solo para /v1/ (APK en 3G)
+    'registro.middleware.MetricasSQLMiddleware', # Queries por request (Server-Timing)
     'whitenoise.middleware.WhiteNoiseMiddleware', # Vital para Supabase/Render
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,14 +75,42 @@ WSGI_APPLICATION = 'proyecto.wsgi.application'
 
 # Database
 # Configuración para Supabase (PostgreSQL)
+# Sin DATABASE_URL (desarrollo local, tests, benchmarks) usamos SQLite.
+DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3')
+
 DATABASES = {
-    'default': dj_database_url.config(
-        default=os.environ.get('DATABASE_URL'),
+    'default': dj_database_url.parse(
+        DATABASE_URL,
         conn_max_age=600,
-        ssl_require=True  
+        ssl_require=not DATABASE_URL.startswith('sqlite')
     )
 }
 
+# Réplica de solo lectura (opcional) para dashboards, exports y gráficos del admin.
+# Para probar en local: copia db.sqlite3 a otro archivo y apunta DATABASE_REPLICA_URL a él.
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=600,
+        ssl_require=not DATABASE_REPLICA_URL.startswith('sqlite')
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+elif sys.argv[1:2] == ['test']:
+    # Los tests del router leen de verdad de una segunda base SQLite (vacía)
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+    }
+
+DATABASE_ROUTERS = ['registro.replicas.ReplicaRouter']
+# Interruptor: en False todo se lee de la primaria aunque haya réplica configurada.
+# Los tests lo apagan salvo los del router, que leen de la réplica de prueba
+REPLICA_LECTURAS = os.environ.get('REPLICA_LECTURAS', '1') == '1' and sys.argv[1:2] != ['test']
+# Si la réplica va más atrasada que esto (segundos), se lee de la primaria
+REPLICA_LAG_MAXIMO = float(os.environ.get('REPLICA_LAG_MAXIMO', 10))
+REPLICA_LAG_CACHE = 5
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
@@ -92,14 +128,37 @@ USE_TZ = True
 # --- ARCHIVOS ESTÁTICOS (CSS, JS) ---
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-# Configuración correcta para WhiteNoise
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # --- ARCHIVOS MULTIMEDIA (FOTOS DE LOS TRABAJADORES) ---
 # Faltaba esto. Es vital para que se guarden las fotos.
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Con SUPABASE_URL las fotos van a un bucket privado de Supabase Storage (el disco
+# de Render es efímero); sin él, a MEDIA_ROOT. Ambos entregan URLs firmadas
+# (registro/almacenamiento.py). Los estáticos quedan con el storage que se usaba
+# en la práctica: Django 5.1+ ya no leía el STATICFILES_STORAGE de WhiteNoise.
+SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
+SUPABASE_KEY = os.environ.get('SUPABASE_KEY', '')
+SUPABASE_BUCKET = os.environ.get('SUPABASE_BUCKET', 'fotos')
+STORAGES = {
+    'default': {
+        'BACKEND': 'registro.almacenamiento.AlmacenamientoSupabase' if SUPABASE_URL
+        else 'registro.almacenamiento.AlmacenamientoLocal',
+    },
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+FOTOS_URL_SEGUNDOS = int(os.environ.get('FOTOS_URL_SEGUNDOS', 3600))    # descarga
+FOTOS_SUBIDA_SEGUNDOS = int(os.environ.get('FOTOS_SUBIDA_SEGUNDOS', 600))  # subida local
+
+# Meses de asistencia archivados (fuera de MEDIA_ROOT: /media/ se sirve sin login)
+ARCHIVO_ASISTENCIAS_DIR = os.environ.get('ARCHIVO_ASISTENCIAS_DIR', os.path.join(BASE_DIR, 'archivo', 'asistencias'))
+# PDF mensuales por obra ya generados (caché: se pueden borrar cuando sea)
+REPORTES_DIR = os.environ.get('REPORTES_DIR', os.path.join(BASE_DIR, 'reportes'))
+
+# SQLite ignora el INCLUDE de los índices covering (solo sirve en PostgreSQL); no es un error
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -114,6 +173,67 @@ LOGIN_REDIRECT_URL = 'home'
 # 3. Al salir, los devuelve al login personalizado (NO al admin)
 LOGOUT_REDIRECT_URL = 'login'
 
+# --- INSTRUMENTACIÓN SQL ---
+# Requests que pasen estos umbrales quedan en el log 'registro.sql'
+SQL_UMBRAL_QUERIES = int(os.environ.get('SQL_UMBRAL_QUERIES', 30))
+SQL_UMBRAL_MS = int(os.environ.get('SQL_UMBRAL_MS', 500))
+SQL_SERVER_TIMING = True
+
+# --- CACHÉ (agregados por obra, ver registro/agregados.py) ---
+# Por defecto memoria local (un caché por proceso). Con CACHE_BACKEND=archivo se
+# usa disco, compartido entre los workers de gunicorn del mismo servidor.
+# OJO: las versiones que invalidan los agregados viven en este caché. Con memoria
+# local cada worker tiene las suyas y, tras una marca en otro worker, sirve datos
+# viejos hasta AGREGADOS_TTL. Con varios workers en producción conviene el compartido.
+if os.environ.get('CACHE_BACKEND') == 'archivo':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'registro',
+        }
+    }
+AGREGADOS_TTL = int(os.environ.get('AGREGADOS_TTL', 300))
+# Los pronósticos se invalidan con la versión de la obra; esto es solo el tope, y
+# solo con caché compartido: con memoria local (por proceso) se usa AGREGADOS_TTL
+PRONOSTICO_TTL = int(os.environ.get('PRONOSTICO_TTL', 24 * 3600))
+
+# --- MÉTRICAS DEL PIPELINE DE ASISTENCIA (/metricas/) ---
+METRICAS_HABILITADAS = os.environ.get('METRICAS_HABILITADAS', '1') == '1'
+
+# --- API (APK) ---
+# La APK se autentica con tokens firmados (registro/tokens.py): sin hash de
+# contraseña por request. Sesión y Basic quedan para el navegador y APKs viejas.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'registro.tokens.AutenticacionToken',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+JWT_ACCESS_MINUTOS = int(os.environ.get('JWT_ACCESS_MINUTOS', 10))
+JWT_REFRESH_DIAS = int(os.environ.get('JWT_REFRESH_DIAS', 30))
+# Respuestas de /v1/ más chicas que esto no se comprimen
+COMPRESION_MINIMO_BYTES = int(os.environ.get('COMPRESION_MINIMO_BYTES', 512))
+
+# --- SUBIDAS REANUDABLES DE FOTOS (registro/subidas.py) ---
+# Los bloques se guardan en SUBIDAS_DIR hasta que la marca o el reporte usa la foto
+SUBIDAS_DIR = os.environ.get('SUBIDAS_DIR', os.path.join(BASE_DIR, 'subidas'))
+SUBIDAS_MAXIMO_BYTES = int(os.environ.get('SUBIDAS_MAXIMO_BYTES', 15 * 1024 * 1024))
+SUBIDAS_BLOQUE_MAXIMO = int(os.environ.get('SUBIDAS_BLOQUE_MAXIMO', 1024 * 1024))
+SUBIDAS_HORAS = int(os.environ.get('SUBIDAS_HORAS', 24))
+
+# --- ARRANQUE DE WORKERS (manage.py benchmark_arranque y su test) ---
+# Tiempo de imports (medido con -X importtime) y memoria de un worker recién levantado
+ARRANQUE_PRESUPUESTO_MS = int(os.environ.get('ARRANQUE_PRESUPUESTO_MS', 2000))
+ARRANQUE_PRESUPUESTO_RSS_MB = int(os.environ.get('ARRANQUE_PRESUPUESTO_RSS_MB', 150))
+
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:8000',
     'http://127.0.0.1:8000',
@@ -16,6 +16,8 @@ urlpatterns = [
     path('dashboard-jefe/', views.dashboard_jefe_obra, name='dashboard_jefe'),
     path('v1/', include('registro.urls')), # Endpoint REST API
     path('jefe/reportar/', views.crear_reporte, name='crear_reporte'),
+    path('metricas/', views.metricas, name='metricas'), # Prometheus (solo staff)
+    path('media-firmada/<str:token>/', views.media_firmada, name='media_firmada'), # Fotos en el storage local
 ]
 
 # --- BLOQUE PARA CARGAR FOTOS EN RENDER Y LOCAL ---
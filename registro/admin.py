@@ -1,20 +1,21 @@
-from django.contrib import admin
-from django.http import HttpResponse
-from django.db.models import Sum
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.html import format_html
-from django.core.serializers.json import DjangoJSONEncoder
-from datetime import date
+from copy import copy
+from datetime import date, timedelta
 import csv
-import json
 
-# --- IMPORTS PARA PDF (ReportLab) ---
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-
-from .models import Perfil, Obra, Asistencia, ReporteImproductivo, BalanceObra
+from .models import Perfil, Obra, Asistencia, ReporteImproductivo, BalanceObra, ArchivoAsistencia, SospechaIP
+from . import agregados, correcciones, fraude_ip, nomina, paginacion, pronostico, reportes
+from .forms import CorreccionAsistenciaForm
+from .replicas import en_replica
 
 # --- ACCIÓN 1: EXPORTAR A CSV (Excel) ---
 def exportar_a_excel(modeladmin, request, queryset):
@@ -26,14 +27,21 @@ def exportar_a_excel(modeladmin, request, queryset):
     field_names = [field.name for field in meta.fields]
     writer.writerow(field_names)
     
-    for obj in queryset:
-        writer.writerow([getattr(obj, field) for field in field_names])
+    with en_replica():  # Export de solo lectura: no compite con las marcas
+        for obj in queryset:
+            writer.writerow([getattr(obj, field) for field in field_names])
         
     return response
 exportar_a_excel.short_description = "📊 Exportar a Excel (CSV)"
 
 # --- ACCIÓN 2: EXPORTAR A PDF (NUEVO) ---
 def exportar_a_pdf(modeladmin, request, queryset):
+    # ReportLab se importa recién acá: pesa en el arranque de cada worker y los PDF son raros
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="reporte_{modeladmin.model._meta.verbose_name_plural}.pdf"'
 
@@ -52,15 +60,16 @@ def exportar_a_pdf(modeladmin, request, queryset):
     columns = [field.verbose_name.title() for field in modeladmin.model._meta.fields]
     data = [columns] # Primera fila son los encabezados
 
-    # Llenamos las filas
-    for obj in queryset:
-        row = []
-        for field in modeladmin.model._meta.fields:
-            value = getattr(obj, field.name)
-            if value is None:
-                value = ""
-            row.append(str(value)) # Convertir todo a string
-        data.append(row)
+    # Llenamos las filas (lectura desde la réplica si hay)
+    with en_replica():
+        for obj in queryset:
+            row = []
+            for field in modeladmin.model._meta.fields:
+                value = getattr(obj, field.name)
+                if value is None:
+                    value = ""
+                row.append(str(value)) # Convertir todo a string
+            data.append(row)
 
     # Crear la tabla
     table = Table(data)
@@ -91,10 +100,37 @@ exportar_a_pdf.short_description = "📄 Exportar a PDF"
 
 # --- CONFIGURACIÓN DE MODELOS ---
 
+class GraficoAsincronoMixin:
+    """
+    El gráfico del changelist no se calcula al dibujar la lista: la página lo
+    pide aparte a datos-grafico/?dias=30 (JSON desde registro/agregados.py,
+    que se invalida con cada escritura de la obra). Cada admin indica la función
+    de agregados.py en `funcion_grafico`.
+    """
+    VENTANAS_DIAS = (30, 90)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('datos-grafico/', self.admin_site.admin_view(self.datos_grafico), name='%s_%s_grafico' % info),
+        ] + super().get_urls()
+
+    def datos_grafico(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        dias = request.GET.get('dias')
+        dias = int(dias) if dias in {str(v) for v in self.VENTANAS_DIAS} else None
+        with en_replica():
+            datos = self.funcion_grafico(dias)
+        return JsonResponse({'dias': dias, 'datos': datos})
+
+
 @admin.register(Perfil)
 class PerfilAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'rut', 'rol', 'estado_dispositivo')
-    actions = ['resetear_dispositivo'] # Ya tenías esto antes o lo agregamos si falta
+    search_fields = ('rut', 'usuario__first_name', 'usuario__last_name', 'usuario__username')  # Lo usa el autocompletar de Asistencia
+    ordering = ('rut',)
+    actions = ['resetear_dispositivo', 'recalcular_sueldos'] # Ya tenías esto antes o lo agregamos si falta
 
     def estado_dispositivo(self, obj):
         if obj.dispositivo_id:
@@ -103,13 +139,29 @@ class PerfilAdmin(admin.ModelAdmin):
     estado_dispositivo.short_description = "Seguridad Móvil"
 
     def resetear_dispositivo(self, request, queryset):
-        queryset.update(dispositivo_id=None)
+        # También revoca las sesiones de la APK (los refresh tokens dejan de servir)
+        queryset.update(dispositivo_id=None, version_token=F('version_token') + 1)
         self.message_user(request, "Dispositivos reseteados.")
     resetear_dispositivo.short_description = "🔄 Resetear Celular"
 
+    def recalcular_sueldos(self, request, queryset):
+        # Corrección de tarifas: recalcula TODO el historial con la tarifa actual
+        total = nomina.recalcular_sueldos(queryset)
+        self.message_user(request, f"{total} asistencias recalculadas con la tarifa actual.")
+    recalcular_sueldos.short_description = "💲 Recalcular sueldos (todo el historial)"
+
 # --- BALANCE DE OBRA ---
+class ChangeListPronostico(ChangeList):
+    """Pronostica de una vez todas las obras de la página (ver registro/pronostico.py)."""
+    def get_results(self, request):
+        super().get_results(request)
+        pronosticos = pronostico.para_balances(self.result_list)
+        for balance in self.result_list:
+            balance.pronostico = pronosticos[balance.obra_id]
+
+
 @admin.register(BalanceObra)
-class BalanceObraAdmin(admin.ModelAdmin):
+class BalanceObraAdmin(GraficoAsincronoMixin, admin.ModelAdmin):
     list_display = (
         'obra', 
         'barra_progreso', 
@@ -118,7 +170,22 @@ class BalanceObraAdmin(admin.ModelAdmin):
         'dias_restantes_vida'   
     )
     list_filter = ('es_rentable', 'obra')
-    actions = [exportar_a_excel, exportar_a_pdf] # <--- AGREGADO PDF AQUÍ
+    list_select_related = ('obra',)
+    actions = [exportar_a_excel, exportar_a_pdf, 'reporte_mensual'] # <--- AGREGADO PDF AQUÍ
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListPronostico
+
+    def reporte_mensual(self, request, queryset):
+        # Mes anterior completo; si los datos no cambiaron sale del caché (registro/reportes.py)
+        if queryset.count() != 1:
+            self.message_user(request, "Elige una sola obra (para todas usa manage.py generar_reportes).", messages.WARNING)
+            return None
+        mes = date.today().replace(day=1) - timedelta(days=1)
+        obra = queryset.get()
+        ruta, _ = reportes.generar(obra, mes.year, mes.month)
+        return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f"reporte_{obra.pk}_{mes:%Y-%m}.pdf")
+    reporte_mensual.short_description = "📑 Reporte mensual (mes anterior)"
     
     # 1. BARRA DE PROGRESO
     def barra_progreso(self, obj):
@@ -148,82 +215,199 @@ class BalanceObraAdmin(admin.ModelAdmin):
         return format_html('<span style="color: #aaa;">Sin multas</span>')
     impacto_multas.short_description = "Multas Proyectadas"
 
-    # 3. PROYECCIÓN
+    # 3. PROYECCIÓN (registro/pronostico.py: tendencia reciente, días de semana e incidentes)
+    def _pronostico(self, obj):
+        if not hasattr(obj, 'pronostico'):
+            obj.pronostico = pronostico.para_balances([obj])[obj.obra_id]
+        return obj.pronostico
+
     def proyeccion_final(self, obj):
-        gastado_real_total = obj.total_pagado_sueldos + obj.total_perdido_improductivo + obj.total_multas_proyectadas
-        dias_pasados = (date.today() - obj.obra.fecha_inicio).days
-        if dias_pasados <= 0: return "Calculando..."
+        p = self._pronostico(obj)
+        if p is None: return "Calculando..."
 
-        gasto_operativo_acum = obj.total_pagado_sueldos + obj.total_perdido_improductivo
-        gasto_diario_promedio = gasto_operativo_acum / dias_pasados
-        
-        duracion_total = (obj.obra.fecha_termino_estimada - obj.obra.fecha_inicio).days
-        costo_final_proyectado = (gasto_diario_promedio * duracion_total) + obj.total_multas_proyectadas
-        
-        diferencia = obj.obra.presupuesto_total - costo_final_proyectado
-        
+        costo = p['costo_final']
+        banda = f"Costo final ${costo['bajo']:,.0f} – ${costo['alto']:,.0f}"
+        diferencia = p['diferencia']
         if diferencia >= 0:
-            return format_html(f'<span style="color: green; font-weight: bold;">🟢 +${diferencia:,.0f}</span>')
+            return format_html('<span style="color: green; font-weight: bold;" title="{}">🟢 +${}</span>', banda, f"{diferencia:,.0f}")
         else:
-            return format_html(f'<span style="color: red; font-weight: bold;">🔴 QUIEBRA (-${abs(diferencia):,.0f})</span>')
+            return format_html('<span style="color: red; font-weight: bold;" title="{}">🔴 QUIEBRA (-${})</span>', banda, f"{abs(diferencia):,.0f}")
     proyeccion_final.short_description = "Rentabilidad Final Estimada"
 
     # 4. SALUD FINANCIERA
     def dias_restantes_vida(self, obj):
-        caja_disponible = obj.presupuesto_restante
-        gasto_operativo_acum = obj.total_pagado_sueldos + obj.total_perdido_improductivo
-        dias_pasados = (date.today() - obj.obra.fecha_inicio).days
-        
-        if dias_pasados <= 0 or gasto_operativo_acum <= 0: return "-"
-        
-        gasto_diario = gasto_operativo_acum / dias_pasados
-        
-        if gasto_diario > 0:
-            dias_vida = caja_disponible / gasto_diario
-        else:
-            return "Sin gastos"
-            
-        dias_reales_restantes = (obj.obra.fecha_termino_estimada - date.today()).days
-        
-        if dias_vida < dias_reales_restantes:
-             return format_html(f'<span style="color: red; font-weight: bold;">⚠️ Fondos para {dias_vida:.0f} días</span>')
-        
-        return f"Cubierto ({dias_vida:.0f} días)"
-    dias_restantes_vida.short_description = "Salud de Caja"
+        p = self._pronostico(obj)
+        if p is None: return "-"
 
-    # 5. GRÁFICO
-    def changelist_view(self, request, extra_context=None):
-        balances = BalanceObra.objects.select_related('obra').all()
-
-        chart_data = []
-        for b in balances:
-            chart_data.append({
-                'obra': b.obra.nombre,
-                'perdido': float(b.total_perdido_improductivo),
-                'multas': float(b.total_multas_proyectadas),
-                'sueldos': float(b.total_pagado_sueldos),
-                'restante': float(b.presupuesto_restante)
-            })
+        agotamiento = p['agotamiento']
+        if agotamiento['estimado'] is None:
+            return "Cubierto (sin fin de caja a la vista)"
+        tarde = f"{agotamiento['tarde']:%d-%m-%Y}" if agotamiento['tarde'] else "más adelante"
+        rango = f"Se acaba entre el {agotamiento['temprano']:%d-%m-%Y} y {tarde}"
 
-        extra_context = extra_context or {}
-        extra_context['chart_data'] = json.dumps(chart_data, cls=DjangoJSONEncoder)
+        if agotamiento['estimado'] <= obj.obra.fecha_termino_estimada:
+             return format_html('<span style="color: red; font-weight: bold;" title="{}">⚠️ Fondos para {} días</span>', rango, p['dias_caja'])
 
-        return super().changelist_view(request, extra_context=extra_context)
+        return format_html('<span title="{}">Cubierto ({} días)</span>', rango, p['dias_caja'])
+    dias_restantes_vida.short_description = "Salud de Caja"
+
+    # 5. GRÁFICO (se carga aparte, ver GraficoAsincronoMixin)
+    funcion_grafico = staticmethod(agregados.grafico_balances)
 
 
 @admin.register(Obra)
 class ObraAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'direccion', 'jefe_obra', 'valor_multa_dia', 'presupuesto_total')
     search_fields = ('nombre', 'direccion')
+    ordering = ('nombre',)
     list_filter = ('activa',)
     actions = [exportar_a_excel, exportar_a_pdf] # <--- AGREGADO PDF AQUÍ
 
+# --- ASISTENCIAS: MODO TABLA GRANDE ---
+CURSOR_VAR = 'cursor'
+
+
+class FiltroAutocompletar(admin.SimpleListFilter):
+    """
+    Filtro por FK con select2 (busca por AJAX en el autocompletar del admin)
+    en vez de listar todas las opciones en cada carga de página.
+    """
+    template = 'admin/registro/filtro_autocompletar.html'
+    campo = None
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        # Solo la opción elegida, para mostrar su nombre; el resto llega por AJAX
+        if not (self.value() or '').isdigit():
+            return []
+        modelo = model_admin.model._meta.get_field(self.campo).related_model
+        obj = modelo.objects.filter(pk=self.value()).first()
+        return [(self.value(), str(obj))] if obj else []
+
+    def queryset(self, request, queryset):
+        if (self.value() or '').isdigit():
+            return queryset.filter(**{f'{self.campo}_id': self.value()})
+        return queryset
+
+
+class FiltroObra(FiltroAutocompletar):
+    title = 'obra'
+    parameter_name = 'obra__id__exact'
+    campo = 'obra'
+
+
+class FiltroTrabajador(FiltroAutocompletar):
+    title = 'trabajador'
+    parameter_name = 'trabajador__id__exact'
+    campo = 'trabajador'
+
+
+class ChangeListKeyset(ChangeList):
+    """
+    Con el orden por defecto (-fecha, -id) pagina por cursor en vez de OFFSET,
+    así la página 500 cuesta lo mismo que la primera. Si el usuario ordena por
+    otra columna (?o=) vuelve a la paginación normal.
+    """
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = paginacion.decodificar_cursor(request.GET.get(CURSOR_VAR))
+        self.url_siguiente = None
+        if CURSOR_VAR in request.GET:
+            # El cursor no es un filtro: se saca antes de que ChangeList lo vea
+            request = copy(request)
+            request.GET = request.GET.copy()
+            del request.GET[CURSOR_VAR]
+        super().__init__(request, *args, **kwargs)
+
+    def get_results(self, request):
+        self.keyset = ORDER_VAR not in self.params and not self.show_all
+        if not self.keyset:
+            return super().get_results(request)
+        # Sin super(): ChangeList armaría la página con OFFSET (y sus conteos) para
+        # tirarla. El total es el del PaginadorEstimado (estimado o con tope)
+        self.page_num = 1
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.full_result_count = self.root_queryset.count() if self.show_full_result_count else None
+        self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+        self.can_show_all = self.result_count <= self.list_max_show_all   # ?all= usa la paginación normal
+
+        qs = self.queryset
+        if self.cursor:
+            qs = paginacion.despues_del_cursor(qs, self.cursor)
+        filas = list(qs[:self.list_per_page + 1])
+        if len(filas) > self.list_per_page:
+            filas = filas[:self.list_per_page]
+            ultima = filas[-1]
+            self.url_siguiente = self.get_query_string(
+                {CURSOR_VAR: paginacion.codificar_cursor(ultima.fecha, ultima.pk)}
+            )
+        self.result_list = filas
+        self.multi_page = bool(self.cursor or self.url_siguiente)
+        self.url_primera = self.get_query_string()
+
+
 @admin.register(Asistencia)
 class AsistenciaAdmin(admin.ModelAdmin):
     list_display = ('trabajador', 'obra', 'fecha', 'hora_entrada', 'hora_salida', 'audit_info')
-    list_filter = ('fecha', 'obra', 'trabajador')
+    list_filter = ('fecha', FiltroObra, FiltroTrabajador, 'salida_automatica')
+    list_select_related = ('trabajador__usuario', 'obra', 'modificado_por')
+    ordering = ('-fecha', '-id')
+    show_full_result_count = False  # Evita un COUNT(*) de toda la tabla en cada página
     readonly_fields = ('fecha_modificacion', 'modificado_por')
-    actions = [exportar_a_excel, exportar_a_pdf] # <--- AGREGADO PDF AQUÍ
+    actions = [exportar_a_excel, exportar_a_pdf, 'exportar_nomina', 'corregir_en_bloque'] # <--- AGREGADO PDF AQUÍ
+
+    def get_changelist(self, request, **kwargs):
+        return ChangeListKeyset
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return paginacion.PaginadorEstimado(queryset, per_page, orphans, allow_empty_first_page)
+
+    @property
+    def media(self):
+        # JS/CSS de select2 que usan los filtros de obra y trabajador
+        return super().media + AutocompleteSelect(Asistencia._meta.get_field('obra'), self.admin_site).media
+
+    def exportar_nomina(self, request, queryset):
+        # Totales por trabajador y obra de las asistencias seleccionadas (usa los filtros de fecha)
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename=nomina.csv'
+        writer = csv.writer(response)
+        writer.writerow(nomina.CAMPOS_CSV)
+        with en_replica():
+            filas = nomina.calcular_nomina(base=queryset, excluir_gps_invalido=True)
+        for fila in filas:
+            writer.writerow([fila[campo] for campo in nomina.CAMPOS_CSV])
+        return response
+    exportar_nomina.short_description = "💰 Nómina por trabajador (CSV)"
+
+    def corregir_en_bloque(self, request, queryset):
+        # Página intermedia con las horas/obra; al aplicar, un bulk_update y un balance por obra
+        form = CorreccionAsistenciaForm(request.POST if 'aplicar' in request.POST else None)
+        if form.is_valid():
+            try:
+                resultado = correcciones.corregir(queryset, request.user, **form.cleaned_data)
+            except correcciones.CorreccionInvalida as e:
+                self.message_user(request, str(e), messages.ERROR)
+                return None
+            self.message_user(
+                request, f"{resultado['asistencias']} asistencias corregidas en {resultado['obras']} obra(s).", messages.SUCCESS
+            )
+            return None
+        return TemplateResponse(request, 'admin/registro/asistencia/corregir_en_bloque.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Corregir asistencias en bloque",
+            'form': form,
+            'seleccionadas': queryset.select_related('trabajador__usuario', 'obra')[:50],
+            'total': queryset.count(),
+            'ids': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'seleccionar_todo': request.POST.get('select_across'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+    corregir_en_bloque.short_description = "🛠️ Corregir horas u obra en bloque"
 
     def audit_info(self, obj):
         if obj.modificado_por:
@@ -238,8 +422,19 @@ class AsistenciaAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+@admin.register(ArchivoAsistencia)
+class ArchivoAsistenciaAdmin(admin.ModelAdmin):
+    # Solo lectura: se crea y se borra con el comando archivar_asistencias
+    list_display = ('periodo', 'obra', 'registros', 'total_horas', 'total_pagado', 'archivo', 'fecha_archivado')
+    list_filter = ('periodo', 'obra')
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+
 @admin.register(ReporteImproductivo)
-class ReporteImproductivoAdmin(admin.ModelAdmin):
+class ReporteImproductivoAdmin(GraficoAsincronoMixin, admin.ModelAdmin):
     list_display = (
         'estado_lectura', 
         'obra', 
@@ -266,21 +461,46 @@ class ReporteImproductivoAdmin(admin.ModelAdmin):
     motivo_corto.short_description = "Motivo"
 
     def marcar_como_leido(self, request, queryset):
+        obras = set(queryset.values_list('obra_id', flat=True))
         queryset.update(leido=True)
+        for obra_id in obras:
+            agregados.invalidar_obra(obra_id)
         self.message_user(request, "Reportes marcados como leídos.")
     marcar_como_leido.short_description = "Marcar seleccionados como Leídos"
 
-    def changelist_view(self, request, extra_context=None):
-        resumen = ReporteImproductivo.objects.values('obra__nombre').annotate(
-            total=Sum('dinero_perdido')
-        ).order_by('-total')
+    funcion_grafico = staticmethod(agregados.grafico_perdidas)
 
-        chart_data = [
-            {'obra': item['obra__nombre'], 'total': float(item['total'])} 
-            for item in resumen
-        ]
+    def changelist_view(self, request, extra_context=None):
+        with en_replica():
+            sin_leer = agregados.total_sin_leer()
 
         extra_context = extra_context or {}
-        extra_context['chart_data'] = json.dumps(chart_data, cls=DjangoJSONEncoder)
+        extra_context['sin_leer'] = sin_leer
+
+        return super().changelist_view(request, extra_context=extra_context)
 
-        return super().changelist_view(request, extra_context=extra_context)
\ No newline at end of file
+@admin.register(SospechaIP)
+class SospechaIPAdmin(admin.ModelAdmin):
+    # Lo llena el comando analizar_ips; acá solo se revisa
+    list_display = ('direccion', 'tipo', 'fecha', 'trabajadores', 'registros', 'ventana', 'obras', 'revisada', 'ver_marcas')
+    list_filter = ('revisada', 'tipo', 'fecha')
+    ordering = ('-trabajadores', '-fecha')
+    actions = ['marcar_revisada']
+
+    def ventana(self, obj):
+        return f"{obj.hora_desde:%H:%M} - {obj.hora_hasta:%H:%M}"
+    ventana.short_description = "Ventana"
+
+    def ver_marcas(self, obj):
+        campo = fraude_ip.CAMPOS[obj.tipo]
+        url = reverse('admin:registro_asistencia_changelist')
+        return format_html('<a href="{}?{}={}&fecha={}">Ver marcas</a>', url, campo, obj.direccion, obj.fecha.isoformat())
+    ver_marcas.short_description = "Asistencias"
+
+    def marcar_revisada(self, request, queryset):
+        total = queryset.update(revisada=True)
+        self.message_user(request, f"{total} sospechas marcadas como revisadas.")
+    marcar_revisada.short_description = "✅ Marcar como revisadas"
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
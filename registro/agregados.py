@@ -0,0 +1,255 @@
+"""
+Caché de agregados por obra (dashboard del jefe y gráficos del admin).
+
+Las claves llevan la versión de la obra: los receivers de models.py la
+incrementan cuando cambia una Asistencia, un ReporteImproductivo, la Obra o su
+balance, y las claves viejas simplemente dejan de usarse (expiran solas).
+Los agregados de todas las obras usan la versión global, que sube con
+cualquier cambio.
+
+La invalidación es inmediata en todos los workers solo si el caché es
+compartido (CACHE_BACKEND=archivo, o Redis/Memcached). Con LocMemCache, el
+default, cada proceso de gunicorn tiene sus propias versiones: una marca que
+entra por un worker no invalida a los demás, que siguen sirviendo el valor
+anterior hasta que vence su clave (AGREGADOS_TTL, 5 minutos por defecto).
+Lo que se cachea por más tiempo revisa cache_compartido() y acota su TTL.
+
+Lo que se guarda en caché se calcula siempre en la primaria, aunque el
+request esté en en_replica(): un valor leído de una réplica atrasada quedaría
+bajo la versión nueva y la invalidación no serviría hasta que venza.
+
+Contra la estampida: cuando una clave falta, solo el request que gana el
+candado (cache.add) recalcula; los demás sirven el último valor conocido o,
+si no hay, esperan un momento a que aparezca.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import Asistencia, BalanceObra, ReporteImproductivo
+from .replicas import en_primaria
+
+TODAS = 'todas'
+_VACIO = object()
+
+
+def cache_compartido():
+    """¿Ven todos los workers el mismo caché (y por lo tanto las mismas versiones)?"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _ttl():
+    return getattr(settings, 'AGREGADOS_TTL', 300)
+
+
+def _clave_version(obra_id):
+    return f'agregados:version:{obra_id}'
+
+
+def version(obra_id):
+    clave = _clave_version(obra_id)
+    valor = cache.get(clave)
+    if valor is None:
+        # Sin caducidad: si la versión se perdiera, se reutilizarían valores viejos
+        cache.add(clave, 1, timeout=None)
+        valor = cache.get(clave, 1)
+    return valor
+
+
+def versiones(obra_ids):
+    """version() de varias obras en una sola ida al caché."""
+    claves = {obra_id: _clave_version(obra_id) for obra_id in obra_ids}
+    valores = cache.get_many(list(claves.values()))
+    return {obra_id: valores.get(clave) or version(obra_id) for obra_id, clave in claves.items()}
+
+
+def _incrementar(obra_id):
+    clave = _clave_version(obra_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # No existía: cualquier valor nuevo sirve, pero no puede repetir uno anterior
+        cache.set(clave, time.time_ns(), timeout=None)
+
+
+def invalidar_obra(obra_id):
+    _incrementar(obra_id)
+    _incrementar(TODAS)
+
+
+def obtener(obra_id, nombre, calcular, ttl=None, espera=2.0):
+    """Devuelve el agregado `nombre` de la obra (o de TODAS) desde el caché, o lo calcula."""
+    ttl = ttl or _ttl()
+    clave = f'agregados:{obra_id}:{version(obra_id)}:{nombre}'
+    valor = cache.get(clave, _VACIO)
+    if valor is not _VACIO:
+        return valor
+
+    ultimo = f'agregados:{obra_id}:ultimo:{nombre}'
+    candado = f'{clave}:calculando'
+    if not cache.add(candado, 1, timeout=30):
+        # Otro request lo está calculando
+        anterior = cache.get(ultimo, _VACIO)
+        if anterior is not _VACIO:
+            return anterior
+        limite = time.monotonic() + espera
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            valor = cache.get(clave, _VACIO)
+            if valor is not _VACIO:
+                return valor
+        return calcular()
+
+    try:
+        with en_primaria():
+            valor = calcular()
+        cache.set_many({clave: valor, ultimo: valor}, timeout=ttl)
+    finally:
+        cache.delete(candado)
+    return valor
+
+
+# --- AGREGADOS POR OBRA ---
+
+def asistencia_hoy(obra_id):
+    hoy = timezone.localdate()
+
+    def calcular():
+        return Asistencia.objects.filter(obra_id=obra_id, fecha=hoy).aggregate(
+            presentes=Count('id'),
+            alertas_gps=Count('id', filter=Q(entrada_valida=False)),
+        )
+    return obtener(obra_id, f'asistencia_hoy:{hoy}', calcular)
+
+
+def balance(obra_id):
+    def calcular():
+        return BalanceObra.objects.filter(obra_id=obra_id).values(
+            'total_pagado_sueldos', 'total_perdido_improductivo', 'total_multas_proyectadas',
+            'presupuesto_restante', 'es_rentable', 'fecha_actualizacion',
+        ).first()
+    return obtener(obra_id, 'balance', calcular)
+
+
+def perdidas_incidentes(obra_id):
+    def calcular():
+        return ReporteImproductivo.objects.filter(obra_id=obra_id).aggregate(
+            total=Sum('dinero_perdido'), dias_retraso=Sum('dias_retraso_obra'),
+        )
+    return obtener(obra_id, 'perdidas', calcular)
+
+
+def reportes_sin_leer(obra_id):
+    return obtener(obra_id, 'sin_leer', lambda: ReporteImproductivo.objects.filter(obra_id=obra_id, leido=False).count())
+
+
+# --- RESUMEN DE VARIAS OBRAS (vista general del jefe) ---
+
+def resumen_obras(obras):
+    """
+    Una fila por obra con lo de hoy (presentes, alertas GPS, turnos abiertos,
+    sueldos de turnos cerrados) y el último incidente. Son 2 queries sin
+    importar cuántas obras: el queryset de obras con el incidente en
+    subqueries, y un GROUP BY obra de las asistencias de hoy (índice obra, fecha).
+    Sin caché: cada obra tiene su versión y juntarlas costaría lo mismo.
+    """
+    hoy = timezone.localdate()
+    ultimo = ReporteImproductivo.objects.filter(obra=OuterRef('pk')).order_by('-fecha', '-id')
+    obras = list(obras.annotate(
+        ultimo_incidente_fecha=Subquery(ultimo.values('fecha')[:1]),
+        ultimo_incidente_motivo=Subquery(ultimo.values('motivo')[:1]),
+        ultimo_incidente_perdido=Subquery(ultimo.values('dinero_perdido')[:1]),
+    ))
+    hoy_por_obra = {
+        f['obra']: f for f in
+        Asistencia.objects.filter(obra__in=[o.pk for o in obras], fecha=hoy).values('obra').annotate(
+            presentes=Count('trabajador', distinct=True),
+            alertas_gps=Count('id', filter=Q(entrada_valida=False)),
+            abiertos=Count('id', filter=Q(hora_salida__isnull=True)),
+            gasto=Sum('monto_pago_dia'),
+        ).order_by()
+    }
+    filas = []
+    for obra in obras:
+        dia = hoy_por_obra.get(obra.pk, {})
+        filas.append({
+            'obra': obra,
+            'presentes': dia.get('presentes', 0),
+            'alertas_gps': dia.get('alertas_gps', 0),
+            'abiertos': dia.get('abiertos', 0),
+            'gasto': dia.get('gasto') or 0,
+            'ultimo_incidente': {
+                'fecha': obra.ultimo_incidente_fecha,
+                'motivo': obra.ultimo_incidente_motivo,
+                'perdido': obra.ultimo_incidente_perdido,
+            } if obra.ultimo_incidente_fecha else None,
+        })
+    return filas
+
+# --- AGREGADOS DE TODAS LAS OBRAS (gráficos del admin) ---
+# dias=None es el histórico completo; con dias (30, 90) solo el movimiento de
+# esa ventana, filtrado por los índices de fecha de Asistencia y ReporteImproductivo.
+
+def _desde(dias):
+    return timezone.localdate() - timedelta(days=dias)
+
+
+def grafico_balances(dias=None):
+    def calcular():
+        balances = BalanceObra.objects.select_related('obra')
+        if not dias:
+            return [
+                {
+                    'obra': b.obra.nombre,
+                    'perdido': float(b.total_perdido_improductivo),
+                    'multas': float(b.total_multas_proyectadas),
+                    'sueldos': float(b.total_pagado_sueldos),
+                    'restante': float(b.presupuesto_restante),
+                }
+                for b in balances
+            ]
+        desde = _desde(dias)
+        sueldos = {
+            f['obra']: f['total'] for f in
+            Asistencia.objects.filter(fecha__gte=desde).values('obra').annotate(total=Sum('monto_pago_dia')).order_by()
+        }
+        reportes = {
+            f['obra']: f for f in
+            ReporteImproductivo.objects.filter(fecha__gte=desde).values('obra').annotate(
+                perdido=Sum('dinero_perdido'), dias_retraso=Sum('dias_retraso_obra'),
+            ).order_by()
+        }
+        datos = []
+        for b in balances:
+            reporte = reportes.get(b.obra_id, {})
+            datos.append({
+                'obra': b.obra.nombre,
+                'perdido': float(reporte.get('perdido') or 0),
+                'multas': float((reporte.get('dias_retraso') or 0) * b.obra.valor_multa_dia),
+                'sueldos': float(sueldos.get(b.obra_id) or 0),
+                'restante': float(b.presupuesto_restante),
+            })
+        return datos
+    clave = f'grafico_balances:{_desde(dias)}' if dias else 'grafico_balances'
+    return obtener(TODAS, clave, calcular)
+
+
+def grafico_perdidas(dias=None):
+    def calcular():
+        reportes = ReporteImproductivo.objects.all()
+        if dias:
+            reportes = reportes.filter(fecha__gte=_desde(dias))
+        resumen = reportes.values('obra__nombre').annotate(total=Sum('dinero_perdido')).order_by('-total')
+        return [{'obra': item['obra__nombre'], 'total': float(item['total'])} for item in resumen]
+    clave = f'grafico_perdidas:{_desde(dias)}' if dias else 'grafico_perdidas'
+    return obtener(TODAS, clave, calcular)
+
+
+def total_sin_leer():
+    return obtener(TODAS, 'sin_leer', lambda: ReporteImproductivo.objects.filter(leido=False).count())
@@ -0,0 +1,153 @@
+"""
+Almacenamiento de fotos (selfies de entrada/salida y evidencia de reportes).
+
+En Render el disco es efímero y cada foto pasaba dos veces por Django (al
+subirla y al servirla desde /media/). Con SUPABASE_URL configurado las fotos
+van a un bucket privado de Supabase Storage; sin él, a MEDIA_ROOT con
+AlmacenamientoLocal, que expone el mismo API (sirve para desarrollo y tests).
+
+Ambos backends entregan URLs firmadas:
+  - url(nombre): descarga temporal (FOTOS_URL_SEGUNDOS), la usan admin y dashboard.
+  - url_subida(nombre): PUT directo al storage. La APK la pide en
+    /v1/api/fotos/subida/, sube la foto sin pasar por los workers y al marcar
+    manda `foto_clave` en vez del archivo.
+Las carpetas (upload_to de los ImageField) son las mismas de siempre.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.urls import reverse
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+from .subidas import EXTENSIONES, SubidaInvalida
+
+CARPETAS = {
+    'entrada': 'asistencias/entrada/',
+    'salida': 'asistencias/salida/',
+    'evidencia': 'evidencias_perdida/',
+}
+SAL_CLAVE = 'registro.almacenamiento.clave'
+SAL_URL = 'registro.almacenamiento.url'
+
+
+class ClaveInvalida(SubidaInvalida):
+    pass
+
+
+def _segundos_descarga():
+    return getattr(settings, 'FOTOS_URL_SEGUNDOS', 3600)
+
+
+def _segundos_subida():
+    return getattr(settings, 'FOTOS_SUBIDA_SEGUNDOS', 600)
+
+
+@deconstructible
+class AlmacenamientoLocal(FileSystemStorage):
+    """MEDIA_ROOT con URLs firmadas hacia la vista media_firmada (mismo API que Supabase)."""
+
+    def _firmar(self, nombre, operacion):
+        token = signing.dumps({'n': nombre, 'op': operacion}, salt=SAL_URL)
+        return reverse('media_firmada', args=[token])
+
+    def url(self, name):
+        return self._firmar(name, 'get')
+
+    def url_subida(self, nombre):
+        return {'url': self._firmar(nombre, 'put'), 'metodo': 'PUT', 'expira_en': _segundos_subida()}
+
+    @staticmethod
+    def leer_token(token):
+        """(nombre, operación) de una URL firmada vigente, o (None, None)."""
+        try:
+            datos = signing.loads(token, salt=SAL_URL)
+            vigencia = _segundos_subida() if datos['op'] == 'put' else _segundos_descarga()
+            signing.loads(token, salt=SAL_URL, max_age=vigencia)
+        except signing.BadSignature:
+            return None, None
+        return datos['n'], datos['op']
+
+
+@deconstructible
+class AlmacenamientoSupabase(Storage):
+    """Bucket privado de Supabase Storage. El cliente se importa y crea al primer uso."""
+
+    def __init__(self, bucket=None, url=None, clave=None):
+        self.bucket = bucket or getattr(settings, 'SUPABASE_BUCKET', 'fotos')
+        self.url_proyecto = url or getattr(settings, 'SUPABASE_URL', '')
+        self.clave = clave or getattr(settings, 'SUPABASE_KEY', '')
+
+    @cached_property
+    def _bucket(self):
+        from supabase import create_client  # pesado: solo en el worker que toca fotos
+        return create_client(self.url_proyecto, self.clave).storage.from_(self.bucket)
+
+    def _save(self, name, content):
+        tipo = getattr(content, 'content_type', None) or 'image/jpeg'
+        # Con temporary_file_path (subidas por partes, archivos grandes) se sube desde disco
+        origen = content.temporary_file_path() if hasattr(content, 'temporary_file_path') else content.read()
+        self._bucket.upload(name, origen, {'content-type': tipo, 'upsert': 'false'})
+        return name
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self._bucket.download(name), name=name)
+
+    def exists(self, name):
+        return self._bucket.exists(name)
+
+    def delete(self, name):
+        self._bucket.remove([name])
+        cache.delete(f"foto_url:{name}")
+
+    def size(self, name):
+        return self._bucket.info(name).get('size')
+
+    def url(self, name):
+        # Firmar es una llamada HTTP: se reutiliza la URL mientras le quede vida
+        clave_cache = f"foto_url:{name}"
+        firmada = cache.get(clave_cache)
+        if firmada is None:
+            respuesta = self._bucket.create_signed_url(name, _segundos_descarga())
+            firmada = respuesta.get('signedURL') or respuesta.get('signedUrl')
+            cache.set(clave_cache, firmada, _segundos_descarga() // 2)
+        return firmada
+
+    def url_subida(self, nombre):
+        # Supabase fija la vigencia de las URLs de subida (2 horas)
+        respuesta = self._bucket.create_signed_upload_url(nombre)
+        return {'url': respuesta['signed_url'], 'metodo': 'PUT', 'expira_en': 7200}
+
+
+def preparar_subida(usuario, tipo, nombre_original=''):
+    """Nombre nuevo en la carpeta del tipo y URL firmada para subirlo directo al storage."""
+    if tipo not in CARPETAS:
+        raise ClaveInvalida(f"Tipo de foto inválido, usa: {', '.join(CARPETAS)}")
+    extension = os.path.splitext(nombre_original or '')[1].lower()
+    nombre = f"{CARPETAS[tipo]}{uuid.uuid4().hex}{extension if extension in EXTENSIONES else '.jpg'}"
+    datos = default_storage.url_subida(nombre)
+    datos['clave'] = signing.dumps({'n': nombre, 'u': usuario.pk}, salt=SAL_CLAVE)
+    return datos
+
+
+def foto_directa(clave, usuario, respaldo=None):
+    """
+    Nombre de la foto subida directo al storage (se asigna tal cual al
+    ImageField, sin volver a subirla), o `respaldo` si no viene clave.
+    """
+    if not clave:
+        return respaldo
+    try:
+        datos = signing.loads(clave, salt=SAL_CLAVE, max_age=getattr(settings, 'SUBIDAS_HORAS', 24) * 3600)
+    except signing.BadSignature:
+        raise ClaveInvalida("La clave de la foto no es válida o venció")
+    if datos['u'] != usuario.pk:
+        raise ClaveInvalida("La clave de la foto no es válida o venció")
+    if not default_storage.exists(datos['n']):
+        raise ClaveInvalida("La foto todavía no se termina de subir")
+    return datos['n']
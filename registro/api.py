@@ -1,21 +1,45 @@
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.utils import timezone
+from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
-from .models import Obra, Asistencia
-from .serializers import ObraSerializer
+import calendar
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Asistencia, BalanceObra, Obra, Perfil
+from .serializers import ObraCompactaSerializer, ObraSerializer
+from .decorators import presupuesto_queries
+from .forms import CorreccionAsistenciaForm
+from .replicas import lecturas_en_replica
+from .views import get_client_ip
+from . import almacenamiento, correcciones, nomina, paginacion, pronostico, subidas, tokens, turnos
+
+# Formato compacto (opcional) para la APK en 3G: claves cortas y códigos en vez de textos
+CODIGOS_MARCA = {turnos.ENTRADA: 1, turnos.SALIDA: 2, turnos.REPETIDA: 3}
+
+def pide_compacto(request):
+    return 'compacto' in (request.query_params.get('formato'), request.headers.get('X-Formato'))
 
 # 1. ENCHUFE PARA QUE LA APK DESCARGUE LAS OBRAS
+@presupuesto_queries(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def lista_obras(request):
     obras = Obra.objects.filter(activa=True)
+    if pide_compacto(request):
+        return Response(ObraCompactaSerializer(obras, many=True).data)
     serializer = ObraSerializer(obras, many=True)
     return Response(serializer.data)
 
 # 2. ENCHUFE PARA QUE LA APK MARQUE ASISTENCIA
+# 21: con subida_id se suman leer y borrar la SubidaFoto, y la primera marca de
+# una obra crea su balance (savepoint + INSERT)
+@presupuesto_queries(21)
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def marcar_asistencia_api(request):
@@ -28,36 +52,347 @@ def marcar_asistencia_api(request):
     obra_id = request.data.get('obra_id')
     lat = request.data.get('latitud')
     lon = request.data.get('longitud')
-    foto = request.FILES.get('foto') # La foto viene como archivo
+    # La foto viene como archivo, ya subida por partes (subida_id) o directo al storage (foto_clave)
+    foto = request.FILES.get('foto')
 
     if not all([obra_id, lat, lon]):
         return Response({"error": "Faltan datos (Obra o GPS)"}, status=400)
 
     obra = get_object_or_404(Obra, id=obra_id)
 
-    # Revisar si es Entrada o Salida
-    asistencia_activa = Asistencia.objects.filter(
-        trabajador=perfil, 
-        fecha=timezone.now().date(), 
-        hora_salida__isnull=True
-    ).first()
-
-    if asistencia_activa:
-        # ES SALIDA
-        asistencia_activa.hora_salida = timezone.now().time()
-        asistencia_activa.latitud_salida = lat
-        asistencia_activa.longitud_salida = lon
-        if foto:
-            asistencia_activa.foto_salida = foto
-        asistencia_activa.save()
+    # Entrada o salida según el turno abierto (un solo turno por trabajador, ver registro/turnos.py)
+    try:
+        with subidas.usar(request.data.get('subida_id'), request.user, foto) as subida:
+            foto = almacenamiento.foto_directa(request.data.get('foto_clave'), request.user, subida)
+            estado, _ = turnos.marcar(perfil, obra, lat, lon, foto, ip=get_client_ip(request))
+            if estado in (turnos.ENTRADA, turnos.SALIDA):
+                subidas.consumida(subida)
+    except subidas.SubidaInvalida as e:
+        return Response({"error": str(e)}, status=400)
+
+    if pide_compacto(request):
+        return Response({"e": CODIGOS_MARCA[estado]}, status=201 if estado == turnos.ENTRADA else 200)
+    if estado == turnos.SALIDA:
         return Response({"mensaje": "SALIDA marcada correctamente", "estado": "salida"})
+    if estado == turnos.REPETIDA:
+        return Response({"mensaje": "Marca repetida, se ignoró", "estado": "repetida"})
+    return Response({"mensaje": "ENTRADA marcada correctamente", "estado": "entrada"}, status=201)
+
+# 3. NÓMINA DEL PERÍODO (Admin: todas las obras / Jefe: sus obras)
+@presupuesto_queries(5)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@lecturas_en_replica
+def nomina_periodo(request):
+    perfil = getattr(request.user, 'perfil', None)
+    if request.user.is_staff or (perfil and perfil.rol == 'ADMIN'):
+        obras = None
+    elif perfil and perfil.rol == 'JEFE':
+        obras = Obra.objects.filter(jefe_obra=perfil)
     else:
-        # ES ENTRADA
-        Asistencia.objects.create(
-            trabajador=perfil,
-            obra=obra,
-            latitud_entrada=lat,
-            longitud_entrada=lon,
-            foto_entrada=foto
+        return Response({"error": "No tienes permiso para ver la nómina"}, status=403)
+
+    desde = parse_date(request.query_params.get('desde') or '')
+    hasta = parse_date(request.query_params.get('hasta') or '')
+    if not desde or not hasta or desde > hasta:
+        return Response({"error": "Indica un período válido (desde y hasta en formato AAAA-MM-DD)"}, status=400)
+
+    obra_id = request.query_params.get('obra_id')
+    if obra_id:
+        try:
+            obra_id = int(obra_id)
+        except ValueError:
+            return Response({"error": "obra_id debe ser un número"}, status=400)
+        obras = (obras if obras is not None else Obra.objects.all()).filter(id=obra_id)
+
+    filas = nomina.calcular_nomina(
+        desde, hasta, obras=obras,
+        excluir_gps_invalido=request.query_params.get('excluir_gps_invalido') == '1',
+    )
+    return Response({
+        "desde": desde, "hasta": hasta,
+        "totales": nomina.totales(filas),
+        "resultados": filas,
+    })
+
+# 4. BUSCADOR DE TRABAJADORES (para el reporte de incidentes)
+TRABAJADORES_POR_PAGINA = 20
+
+@presupuesto_queries(5)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def buscar_trabajadores(request):
+    perfil = getattr(request.user, 'perfil', None)
+    if not (request.user.is_staff or (perfil and perfil.rol in ('ADMIN', 'JEFE'))):
+        return Response({"error": "No tienes permiso para buscar trabajadores"}, status=403)
+
+    q = (request.query_params.get('q') or '').strip()
+    if len(q) < 2:
+        return Response({"error": "Escribe al menos 2 letras del nombre o del RUT"}, status=400)
+    try:
+        pagina = max(int(request.query_params.get('pagina', 1)), 1)
+    except ValueError:
+        pagina = 1
+
+    # Sin COUNT: se pide una fila de más. El OR con los nombres (UPPER(...) LIKE sobre
+    # auth_user) no lo resuelve ningún índice: se recorren los trabajadores en orden de
+    # RUT hasta juntar la página. Alcanza para una nómina de miles; si crece, la
+    # búsqueda por nombre necesita índices funcionales o de texto (y la página, cursor)
+    qs = Perfil.objects.filter(rol='TRABAJADOR').filter(
+        Q(rut__startswith=q) | Q(usuario__first_name__istartswith=q) | Q(usuario__last_name__istartswith=q)
+    ).select_related('usuario').order_by('rut')
+    inicio = (pagina - 1) * TRABAJADORES_POR_PAGINA
+    perfiles = list(qs[inicio:inicio + TRABAJADORES_POR_PAGINA + 1])
+
+    return Response({
+        "pagina": pagina,
+        "hay_mas": len(perfiles) > TRABAJADORES_POR_PAGINA,
+        "resultados": [
+            {"id": p.id, "rut": p.rut, "nombre": p.usuario.get_full_name() or p.usuario.username}
+            for p in perfiles[:TRABAJADORES_POR_PAGINA]
+        ],
+    })
+
+# 5. TOKENS DE LA APK (ver registro/tokens.py)
+@presupuesto_queries(4)
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def obtener_token(request):
+    # El único hash de contraseña: de acá en adelante la APK usa el access token
+    usuario = authenticate(request, username=request.data.get('username'), password=request.data.get('password'))
+    if usuario is None:
+        return Response({"error": "Usuario o contraseña incorrectos"}, status=401)
+    perfil = Perfil.objects.filter(usuario=usuario).first()
+    if perfil is None:
+        return Response({"error": "Usuario no es trabajador"}, status=400)
+
+    # Mismo device binding que el panel web
+    dispositivo = request.data.get('dispositivo_id')
+    if perfil.dispositivo_id and dispositivo != perfil.dispositivo_id:
+        return Response({"error": "Esta cuenta está vinculada a otro dispositivo"}, status=403)
+    if dispositivo and not perfil.dispositivo_id:
+        perfil.dispositivo_id = dispositivo
+        Perfil.objects.filter(pk=perfil.pk).update(dispositivo_id=dispositivo)
+
+    perfil.usuario = usuario
+    return Response(tokens.emitir(perfil))
+
+@presupuesto_queries(1)
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def refrescar_token(request):
+    try:
+        return Response(tokens.refrescar(request.data.get('refresh') or ''))
+    except tokens.TokenInvalido as e:
+        return Response({"error": str(e)}, status=401)
+
+# 6. SUBIDAS REANUDABLES DE FOTOS (ver registro/subidas.py)
+def _estado_subida(subida):
+    return {
+        "id": str(subida.pk), "offset": subida.recibido, "tamano": subida.tamano,
+        "completada": subida.completada, "bloque_maximo": subidas.bloque_maximo(),
+        "expira": subida.expira,
+    }
+
+@presupuesto_queries(3)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def crear_subida(request):
+    try:
+        tamano = int(request.data.get('tamano'))
+    except (TypeError, ValueError):
+        return Response({"error": "Indica el tamaño del archivo en bytes"}, status=400)
+    try:
+        subida = subidas.crear(request.user, tamano, request.data.get('sha256'), request.data.get('nombre'))
+    except subidas.SubidaInvalida as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(_estado_subida(subida), status=201)
+
+@presupuesto_queries(4)
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def detalle_subida(request, subida_id):
+    try:
+        subida = subidas.obtener(subida_id, request.user)
+    except subidas.SubidaInvalida as e:
+        return Response({"error": str(e)}, status=404)
+    if request.method == 'GET':
+        return Response(_estado_subida(subida))
+
+    # El cuerpo es el bloque crudo: se lee del stream, sin pasar por los parsers de DRF
+    try:
+        offset = int(request.query_params.get('offset', ''))
+        largo = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return Response({"error": "Indica el offset del bloque"}, status=400)
+    try:
+        subidas.recibir_bloque(subida, offset, request.stream, largo, request.headers.get('X-Checksum'))
+    except subidas.OffsetIncorrecto as e:
+        return Response(dict(_estado_subida(subida), error=str(e)), status=409)
+    except subidas.SubidaInvalida as e:
+        return Response(dict(_estado_subida(subida), error=str(e)), status=400)
+    return Response(_estado_subida(subida))
+
+@presupuesto_queries(4)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalizar_subida(request, subida_id):
+    try:
+        subida = subidas.obtener(subida_id, request.user)
+        subidas.finalizar(subida)
+    except subidas.SubidaInvalida as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(_estado_subida(subida))
+
+# 7. SUBIDA DIRECTA AL STORAGE (la foto no pasa por los workers, ver registro/almacenamiento.py)
+@presupuesto_queries(2)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def url_subida_foto(request):
+    try:
+        datos = almacenamiento.preparar_subida(request.user, request.data.get('tipo', 'entrada'), request.data.get('nombre'))
+    except almacenamiento.ClaveInvalida as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(datos, status=201)
+
+
+# 8. HISTORIAL DEL TRABAJADOR ("¿cuántas horas llevo esta quincena?")
+CAMPOS_HISTORIAL = ('id', 'fecha', 'obra', 'hora_entrada', 'hora_salida', 'horas_trabajadas', 'monto_pago_dia', 'entrada_valida')
+HISTORIAL_POR_PAGINA = 30
+HISTORIAL_MAXIMO_POR_PAGINA = 100
+
+def _quincena(hoy):
+    if hoy.day <= 15:
+        return hoy.replace(day=1), hoy.replace(day=15)
+    return hoy.replace(day=16), hoy.replace(day=calendar.monthrange(hoy.year, hoy.month)[1])
+
+@presupuesto_queries(5)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@lecturas_en_replica
+def mis_asistencias(request):
+    # Con token el perfil viene en el access; con sesión cuesta una query
+    perfil_id = getattr(request.user, 'perfil_id', None) or \
+        Perfil.objects.filter(usuario_id=request.user.pk).values_list('id', flat=True).first()
+    if perfil_id is None:
+        return Response({"error": "Usuario no es trabajador"}, status=400)
+
+    desde, hasta = _quincena(timezone.localdate())
+    if request.query_params.get('desde') or request.query_params.get('hasta'):
+        desde = parse_date(request.query_params.get('desde') or '')
+        hasta = parse_date(request.query_params.get('hasta') or '')
+        if not desde or not hasta or desde > hasta:
+            return Response({"error": "Indica un período válido (desde y hasta en formato AAAA-MM-DD)"}, status=400)
+
+    campos = [c for c in (request.query_params.get('campos') or '').split(',') if c] or list(CAMPOS_HISTORIAL)
+    invalidos = set(campos) - set(CAMPOS_HISTORIAL)
+    if invalidos:
+        return Response({"error": f"Campos desconocidos: {', '.join(sorted(invalidos))}. Disponibles: {', '.join(CAMPOS_HISTORIAL)}"}, status=400)
+    try:
+        limite = min(max(int(request.query_params.get('limite', HISTORIAL_POR_PAGINA)), 1), HISTORIAL_MAXIMO_POR_PAGINA)
+    except ValueError:
+        limite = HISTORIAL_POR_PAGINA
+
+    # Todo sale del índice (trabajador, -fecha, -id): sin OFFSET ni COUNT
+    qs = Asistencia.objects.filter(trabajador_id=perfil_id, fecha__range=(desde, hasta))
+    pagina = qs.order_by('-fecha', '-id')
+    cursor_texto = request.query_params.get('cursor')
+    if cursor_texto:
+        cursor = paginacion.decodificar_cursor(cursor_texto)
+        if cursor is None:
+            return Response({"error": "Cursor inválido"}, status=400)
+        pagina = paginacion.despues_del_cursor(pagina, cursor)
+    filas = list(pagina.values(*dict.fromkeys(campos + ['id', 'fecha']))[:limite + 1])
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+
+    respuesta = {
+        "desde": desde, "hasta": hasta,
+        "siguiente": paginacion.codificar_cursor(filas[-1]['fecha'], filas[-1]['id']) if hay_mas else None,
+        "resultados": [{c: f[c] for c in campos} for f in filas],
+    }
+    # Los totales del período van en la primera página (las siguientes no los repiten)
+    if not cursor_texto:
+        respuesta["totales"] = qs.aggregate(
+            turnos=Count('id'), dias=Count('fecha', distinct=True),
+            horas=Coalesce(Sum('horas_trabajadas'), Decimal(0)), monto=Coalesce(Sum('monto_pago_dia'), Decimal(0)),
+            turnos_abiertos=Count('id', filter=Q(hora_salida__isnull=True)),
         )
-        return Response({"mensaje": "ENTRADA marcada correctamente", "estado": "entrada"}, status=201)
\ No newline at end of file
+    return Response(respuesta)
+
+
+# 9. PRONÓSTICO DE GASTO POR OBRA (Admin: todas / Jefe: sus obras, ver registro/pronostico.py)
+@presupuesto_queries(6)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@lecturas_en_replica
+def pronosticos_obras(request):
+    perfil = getattr(request.user, 'perfil', None)
+    balances = BalanceObra.objects.select_related('obra').order_by('obra__nombre')
+    if request.user.is_staff or (perfil and perfil.rol == 'ADMIN'):
+        pass
+    elif perfil and perfil.rol == 'JEFE':
+        balances = balances.filter(obra__jefe_obra=perfil)
+    else:
+        return Response({"error": "No tienes permiso para ver los pronósticos"}, status=403)
+
+    obra_id = request.query_params.get('obra_id')
+    if obra_id:
+        try:
+            balances = balances.filter(obra_id=int(obra_id))
+        except ValueError:
+            return Response({"error": "obra_id debe ser un número"}, status=400)
+
+    balances = list(balances)
+    pronosticos = pronostico.para_balances(balances)
+    return Response({
+        "resultados": [
+            {"obra": b.obra.nombre, "presupuesto_total": b.obra.presupuesto_total,
+             "presupuesto_restante": b.presupuesto_restante,
+             "fecha_termino_estimada": b.obra.fecha_termino_estimada,
+             **(pronosticos[b.obra_id] or {"obra_id": b.obra_id})}
+            for b in balances
+        ],
+    })
+
+
+# 10. CORRECCIÓN EN BLOQUE (Admin: todas las obras / Jefe: sus obras, ver registro/correcciones.py)
+CORRECCION_MAXIMO = 1000
+
+@presupuesto_queries(14)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def corregir_asistencias(request):
+    perfil = getattr(request.user, 'perfil', None)
+    obras = Obra.objects.all()
+    if request.user.is_staff or (perfil and perfil.rol == 'ADMIN'):
+        pass
+    elif perfil and perfil.rol == 'JEFE':
+        obras = obras.filter(jefe_obra=perfil)
+    else:
+        return Response({"error": "No tienes permiso para corregir asistencias"}, status=403)
+
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not 0 < len(ids) <= CORRECCION_MAXIMO or not all(isinstance(i, int) for i in ids):
+        return Response({"error": f"Indica en 'ids' una lista de 1 a {CORRECCION_MAXIMO} asistencias"}, status=400)
+
+    form = CorreccionAsistenciaForm({
+        'hora_entrada': request.data.get('hora_entrada'),
+        'hora_salida': request.data.get('hora_salida'),
+        'obra': request.data.get('obra_id'),
+    })
+    form.fields['obra'].queryset = obras
+    if not form.is_valid():
+        return Response({"error": "Corrección inválida", "detalle": form.errors}, status=400)
+
+    asistencias = Asistencia.objects.filter(pk__in=ids, obra__in=obras)
+    try:
+        resultado = correcciones.corregir(asistencias, request.user, **form.cleaned_data)
+    except correcciones.CorreccionInvalida as e:
+        return Response({"error": str(e)}, status=400)
+    if resultado['asistencias'] != len(set(ids)):
+        # Ids ajenos o inexistentes: no se corrigieron (la respuesta lo dice)
+        resultado['ignoradas'] = len(set(ids)) - resultado['asistencias']
+    return Response(resultado)
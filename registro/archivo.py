@@ -0,0 +1,194 @@
+"""
+Archivo de meses cerrados de Asistencia.
+
+Cada mes se guarda como gzip JSON Lines de solo lectura (una fila por línea)
+en ARCHIVO_ASISTENCIAS_DIR, se resume por obra en ArchivoAsistencia y se
+elimina de la tabla viva. Los sueldos archivados se acumulan en
+BalanceObra.total_sueldos_archivados para que el balance no cambie.
+Un mes archivado se puede rehidratar completo para una auditoría.
+"""
+import gzip
+import hashlib
+import json
+import os
+import stat
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import agregados, particiones
+from .models import ArchivoAsistencia, Asistencia, BalanceObra, Perfil
+
+CAMPOS = [f.attname for f in Asistencia._meta.concrete_fields]
+
+
+class _Codificador(DjangoJSONEncoder):
+    # DjangoJSONEncoder recorta a milisegundos; el archivo debe ser exacto
+    def default(self, o):
+        if isinstance(o, (datetime, time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def directorio():
+    return getattr(settings, 'ARCHIVO_ASISTENCIAS_DIR', os.path.join(settings.BASE_DIR, 'archivo', 'asistencias'))
+
+
+def ruta_archivo(inicio):
+    return os.path.join(directorio(), f'{inicio:%Y-%m}.jsonl.gz')
+
+
+def _sha256(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _filas_del_mes(inicio):
+    return Asistencia.objects.filter(fecha__gte=inicio, fecha__lt=particiones.mes_siguiente(inicio))
+
+
+def _archivables(inicio):
+    # Un turno que sigue abierto (Perfil.turno_abierto le apunta) queda en la tabla
+    # viva: archivarlo dejaría el puntero colgando. Un mes se archiva una sola vez,
+    # así que esas filas se quedan ahí (el balance las sigue contando como vivas);
+    # ver restantes()
+    abiertos = Perfil.objects.filter(turno_abierto__isnull=False).values('turno_abierto')
+    return _filas_del_mes(inicio).exclude(pk__in=abiertos)
+
+
+def restantes(inicio):
+    """Filas de un mes que siguen en la tabla viva (turnos que estaban abiertos al archivar)."""
+    return _filas_del_mes(particiones.inicio_mes(inicio)).count()
+
+
+def archivar_mes(inicio, lote=2000):
+    """
+    Archiva el mes que empieza en `inicio`. Devuelve la cantidad de registros
+    archivados (0 si el mes no tenía datos). Los turnos aún abiertos no se
+    archivan y se quedan en la tabla viva.
+    """
+    inicio = particiones.inicio_mes(inicio)
+    if inicio >= particiones.inicio_mes(date.today()):
+        raise ValueError(f"{inicio:%Y-%m} no es un mes cerrado.")
+    if ArchivoAsistencia.objects.filter(periodo=inicio).exists():
+        raise ValueError(f"{inicio:%Y-%m} ya está archivado.")
+
+    ruta = ruta_archivo(inicio)
+    temporal = ruta + '.tmp'
+    with transaction.atomic():
+        # Foto del mes: las filas quedan bloqueadas y el resumen, el archivo y el
+        # borrado salen de estos mismos ids (una corrección o marca que llegue en
+        # medio no queda borrada sin archivar, ni contada en un lado y no en el otro)
+        ids = list(_archivables(inicio).select_for_update().order_by('id').values_list('pk', flat=True))
+        if not ids:
+            return 0
+        elegidos = set(ids)
+
+        # Se escribe a un temporal y se renombra: nunca queda un archivo a medias
+        resumen = {}
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with gzip.open(temporal, 'wt', encoding='utf-8') as f:
+            for fila in _filas_del_mes(inicio).order_by('id').values(*CAMPOS).iterator(chunk_size=lote):
+                if fila['id'] not in elegidos:
+                    continue
+                f.write(json.dumps(fila, cls=_Codificador) + '\n')
+                r = resumen.setdefault(fila['obra_id'], {'registros': 0, 'horas': 0, 'pagado': 0})
+                r['registros'] += 1
+                r['horas'] += fila['horas_trabajadas'] or 0
+                r['pagado'] += fila['monto_pago_dia'] or 0
+        os.replace(temporal, ruta)
+        os.chmod(ruta, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        huella = _sha256(ruta)
+
+        ArchivoAsistencia.objects.bulk_create([
+            ArchivoAsistencia(
+                periodo=inicio, obra_id=obra_id, registros=r['registros'],
+                total_horas=r['horas'], total_pagado=r['pagado'],
+                archivo=os.path.basename(ruta), sha256=huella,
+            )
+            for obra_id, r in resumen.items()
+        ])
+        for obra_id, r in resumen.items():
+            balance, _ = BalanceObra.objects.get_or_create(obra_id=obra_id)
+            BalanceObra.objects.filter(pk=balance.pk).update(
+                total_sueldos_archivados=F('total_sueldos_archivados') + r['pagado']
+            )
+        # La partición se bota entera solo si no le queda nada vivo (turnos abiertos)
+        if _filas_del_mes(inicio).count() != len(ids) or not particiones.eliminar_particion_mes(inicio):
+            for i in range(0, len(ids), lote):
+                _filas_del_mes(inicio).filter(pk__in=ids[i:i + lote]).delete()
+    for obra_id in resumen:
+        agregados.invalidar_obra(obra_id)
+    return len(ids)
+
+
+def leer_archivo(inicio):
+    """Itera las filas (dicts) de un mes archivado, verificando su sha256."""
+    inicio = particiones.inicio_mes(inicio)
+    resumen = ArchivoAsistencia.objects.filter(periodo=inicio).first()
+    if not resumen:
+        raise ValueError(f"{inicio:%Y-%m} no está archivado.")
+    ruta = os.path.join(directorio(), resumen.archivo)
+    if _sha256(ruta) != resumen.sha256:
+        raise ValueError(f"El archivo {ruta} no coincide con su sha256 registrado.")
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        for linea in f:
+            yield json.loads(linea)
+
+
+def _a_modelo(fila):
+    # Archivos de antes de agregar un campo no lo traen: se usa su default
+    valores = {
+        campo.attname: campo.to_python(fila[campo.attname]) if campo.attname in fila else campo.get_default()
+        for campo in Asistencia._meta.concrete_fields
+    }
+    return Asistencia(**valores)
+
+
+def rehidratar_mes(inicio, lote=1000):
+    """Devuelve un mes archivado a la tabla viva (con sus ids originales)."""
+    inicio = particiones.inicio_mes(inicio)
+    resumen = list(ArchivoAsistencia.objects.filter(periodo=inicio))
+    total = 0
+
+    with transaction.atomic():
+        if particiones.es_particionada():
+            with connection.cursor() as cursor:
+                particiones.crear_particion_mes(cursor, inicio)
+
+        pendientes = []
+        for fila in leer_archivo(inicio):
+            pendientes.append(_a_modelo(fila))
+            if len(pendientes) >= lote:
+                total += _insertar(pendientes)
+                pendientes = []
+        total += _insertar(pendientes)
+
+        for r in resumen:
+            BalanceObra.objects.filter(obra_id=r.obra_id).update(
+                total_sueldos_archivados=F('total_sueldos_archivados') - r.total_pagado
+            )
+        ArchivoAsistencia.objects.filter(periodo=inicio).delete()
+
+    for r in resumen:
+        agregados.invalidar_obra(r.obra_id)
+    os.remove(ruta_archivo(inicio))
+    return total
+
+
+def _insertar(objetos):
+    if not objetos:
+        return 0
+    # bulk_create pisa los campos auto_now/auto_now_add: se restauran después
+    originales = [(o.hora_entrada, o.fecha_modificacion) for o in objetos]
+    Asistencia.objects.bulk_create(objetos)
+    for o, (hora_entrada, modificacion) in zip(objetos, originales):
+        o.hora_entrada, o.fecha_modificacion = hora_entrada, modificacion
+    Asistencia.objects.bulk_update(objetos, ['hora_entrada', 'fecha_modificacion'])
+    return len(objetos)
@@ -0,0 +1,97 @@
+"""
+Reconstrucción masiva de BalanceObra: los mismos números que
+BalanceObra.actualizar_balance(), pero para muchas obras a la vez con unas
+pocas queries GROUP BY obra_id y un bulk_update.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import agregados
+from .models import Asistencia, BalanceObra, Obra, ReporteImproductivo
+
+CAMPOS = [
+    'total_pagado_sueldos', 'total_perdido_improductivo', 'total_multas_proyectadas',
+    'presupuesto_restante', 'es_rentable',
+]
+
+
+def obras_con_movimiento(desde=None, hasta=None):
+    """Ids de obras con asistencias o reportes en el rango (todas si no hay rango)."""
+    if not desde and not hasta:
+        return list(Obra.objects.order_by('id').values_list('id', flat=True))
+    rango = Q()
+    if desde:
+        rango &= Q(fecha__gte=desde)
+    if hasta:
+        rango &= Q(fecha__lte=hasta)
+    ids = set(Asistencia.objects.filter(rango).values_list('obra', flat=True).distinct().order_by())
+    ids |= set(ReporteImproductivo.objects.filter(rango).values_list('obra', flat=True).distinct().order_by())
+    return sorted(ids)
+
+
+def _sumas(queryset, obra_ids, **agregados):
+    filas = queryset.filter(obra__in=obra_ids).values('obra').annotate(**agregados).order_by()
+    return {f['obra']: f for f in filas}
+
+
+def reconstruir(obra_ids, aplicar=True):
+    """
+    Recalcula los balances de `obra_ids`. Con aplicar=False no escribe nada.
+    Devuelve una lista con las obras cuyo balance cambió:
+    {'obra_id', 'obra', 'cambios': {campo: (guardado, calculado)}}.
+    """
+    obras = {o.id: o for o in Obra.objects.filter(id__in=obra_ids).only('id', 'nombre', 'presupuesto_total', 'valor_multa_dia')}
+    sueldos = _sumas(Asistencia.objects, obra_ids, total=Sum('monto_pago_dia'))
+    reportes = _sumas(
+        ReporteImproductivo.objects, obra_ids,
+        perdido=Sum('dinero_perdido'), dias_atraso=Sum('dias_retraso_obra'),
+    )
+
+    balances = list(BalanceObra.objects.filter(obra_id__in=obras))
+    con_balance = {b.obra_id for b in balances}
+    faltantes = [BalanceObra(obra_id=i) for i in obras if i not in con_balance]
+    if aplicar and faltantes:
+        faltantes = BalanceObra.objects.bulk_create(faltantes)
+    balances += faltantes
+
+    ahora = timezone.now()
+    diferencias, modificados = [], []
+    for balance in balances:
+        obra = obras[balance.obra_id]
+        reporte = reportes.get(obra.id, {})
+        # Misma regla que actualizar_balance()
+        pagos = (sueldos.get(obra.id, {}).get('total') or 0) + balance.total_sueldos_archivados
+        perdidas_op = reporte.get('perdido') or 0
+        monto_multas = (reporte.get('dias_atraso') or 0) * obra.valor_multa_dia
+        restante = obra.presupuesto_total - (pagos + perdidas_op + monto_multas)
+        calculado = {
+            'total_pagado_sueldos': Decimal(pagos).quantize(Decimal(1)),
+            'total_perdido_improductivo': Decimal(perdidas_op).quantize(Decimal(1)),
+            'total_multas_proyectadas': Decimal(monto_multas).quantize(Decimal(1)),
+            'presupuesto_restante': Decimal(restante).quantize(Decimal(1)),
+            'es_rentable': restante > (obra.presupuesto_total * Decimal(0.10)),
+        }
+
+        cambios = {
+            campo: (getattr(balance, campo), valor)
+            for campo, valor in calculado.items()
+            if getattr(balance, campo) != valor
+        }
+        if cambios or balance.pk is None:
+            diferencias.append({'obra_id': obra.id, 'obra': obra.nombre, 'cambios': cambios})
+        if cambios:
+            for campo, valor in calculado.items():
+                setattr(balance, campo, valor)
+            balance.fecha_actualizacion = ahora
+            modificados.append(balance)
+
+    if aplicar and modificados:
+        with transaction.atomic():
+            BalanceObra.objects.bulk_update(modificados, CAMPOS + ['fecha_actualizacion'], batch_size=500)
+        # bulk_update no dispara señales: se invalida el caché a mano
+        for balance in modificados:
+            agregados.invalidar_obra(balance.obra_id)
+    return diferencias
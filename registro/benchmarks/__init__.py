@@ -0,0 +1,116 @@
+"""
+Utilidades compartidas por los benchmarks del sistema.
+
+Cada benchmark corre sobre una base de datos SQLite temporal (nunca sobre la
+base real), mide latencias y queries, y guarda sus resultados en JSON para
+poder compararlos contra una línea base de una versión anterior.
+"""
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+from contextlib import contextmanager
+
+import django
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+# Métricas donde un valor MAYOR es una regresión (el resto: menor es peor)
+METRICAS_MENOR_ES_MEJOR = ('p50_ms', 'p95_ms', 'p99_ms', 'media_ms', 'queries_por_request', 'importacion_ms', 'rss_mb', 'bytes_respuesta', 'e2e_ms', 'queries_por_llamada')
+METRICAS_MAYOR_ES_MEJOR = ('throughput_rps', 'filas_por_segundo')
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (p entre 0 y 100)."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    rango = max(1, math.ceil(p / 100 * len(ordenados)))
+    return ordenados[rango - 1]
+
+
+def resumen_latencias(latencias_ms):
+    return {
+        'n': len(latencias_ms),
+        'media_ms': round(statistics.fmean(latencias_ms), 3) if latencias_ms else 0.0,
+        'p50_ms': round(percentil(latencias_ms, 50), 3),
+        'p95_ms': round(percentil(latencias_ms, 95), 3),
+        'p99_ms': round(percentil(latencias_ms, 99), 3),
+        'max_ms': round(max(latencias_ms), 3) if latencias_ms else 0.0,
+    }
+
+
+@contextmanager
+def base_de_datos_aislada():
+    """
+    Crea una base SQLite temporal con todas las migraciones aplicadas y un
+    MEDIA_ROOT desechable. Al salir se borra todo.
+    """
+    directorio = tempfile.mkdtemp(prefix='bench_registro_')
+    settings_db = connection.settings_dict
+    respaldo = {
+        'ENGINE': settings_db['ENGINE'],
+        'NAME': settings_db['NAME'],
+        'OPTIONS': dict(settings_db.get('OPTIONS', {})),
+        'TEST': dict(settings_db.get('TEST', {})),
+    }
+
+    connection.close()
+    settings_db['ENGINE'] = 'django.db.backends.sqlite3'
+    # Los hilos concurrentes esperan el lock de escritura en vez de fallar
+    settings_db['OPTIONS'] = {'timeout': 30, 'transaction_mode': 'IMMEDIATE'}
+    settings_db['TEST'] = dict(respaldo['TEST'], NAME=os.path.join(directorio, 'bench.sqlite3'))
+
+    nombre_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(MEDIA_ROOT=os.path.join(directorio, 'media')):
+            yield directorio
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+        settings_db.update(respaldo)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def metadatos():
+    return {
+        'fecha': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'plataforma': platform.platform(),
+    }
+
+
+def guardar_resultados(ruta, resultados):
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+
+def cargar_resultados(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def comparar_con_linea_base(actual, base, tolerancia=0.20):
+    """
+    Compara escenario por escenario contra la línea base y devuelve una lista
+    de textos describiendo cada métrica que empeoró más que la tolerancia.
+    """
+    regresiones = []
+    for escenario, metricas in actual.get('escenarios', {}).items():
+        previas = base.get('escenarios', {}).get(escenario)
+        if not previas:
+            continue
+        for nombre, valor in metricas.items():
+            anterior = previas.get(nombre)
+            if not isinstance(anterior, (int, float)) or not anterior:
+                continue
+            if nombre in METRICAS_MENOR_ES_MEJOR and valor > anterior * (1 + tolerancia):
+                regresiones.append(f"{escenario}.{nombre}: {anterior} -> {valor}")
+            elif nombre in METRICAS_MAYOR_ES_MEJOR and valor < anterior * (1 - tolerancia):
+                regresiones.append(f"{escenario}.{nombre}: {anterior} -> {valor}")
+    return regresiones
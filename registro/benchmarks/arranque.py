@@ -0,0 +1,98 @@
+"""
+Benchmark de arranque de un worker: cuánto tarda y cuánta memoria ocupa un
+proceso nuevo hasta tener la aplicación WSGI y las URLs cargadas (lo que paga
+cada worker de gunicorn y cada `manage.py`).
+
+Cada medición es un proceso aparte con `python -X importtime`, así que no
+influye lo que ya esté importado en el proceso que corre el benchmark.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+
+# Dependencias pesadas que no deberían cargarse al arrancar (se importan al usarlas)
+MODULOS_PESADOS = ('reportlab', 'supabase', 'pymongo', 'httpx', 'PIL')
+
+_HIJO = """
+import json, os, sys, time
+inicio = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+duracion_ms = (time.perf_counter() - inicio) * 1000
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+except ImportError:
+    rss_mb = None
+print(json.dumps({
+    'duracion_ms': duracion_ms,
+    'rss_mb': rss_mb,
+    'pesados': [m for m in %r if m in sys.modules],
+}))
+""" % (MODULOS_PESADOS,)
+
+
+def _leer_importtime(texto):
+    """Suma el tiempo propio de cada import y devuelve (total_ms, [(módulo, acumulado_ms)])."""
+    total_us, acumulados = 0, []
+    for linea in texto.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, acumulado, modulo = linea[len('import time:'):].split('|')
+        total_us += int(propio)
+        acumulados.append((modulo.strip(), int(acumulado) / 1000))
+    return total_us / 1000, acumulados
+
+
+def medir_una_vez():
+    entorno = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'proyecto.settings'))
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _HIJO],
+        cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True, check=True,
+    )
+    medicion = json.loads(proceso.stdout.strip().splitlines()[-1])
+    medicion['importacion_ms'], medicion['imports'] = _leer_importtime(proceso.stderr)
+    return medicion
+
+
+def ejecutar(repeticiones=3, top=15):
+    """Arranca `repeticiones` procesos y resume con la mediana (el primero suele pagar el caché de disco)."""
+    mediciones = [medir_una_vez() for _ in range(repeticiones)]
+    rss = [m['rss_mb'] for m in mediciones if m['rss_mb'] is not None]
+    # Los imports más caros (acumulado, incluye sus dependencias) de la última corrida
+    mas_caros = sorted(mediciones[-1]['imports'], key=lambda i: i[1], reverse=True)[:top]
+    return {
+        'parametros': {'repeticiones': repeticiones},
+        'escenarios': {
+            'arranque': {
+                'n': repeticiones,
+                'media_ms': round(statistics.median(m['duracion_ms'] for m in mediciones), 3),
+                'importacion_ms': round(statistics.median(m['importacion_ms'] for m in mediciones), 3),
+                'rss_mb': round(statistics.median(rss), 1) if rss else None,
+            },
+        },
+        'pesados_cargados': sorted({p for m in mediciones for p in m['pesados']}),
+        'imports_mas_caros': [{'modulo': modulo, 'acumulado_ms': round(ms, 3)} for modulo, ms in mas_caros],
+    }
+
+
+def fuera_de_presupuesto(resultados):
+    """Textos con cada límite de ARRANQUE_PRESUPUESTO_* superado (vacío si está todo bien)."""
+    arranque = resultados['escenarios']['arranque']
+    limite_ms = getattr(settings, 'ARRANQUE_PRESUPUESTO_MS', 2000)
+    limite_rss = getattr(settings, 'ARRANQUE_PRESUPUESTO_RSS_MB', 150)
+    problemas = []
+    if arranque['importacion_ms'] > limite_ms:
+        problemas.append(f"importación: {arranque['importacion_ms']} ms (presupuesto {limite_ms} ms)")
+    if arranque['rss_mb'] is not None and arranque['rss_mb'] > limite_rss:
+        problemas.append(f"memoria: {arranque['rss_mb']} MB (presupuesto {limite_rss} MB)")
+    for modulo in resultados['pesados_cargados']:
+        problemas.append(f"'{modulo}' se importa al arrancar (debería importarse al usarlo)")
+    return problemas
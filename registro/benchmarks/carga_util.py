@@ -0,0 +1,90 @@
+"""
+Benchmark de bytes en el cable para la APK: lista_obras y marcar_asistencia_api
+en formato normal y compacto, sin comprimir, con gzip y (si está instalado)
+con brotli. El tiempo de punta a punta es el del servidor más lo que tardaría
+la respuesta en una conexión 3G simulada (latencia + bytes / ancho de banda).
+"""
+import random
+import statistics
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+from django.urls import reverse
+
+from ..middleware import brotli
+from . import resumen_latencias
+from .checkin import _coordenadas_cerca, foto_jpeg, sembrar
+
+
+def _bytes_en_cable(respuesta):
+    cabeceras = sum(len(f"{k}: {v}\r\n") for k, v in respuesta.items())
+    return len(respuesta.content) + cabeceras
+
+
+def _medir(hacer_request, repeticiones, ancho_kbps, latencia_ms):
+    servidor, tamanos, codificaciones = [], [], set()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = hacer_request()
+        servidor.append((time.perf_counter() - inicio) * 1000)
+        tamanos.append(_bytes_en_cable(respuesta))
+        codificaciones.add(respuesta.get('Content-Encoding', 'identity'))
+    bytes_respuesta = round(statistics.median(tamanos))
+    transferencia_ms = bytes_respuesta * 8 / ancho_kbps
+    resultado = resumen_latencias(servidor)
+    resultado.update({
+        'bytes_respuesta': bytes_respuesta,
+        'codificacion': ",".join(sorted(codificaciones)),
+        'e2e_ms': round(resultado['p50_ms'] + latencia_ms + transferencia_ms, 3),
+    })
+    return resultado
+
+
+def _marcar_entrada(usuario, obra, foto, formato):
+    cliente = Client()
+    cliente.force_login(usuario)
+    lat, lon = _coordenadas_cerca(obra)
+    datos = {
+        'obra_id': obra.id, 'latitud': lat, 'longitud': lon,
+        'foto': SimpleUploadedFile('selfie.jpg', foto, content_type='image/jpeg'),
+    }
+    sufijo = '?formato=compacto' if formato == 'compacto' else ''
+    return cliente.post(reverse('api_marcar') + sufijo, datos, HTTP_ACCEPT_ENCODING='gzip')
+
+
+def ejecutar(n_obras=200, repeticiones=20, ancho_kbps=384, latencia_ms=300, semilla=42):
+    """Siembra obras y trabajadores y mide cada combinación de formato y compresión."""
+    random.seed(semilla)
+    obras, trabajadores = sembrar(n_obras, 2 * repeticiones)
+    foto = foto_jpeg()
+
+    codificaciones = {'identidad': '', 'gzip': 'gzip, deflate'}
+    if brotli:
+        codificaciones['br'] = 'br, gzip'
+
+    escenarios = {}
+    cliente = Client()
+    cliente.force_login(trabajadores[0][0])
+    for vuelta, formato in enumerate(('normal', 'compacto')):
+        parametros = {'formato': formato} if formato == 'compacto' else {}
+        for nombre, aceptadas in codificaciones.items():
+            escenarios[f"lista_obras_{formato}_{nombre}"] = _medir(
+                lambda: cliente.get(reverse('api_obras'), parametros, HTTP_ACCEPT_ENCODING=aceptadas),
+                repeticiones, ancho_kbps, latencia_ms,
+            )
+
+        # Una entrada por trabajador; cada formato usa su propia mitad de la cuadrilla
+        grupo = iter(trabajadores[vuelta * repeticiones:(vuelta + 1) * repeticiones])
+        escenarios[f"marcar_{formato}"] = _medir(
+            lambda: _marcar_entrada(next(grupo)[0], random.choice(obras), foto, formato),
+            repeticiones, ancho_kbps, latencia_ms,
+        )
+
+    return {
+        'parametros': {
+            'obras': n_obras, 'repeticiones': repeticiones,
+            'ancho_kbps': ancho_kbps, 'latencia_ms': latencia_ms, 'brotli': bool(brotli),
+        },
+        'escenarios': escenarios,
+    }
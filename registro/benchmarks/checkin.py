@@ -0,0 +1,173 @@
+"""
+Benchmark de carga del inicio de turno: muchos trabajadores marcando entrada
+y salida (con foto) al mismo tiempo, tanto por la API de la APK como por el
+panel web del trabajador.
+"""
+import io
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import BalanceObra, Obra, Perfil
+from . import resumen_latencias
+
+# Centro de referencia para las obras sintéticas (Antofagasta)
+LAT_BASE = -23.6509
+LON_BASE = -70.3975
+
+
+def foto_jpeg(lado=320):
+    """Genera una selfie falsa en memoria, del tamaño de una foto comprimida de celular."""
+    imagen = Image.new('RGB', (lado, lado), (random.randint(0, 255), 120, 80))
+    buffer = io.BytesIO()
+    imagen.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def sembrar(n_obras, n_trabajadores):
+    """Crea obras y trabajadores (con celular vinculado) usando bulk_create."""
+    hoy = date.today()
+    obras = Obra.objects.bulk_create([
+        Obra(
+            nombre=f"Obra Bench {i}",
+            direccion=f"Calle Falsa {i}",
+            latitud=Decimal(LAT_BASE + i * 0.01).quantize(Decimal('0.0000001')),
+            longitud=Decimal(LON_BASE + i * 0.01).quantize(Decimal('0.0000001')),
+            radio_permitido=100,
+            presupuesto_total=500_000_000,
+            fecha_inicio=hoy - timedelta(days=30),
+            fecha_termino_estimada=hoy + timedelta(days=180),
+        )
+        for i in range(n_obras)
+    ])
+    # En producción cada obra ya tiene su balance; si no, el get_or_create de
+    # Asistencia.save() compite entre hilos en la primera marca de cada obra
+    BalanceObra.objects.bulk_create([BalanceObra(obra=o) for o in obras])
+
+    # Un solo hash para todos: el benchmark no mide el costo de PBKDF2 al sembrar
+    clave = make_password(None)
+    usuarios = User.objects.bulk_create([
+        User(username=f"bench_{i}", first_name="Trabajador", last_name=str(i), password=clave)
+        for i in range(n_trabajadores)
+    ])
+    perfiles = Perfil.objects.bulk_create([
+        Perfil(
+            usuario=u, rut=f"{10_000_000 + i}-K", rol='TRABAJADOR',
+            sueldo_diario=45000, valor_hora=5600, dispositivo_id=str(uuid.uuid4()),
+        )
+        for i, u in enumerate(usuarios)
+    ])
+    return obras, list(zip(usuarios, perfiles))
+
+
+def _coordenadas_cerca(obra):
+    # Jitter de unos pocos metros, dentro del radio permitido
+    return (
+        f"{float(obra.latitud) + random.uniform(-0.0003, 0.0003):.7f}",
+        f"{float(obra.longitud) + random.uniform(-0.0003, 0.0003):.7f}",
+    )
+
+
+def _preparar_cliente(usuario, perfil, via):
+    cliente = Client()
+    cliente.force_login(usuario)
+    if via == 'panel':
+        cliente.cookies['dispositivo_seguro'] = perfil.dispositivo_id
+    return cliente
+
+
+def _marcar(cliente, via, obra, foto, accion):
+    lat, lon = _coordenadas_cerca(obra)
+    archivo = SimpleUploadedFile(f"{uuid.uuid4().hex}.jpg", foto, content_type='image/jpeg')
+    if via == 'api':
+        datos = {'obra_id': obra.id, 'latitud': lat, 'longitud': lon, 'foto': archivo}
+        return cliente.post(reverse('api_marcar'), datos)
+    datos = {'obra_id': obra.id, 'latitud': lat, 'longitud': lon, 'foto': archivo, accion: '1'}
+    return cliente.post(reverse('panel_trabajador'), datos)
+
+
+def _ejecutar_rafaga(tareas, concurrencia):
+    """
+    Ejecuta las tareas (funciones sin argumentos que hacen UNA request) en un
+    pool de hilos. Cada hilo usa su propia conexión, así que las queries se
+    cuentan por request sin mezclarse.
+    """
+    def medir(tarea):
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                inicio = time.perf_counter()
+                try:
+                    ok = tarea().status_code < 400
+                except Exception:
+                    ok = False
+                duracion = (time.perf_counter() - inicio) * 1000
+            return duracion, len(ctx.captured_queries), ok
+        finally:
+            connection.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        mediciones = list(pool.map(medir, tareas))
+    total = time.perf_counter() - inicio
+
+    latencias = [m[0] for m in mediciones]
+    queries = [m[1] for m in mediciones]
+    resultado = resumen_latencias(latencias)
+    resultado.update({
+        'throughput_rps': round(len(mediciones) / total, 2) if total else 0.0,
+        'queries_por_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'queries_max': max(queries) if queries else 0,
+        'errores': sum(1 for m in mediciones if not m[2]),
+    })
+    return resultado
+
+
+# La salida llega segundos después de la entrada: sin esto la trataría como doble toque
+@override_settings(TURNO_DOBLE_TOQUE_SEGUNDOS=0)
+def ejecutar(n_obras=5, n_trabajadores=100, concurrencia=8, semilla=42):
+    """Siembra datos y corre la ráfaga de entradas y salidas por API y por panel."""
+    random.seed(semilla)
+    obras, trabajadores = sembrar(n_obras, n_trabajadores)
+    foto = foto_jpeg()
+
+    # Mitad de la cuadrilla usa la APK, la otra mitad el panel web
+    mitad = len(trabajadores) // 2
+    grupos = {'api': trabajadores[:mitad], 'panel': trabajadores[mitad:]}
+    escenarios = {}
+
+    for via, grupo in grupos.items():
+        asignaciones = [
+            (_preparar_cliente(u, p, via), obras[i % len(obras)])
+            for i, (u, p) in enumerate(grupo)
+        ]
+        for accion in ('marcar_entrada', 'marcar_salida'):
+            tareas = [
+                (lambda c=c, o=o, v=via, a=accion: _marcar(c, v, o, foto, a))
+                for c, o in asignaciones
+            ]
+            escenarios[f"{via}_{accion.split('_')[1]}"] = _ejecutar_rafaga(tareas, concurrencia)
+
+        # Carga del panel ya con el turno cerrado (la vista más visitada)
+        if via == 'panel':
+            tareas = [(lambda c=c: c.get(reverse('panel_trabajador'))) for c, _ in asignaciones]
+            escenarios['panel_get'] = _ejecutar_rafaga(tareas, concurrencia)
+
+    return {
+        'parametros': {
+            'obras': n_obras, 'trabajadores': n_trabajadores,
+            'concurrencia': concurrencia, 'bytes_foto': len(foto),
+        },
+        'escenarios': escenarios,
+    }
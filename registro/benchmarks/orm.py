@@ -0,0 +1,83 @@
+"""
+Micro-benchmark del ORM según el tamaño del historial: cuánto tardan y
+cuántas queries hacen Asistencia.save(), BalanceObra.actualizar_balance(),
+ReporteImproductivo.calcular_impacto(), el dashboard del jefe y el
+pronóstico de todas las obras con 10k, 100k o 1M de asistencias (datos de
+sinteticos.py).
+"""
+import random
+import time
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .. import pronostico
+from ..models import Asistencia, BalanceObra, Obra, Perfil, ReporteImproductivo
+from . import resumen_latencias, sinteticos
+from .checkin import _coordenadas_cerca
+
+ESCALAS = (10_000, 100_000, 1_000_000)
+
+
+def _medir(funcion, repeticiones):
+    """Llama `funcion(i)` `repeticiones` veces; latencias y queries de cada llamada."""
+    latencias, queries = [], []
+    for i in range(repeticiones):
+        with CaptureQueriesContext(connection) as ctx:
+            inicio = time.perf_counter()
+            funcion(i)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        queries.append(len(ctx.captured_queries))
+    resultado = resumen_latencias(latencias)
+    resultado.update({
+        'queries_por_llamada': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    })
+    return resultado
+
+
+def ejecutar_escala(filas, repeticiones=20, anios=2, semilla=42):
+    """Genera `filas` asistencias y mide cada función caliente sobre ese historial."""
+    random.seed(semilla)
+    generacion = sinteticos.generar(filas, anios=anios)
+
+    obras = list(Obra.objects.select_related('jefe_obra__usuario'))
+    trabajadores = list(Perfil.objects.filter(rol='TRABAJADOR').order_by('?')[:repeticiones])
+    balances = list(BalanceObra.objects.select_related('obra'))
+    reportes = list(ReporteImproductivo.objects.order_by('?')[:repeticiones])
+    hoy = date.today()
+
+    def guardar_asistencia(i):
+        # Un trabajador distinto por llamada: es su primera marca del día
+        obra = random.choice(obras)
+        lat, lon = _coordenadas_cerca(obra)
+        Asistencia(trabajador=trabajadores[i % len(trabajadores)], obra=obra, fecha=hoy,
+                   latitud_entrada=lat, longitud_entrada=lon, ip_registro='10.0.0.1').save()
+
+    # El login queda fuera de la medición
+    clientes = []
+    for obra in obras[:repeticiones]:
+        cliente = Client()
+        cliente.force_login(obra.jefe_obra.usuario)
+        clientes.append((cliente, obra))
+
+    def dashboard(i):
+        # Sin caché de agregados: se mide el peor caso (recién invalidado)
+        cache.clear()
+        cliente, obra = clientes[i % len(clientes)]
+        cliente.get(reverse('dashboard_jefe'), {'obra_id': obra.id})
+
+    escenarios = {
+        f'asistencia_save_{filas}': _medir(guardar_asistencia, repeticiones),
+        f'actualizar_balance_{filas}': _medir(lambda i: random.choice(balances).actualizar_balance(), repeticiones),
+        f'calcular_impacto_{filas}': _medir(lambda i: reportes[i % len(reportes)].calcular_impacto(), repeticiones),
+        f'dashboard_jefe_{filas}': _medir(dashboard, repeticiones),
+        # Todas las obras sin caché: lo que paga el admin de balances tras una marca en cada obra
+        f'pronostico_todas_{filas}': _medir(lambda i: cache.clear() or pronostico.para_balances(balances), max(3, repeticiones // 4)),
+        f'generacion_{filas}': {'filas_por_segundo': generacion['filas_por_segundo'], 'segundos': generacion['segundos']},
+    }
+    return generacion, escenarios
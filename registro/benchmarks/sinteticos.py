@@ -0,0 +1,205 @@
+"""
+Generador de datos sintéticos para dimensionar el servidor: obras con
+coordenadas, jefes, trabajadores, años de asistencia con jitter de GPS e
+incidentes con trabajadores afectados.
+
+Todo entra con bulk_create por lotes (nunca hay más de `lote` asistencias
+en memoria), con los montos y validaciones que habría calculado
+Asistencia.save(), así que 1M de filas tarda minutos y no horas.
+"""
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Asistencia, BalanceObra, Obra, Perfil, ReporteImproductivo
+from .checkin import LAT_BASE, LON_BASE
+
+TRABAJADORES_POR_OBRA = 25
+ASISTENCIA_DIARIA = 0.92     # fracción de la cuadrilla que va cada día
+FUERA_DE_GEOCERCA = 0.03     # marcas con el GPS lejos de la obra
+SIN_SALIDA = 0.01            # turnos olvidados (los cerró el comando)
+INCIDENTES_POR_MES = 2       # por obra
+
+
+@contextmanager
+def _sin_auto_now(modelo, *campos):
+    """
+    bulk_create pisa auto_now/auto_now_add con la hora actual. archivo.py lo
+    corrige con un bulk_update posterior; con millones de filas eso duplica el
+    tiempo, así que acá se apagan mientras se inserta.
+    """
+    fields = [modelo._meta.get_field(c) for c in campos]
+    originales = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, originales):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def dias_habiles(anios, hasta=None):
+    """Lunes a sábado de los últimos `anios` años, hasta ayer."""
+    hasta = hasta or date.today() - timedelta(days=1)
+    dia = hasta - timedelta(days=round(365.25 * anios))
+    dias = []
+    while dia <= hasta:
+        if dia.weekday() < 6:
+            dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+def _crear_personas(prefijo, n_obras, n_trabajadores):
+    # Un solo hash para todos: generar no debe pagar PBKDF2 por usuario
+    clave = make_password(None)
+    inicio_rut = 30_000_000 + Perfil.objects.count()
+    usuarios = User.objects.bulk_create(
+        [User(username=f"{prefijo}_jefe_{i}", first_name="Jefe", last_name=str(i), password=clave) for i in range(n_obras)]
+        + [User(username=f"{prefijo}_{i}", first_name="Trabajador", last_name=str(i), password=clave) for i in range(n_trabajadores)]
+    )
+    perfiles = Perfil.objects.bulk_create([
+        Perfil(
+            usuario=u, rut=f"{inicio_rut + i}-{i % 10}",
+            rol='JEFE' if i < n_obras else 'TRABAJADOR',
+            sueldo_diario=random.choice((40000, 45000, 50000, 60000)),
+            valor_hora=random.choice((5000, 5600, 6200, 7500)),
+        )
+        for i, u in enumerate(usuarios)
+    ])
+    return perfiles[:n_obras], perfiles[n_obras:]
+
+
+def _crear_obras(prefijo, jefes, dias):
+    obras = Obra.objects.bulk_create([
+        Obra(
+            nombre=f"Obra {prefijo} {i}", direccion=f"Av. Sintética {i}",
+            latitud=Decimal(LAT_BASE + (i % 40) * 0.02).quantize(Decimal('0.0000001')),
+            longitud=Decimal(LON_BASE + (i // 40) * 0.02).quantize(Decimal('0.0000001')),
+            radio_permitido=100, presupuesto_total=random.randint(200, 2000) * 1_000_000,
+            valor_multa_dia=random.choice((250_000, 500_000, 1_000_000)),
+            fecha_inicio=dias[0], fecha_termino_estimada=dias[-1] + timedelta(days=180),
+            jefe_obra=jefe,
+        )
+        for i, jefe in enumerate(jefes)
+    ])
+    BalanceObra.objects.bulk_create([BalanceObra(obra=o) for o in obras])
+    return obras
+
+
+def _asistencia(trabajador, obra, dia, red):
+    entrada = datetime.combine(dia, datetime.min.time()) + timedelta(hours=7.5, minutes=random.gauss(0, 10))
+    if random.random() < FUERA_DE_GEOCERCA:
+        desvio = 0.01       # ~1 km: queda fuera del radio
+    else:
+        desvio = 0.0004     # unos 40 m
+    latitud = float(obra.latitud) + random.uniform(-desvio, desvio)
+    longitud = float(obra.longitud) + random.uniform(-desvio, desvio)
+    ip = f"{red}.{random.randint(2, 254)}" if random.random() > 0.05 else \
+        f"{random.randint(11, 223)}.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+    asistencia = Asistencia(
+        trabajador=trabajador, obra=obra, fecha=dia, hora_entrada=entrada.time().replace(microsecond=0),
+        latitud_entrada=Decimal(f"{latitud:.7f}"), longitud_entrada=Decimal(f"{longitud:.7f}"),
+        entrada_valida=obra.contiene(latitud, longitud),
+        ip_registro=ip, red_registro=Asistencia.red_de_ip(ip),
+        fecha_modificacion=timezone.make_aware(entrada),
+    )
+    if random.random() < SIN_SALIDA:
+        asistencia.salida_automatica = True
+        return asistencia
+
+    salida = entrada + timedelta(hours=random.choice((4, 8, 9, 9, 10, 10)), minutes=random.gauss(0, 30))
+    salida = min(salida, datetime.combine(dia, datetime.max.time()))
+    asistencia.hora_salida = salida.time().replace(microsecond=0)
+    asistencia.latitud_salida, asistencia.longitud_salida = asistencia.latitud_entrada, asistencia.longitud_entrada
+    # Misma regla de pago que Asistencia.save()
+    horas = Decimal((salida - entrada).total_seconds() / 3600).quantize(Decimal('0.01'))
+    asistencia.horas_trabajadas = horas
+    asistencia.monto_pago_dia = trabajador.sueldo_diario if horas >= 8 else (trabajador.valor_hora * horas).quantize(Decimal(1))
+    asistencia.fecha_modificacion = timezone.make_aware(salida)
+    return asistencia
+
+
+def _crear_incidentes(obras, cuadrillas, dias):
+    reportes, afectados = [], []
+    meses = sorted({d.replace(day=1) for d in dias})
+    for obra, cuadrilla in zip(obras, cuadrillas):
+        for mes in meses:
+            dias_mes = [d for d in dias if d.replace(day=1) == mes]
+            for _ in range(INCIDENTES_POR_MES):
+                inicio = random.randint(8, 14)
+                duracion = random.randint(1, 4)
+                grupo = random.sample(cuadrilla, min(len(cuadrilla), random.randint(3, 8)))
+                reportes.append(ReporteImproductivo(
+                    obra=obra, jefe_obra=obra.jefe_obra, fecha=random.choice(dias_mes),
+                    hora_inicio=datetime.min.time().replace(hour=inicio), hora_fin=datetime.min.time().replace(hour=inicio + duracion),
+                    motivo=random.choice(("Lluvia", "Falta de materiales", "Corte de luz", "Accidente menor", "Grúa en mantención")),
+                    dias_retraso_obra=random.choice((0, 0, 0, Decimal('0.5'), 1)),
+                    horas_perdidas_totales=duracion * len(grupo),
+                    dinero_perdido=sum(p.valor_hora for p in grupo) * duracion,
+                ))
+                afectados.append(grupo)
+    reportes = ReporteImproductivo.objects.bulk_create(reportes)
+    intermedia = ReporteImproductivo.trabajadores_afectados.through
+    intermedia.objects.bulk_create([
+        intermedia(reporteimproductivo_id=r.pk, perfil_id=p.pk)
+        for r, grupo in zip(reportes, afectados) for p in grupo
+    ], batch_size=5000)
+    return len(reportes)
+
+
+def generar(filas, anios=2, prefijo='sint', lote=5000, semilla=None):
+    """
+    Crea ~`filas` asistencias repartidas en los días hábiles de `anios` años,
+    con las obras y trabajadores necesarios para eso. Devuelve un resumen.
+    """
+    if semilla is not None:
+        random.seed(semilla)
+    inicio = time.perf_counter()
+    dias = dias_habiles(anios)
+    n_trabajadores = max(1, math.ceil(filas / (len(dias) * ASISTENCIA_DIARIA * 0.99)))
+    n_obras = max(1, math.ceil(n_trabajadores / TRABAJADORES_POR_OBRA))
+
+    with transaction.atomic():
+        jefes, trabajadores = _crear_personas(prefijo, n_obras, n_trabajadores)
+        obras = _crear_obras(prefijo, jefes, dias)
+    cuadrillas = [trabajadores[i::n_obras] for i in range(n_obras)]
+    redes = [f"10.{(i // 250) % 250}.{i % 250}" for i in range(n_obras)]
+
+    creadas = 0
+    pendientes = []
+    with _sin_auto_now(Asistencia, 'hora_entrada', 'fecha_modificacion'):
+        for dia in dias:
+            for obra, cuadrilla, red in zip(obras, cuadrillas, redes):
+                for trabajador in cuadrilla:
+                    if creadas + len(pendientes) >= filas:
+                        break
+                    if random.random() < ASISTENCIA_DIARIA:
+                        pendientes.append(_asistencia(trabajador, obra, dia, red))
+                if len(pendientes) >= lote:
+                    Asistencia.objects.bulk_create(pendientes)
+                    creadas += len(pendientes)
+                    pendientes = []
+        Asistencia.objects.bulk_create(pendientes)
+        creadas += len(pendientes)
+
+    incidentes = _crear_incidentes(obras, cuadrillas, dias)
+    for balance in BalanceObra.objects.filter(obra__in=obras).select_related('obra'):
+        balance.actualizar_balance()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        'obras': n_obras, 'trabajadores': n_trabajadores, 'asistencias': creadas,
+        'incidentes': incidentes, 'dias': len(dias), 'segundos': round(segundos, 2),
+        'filas_por_segundo': round(creadas / segundos, 1) if segundos else 0.0,
+    }
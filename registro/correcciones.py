@@ -0,0 +1,91 @@
+"""
+Corrección en bloque de asistencias (acción del admin y /v1/api/asistencias/corregir/).
+
+Corregir la hora de salida de una cuadrilla entera una por una pasaba por
+Asistencia.save() en cada fila: viaje imposible, geocerca y
+actualizar_balance() de la obra, cientos de queries por semana corregida.
+Acá se aplican los cambios en memoria con la misma regla de pago de
+Asistencia.save(), se escriben con un bulk_update y cada balance afectado
+(obra anterior y nueva) se reconstruye una sola vez con registro/balances.py.
+El viaje imposible no se vuelve a revisar (solo aplica a marcas nuevas) y un
+cambio de obra nunca vuelve a validar una entrada inválida.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import agregados, balances
+from .models import Asistencia
+
+CAMPOS = [
+    'hora_entrada', 'hora_salida', 'obra', 'entrada_valida',
+    'horas_trabajadas', 'monto_pago_dia', 'modificado_por', 'fecha_modificacion',
+]
+
+
+class CorreccionInvalida(Exception):
+    pass
+
+
+def pago(trabajador, fecha, entrada, salida):
+    """(horas, monto) de un turno cerrado, con la regla de Asistencia.save()."""
+    horas = Decimal((datetime.combine(fecha, salida) - datetime.combine(fecha, entrada)).total_seconds() / 3600)
+    horas = horas.quantize(Decimal('0.01'))
+    if horas >= 8:
+        return horas, trabajador.sueldo_diario
+    return horas, (trabajador.valor_hora * horas).quantize(Decimal(1))
+
+
+def corregir(asistencias, usuario, hora_entrada=None, hora_salida=None, obra=None):
+    """
+    Aplica a todas las `asistencias` (queryset) la hora de entrada, la de
+    salida y/o la obra indicadas. Devuelve {'asistencias': n, 'obras': n}.
+    Si alguna fila quedaría con la salida antes de la entrada no se toca nada.
+    """
+    if hora_entrada is None and hora_salida is None and obra is None:
+        raise CorreccionInvalida("Indica al menos una hora o una obra")
+
+    # Todo lo que escribe bulk_update tiene que venir cargado (si no, una query por fila).
+    # select_related(None): el queryset del admin trae su list_select_related
+    filas = list(asistencias.select_related(None).select_related('trabajador').only(
+        *CAMPOS, 'fecha', 'latitud_entrada', 'longitud_entrada', 'trabajador__sueldo_diario', 'trabajador__valor_hora',
+    ))
+    invalidas = [
+        a.pk for a in filas
+        if (hora_salida or a.hora_salida) and (hora_salida or a.hora_salida) <= (hora_entrada or a.hora_entrada)
+    ]
+    if invalidas:
+        raise CorreccionInvalida(
+            f"La salida quedaría antes de la entrada en {len(invalidas)} asistencia(s): "
+            f"{', '.join(map(str, invalidas[:10]))}"
+        )
+
+    ahora = timezone.now()
+    obras = {a.obra_id for a in filas}
+    for a in filas:
+        if hora_entrada is not None:
+            a.hora_entrada = hora_entrada
+        if hora_salida is not None:
+            a.hora_salida = hora_salida
+        if obra is not None and obra.pk != a.obra_id:
+            a.obra = obra
+            # Solo invalida (como revalidar_geocercas): una entrada inválida puede serlo por
+            # viaje imposible, y ese motivo no queda guardado aparte
+            a.entrada_valida = a.entrada_valida and obra.contiene(a.latitud_entrada, a.longitud_entrada)
+        if a.hora_salida:
+            a.horas_trabajadas, a.monto_pago_dia = pago(a.trabajador, a.fecha, a.hora_entrada, a.hora_salida)
+        # bulk_update no pasa por auto_now. Por id: con Bearer el usuario es un tokens.UsuarioToken
+        a.modificado_por_id = usuario.pk
+        a.fecha_modificacion = ahora
+    if obra is not None and filas:
+        obras.add(obra.pk)
+
+    with transaction.atomic():
+        Asistencia.objects.bulk_update(filas, CAMPOS, batch_size=500)
+        balances.reconstruir(sorted(obras))
+    # reconstruir() solo invalida los balances que cambiaron; las horas pueden cambiar igual
+    for obra_id in obras:
+        agregados.invalidar_obra(obra_id)
+    return {'asistencias': len(filas), 'obras': len(obras)}
@@ -20,4 +20,12 @@ def solo_jefes(view_func):
             if request.user.perfil.rol in ['JEFE', 'ADMIN']:
                 return view_func(request, *args, **kwargs)
         return redirect('home')
-    return wrapper_func
\ No newline at end of file
+    return wrapper_func
+
+def presupuesto_queries(maximo):
+    # Declara cuántas queries puede hacer la vista. Debe ir ARRIBA de todos los
+    # demás decoradores para que el atributo quede en la función que ve Django.
+    def decorador(view_func):
+        view_func.presupuesto_queries = maximo
+        return view_func
+    return decorador
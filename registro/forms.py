@@ -1,5 +1,18 @@
 from django import forms
-from .models import ReporteImproductivo, Perfil
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.choices import BaseChoiceIterator
+from .models import Obra, ReporteImproductivo, Perfil
+
+class _OpcionesPerezosas(BaseChoiceIterator):
+    # La query corre solo si el widget se dibuja (un POST válido no la necesita)
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def __iter__(self):
+        for perfil in self.queryset:
+            yield perfil.pk, str(perfil)
+
 
 class ReporteIncidenteForm(forms.ModelForm):
     class Meta:
@@ -22,7 +35,38 @@ class ReporteIncidenteForm(forms.ModelForm):
             'trabajadores_afectados': 'Selecciona Trabajadores Detenidos (Ctrl + Click para varios)'
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, obra=None, fecha=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Filtramos para que solo aparezcan TRABAJADORES en la lista (no otros jefes)
-        self.fields['trabajadores_afectados'].queryset = Perfil.objects.filter(rol='TRABAJADOR')
\ No newline at end of file
+        campo = self.fields['trabajadores_afectados']
+        # Validación: cualquier TRABAJADOR (ModelMultipleChoiceField lo revisa con un solo pk__in)
+        campo.queryset = Perfil.objects.filter(rol='TRABAJADOR')
+
+        # Opciones que se dibujan: solo quienes marcaron asistencia en esa obra ese día,
+        # más los ya elegidos (p. ej. agregados con el buscador) si el form vuelve con errores.
+        # El resto se busca con api/trabajadores/.
+        if obra is not None:
+            fecha = fecha or timezone.localdate()
+            elegidos = [str(getattr(v, 'pk', v)) for v in self._valores_elegidos()]
+            visibles = campo.queryset.filter(
+                Q(asistencia__obra=obra, asistencia__fecha=fecha) | Q(pk__in=[v for v in elegidos if v.isdigit()])
+            ).select_related('usuario').distinct().order_by('usuario__first_name', 'usuario__last_name')
+            campo.widget.choices = _OpcionesPerezosas(visibles)
+
+    def _valores_elegidos(self):
+        nombre = self.add_prefix('trabajadores_afectados')
+        if self.is_bound:
+            return self.data.getlist(nombre) if hasattr(self.data, 'getlist') else self.data.get(nombre) or []
+        return self.initial.get('trabajadores_afectados') or []
+
+
+class CorreccionAsistenciaForm(forms.Form):
+    """Lo que se corrige en bloque (registro/correcciones.py); lo que quede vacío no se toca."""
+    hora_entrada = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time'}))
+    hora_salida = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time'}))
+    obra = forms.ModelChoiceField(queryset=Obra.objects.order_by('nombre'), required=False)
+
+    def clean(self):
+        datos = super().clean()
+        if not any(datos.get(c) for c in ('hora_entrada', 'hora_salida', 'obra')):
+            raise forms.ValidationError("Indica al menos una hora o una obra")
+        return datos
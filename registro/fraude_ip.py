@@ -0,0 +1,130 @@
+"""
+Detección de "granjas de clicks": una IP (o una subred /24) desde la que
+marcan muchos trabajadores distintos en pocos minutos.
+
+Es incremental: MarcaAnalisis guarda el último id de Asistencia revisado y cada
+corrida solo mira los días que tuvieron marcas nuevas. Por día hay dos pasadas:
+  1. GROUP BY (fecha, ip) con COUNT(DISTINCT trabajador) usando los índices
+     asistencia_fecha_ip_idx / asistencia_fecha_red_idx; solo pasan las IPs
+     con al menos `minimo` trabajadores en el día.
+  2. Para esas IPs se traen las marcas (por lotes de LOTE_CANDIDATOS) y se
+     busca, con una ventana deslizante sobre hora_entrada, el máximo de
+     trabajadores distintos en `ventana` minutos. Eso queda en SospechaIP (una fila por IP/red y día).
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from .models import Asistencia, MarcaAnalisis, SospechaIP
+
+MARCA = 'fraude_ip'
+CAMPOS = {'IP': 'ip_registro', 'RED': 'red_registro'}
+LOTE_DIAS = 31
+LOTE_CANDIDATOS = 300   # pares (día, IP) por query de la pasada 2 (límite de variables de SQLite)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def _maximo_en_ventana(marcas, ventana):
+    """
+    marcas: [(hora_entrada, trabajador_id)] ordenadas por hora.
+    Devuelve (trabajadores distintos, hora_desde, hora_hasta) de la mejor ventana.
+    """
+    mejor = (0, None, None)
+    dentro = Counter()
+    inicio = 0
+    for hora, trabajador in marcas:
+        dentro[trabajador] += 1
+        limite = datetime.combine(datetime.min, hora) - ventana
+        while datetime.combine(datetime.min, marcas[inicio][0]) < limite:
+            viejo = marcas[inicio][1]
+            dentro[viejo] -= 1
+            if not dentro[viejo]:
+                del dentro[viejo]
+            inicio += 1
+        if len(dentro) > mejor[0]:
+            mejor = (len(dentro), marcas[inicio][0], hora)
+    return mejor
+
+
+def analizar_dias(fechas, ventana_minutos=None, minimo_ip=None, minimo_red=None):
+    """Recalcula las sospechas de `fechas`. Devuelve la cantidad de sospechas guardadas."""
+    ventana = timedelta(minutes=ventana_minutos or _config('FRAUDE_IP_VENTANA_MINUTOS', 15))
+    minimos = {
+        'IP': minimo_ip or _config('FRAUDE_IP_MINIMO_TRABAJADORES', 5),
+        'RED': minimo_red or _config('FRAUDE_RED_MINIMO_TRABAJADORES', 10),
+    }
+    guardadas = 0
+    for tipo, campo in CAMPOS.items():
+        # Pasada 1: candidatos por día, agrupado en la base
+        candidatos = {
+            (f['fecha'], f[campo]): f['registros'] for f in
+            Asistencia.objects.filter(fecha__in=fechas, **{f'{campo}__isnull': False})
+            .values('fecha', campo)
+            .annotate(trabajadores=Count('trabajador', distinct=True), registros=Count('id'))
+            .filter(trabajadores__gte=minimos[tipo])
+            .order_by()
+        }
+        if not candidatos:
+            continue
+
+        # Pasada 2: ventana deslizante solo sobre las marcas de los candidatos, por
+        # lotes de pares (un OR por día con IN de direcciones: nada de un Q por par)
+        marcas, obras = defaultdict(list), defaultdict(set)
+        pares = sorted(candidatos)
+        for i in range(0, len(pares), LOTE_CANDIDATOS):
+            por_fecha = defaultdict(list)
+            for fecha, direccion in pares[i:i + LOTE_CANDIDATOS]:
+                por_fecha[fecha].append(direccion)
+            filtro = Q()
+            for fecha, direcciones in por_fecha.items():
+                filtro |= Q(fecha=fecha, **{f'{campo}__in': direcciones})
+            filas = Asistencia.objects.filter(filtro).order_by('hora_entrada').values_list(
+                'fecha', campo, 'hora_entrada', 'trabajador_id', 'obra__nombre',
+            )
+            for fecha, direccion, hora, trabajador, obra in filas.iterator():
+                marcas[fecha, direccion].append((hora, trabajador))
+                obras[fecha, direccion].add(obra)
+
+        for (fecha, direccion), lista in marcas.items():
+            trabajadores, desde, hasta = _maximo_en_ventana(lista, ventana)
+            if trabajadores < minimos[tipo]:
+                continue
+            SospechaIP.objects.update_or_create(
+                tipo=tipo, direccion=direccion, fecha=fecha,
+                defaults={
+                    'trabajadores': trabajadores, 'registros': candidatos[fecha, direccion],
+                    'hora_desde': desde, 'hora_hasta': hasta,
+                    'obras': ", ".join(sorted(obras[fecha, direccion]))[:255],
+                },
+            )
+            guardadas += 1
+    return guardadas
+
+
+def analizar_nuevas(ventana_minutos=None, minimo_ip=None, minimo_red=None, desde_cero=False):
+    """
+    Analiza los días con asistencias posteriores a la marca de agua y la avanza.
+    Devuelve (días analizados, sospechas guardadas).
+    """
+    with transaction.atomic():
+        marca, _ = MarcaAnalisis.objects.select_for_update().get_or_create(nombre=MARCA)
+        desde_id = 0 if desde_cero else marca.ultimo_id
+        nuevas = Asistencia.objects.filter(id__gt=desde_id)
+        hasta_id = nuevas.aggregate(m=Max('id'))['m']
+        if hasta_id is None:
+            return [], 0
+        # Los días completos: una marca nueva puede sumar a un grupo de marcas viejas
+        fechas = sorted(nuevas.filter(id__lte=hasta_id).values_list('fecha', flat=True).distinct().order_by())
+        guardadas = sum(
+            analizar_dias(fechas[i:i + LOTE_DIAS], ventana_minutos, minimo_ip, minimo_red)
+            for i in range(0, len(fechas), LOTE_DIAS)
+        )
+        marca.ultimo_id = hasta_id
+        marca.save(update_fields=['ultimo_id', 'fecha_ejecucion'])
+    return fechas, guardadas
@@ -0,0 +1,62 @@
+"""
+Geocercas con forma de polígono para obras lineales (caminos, ductos), donde
+un círculo que cubra toda la obra aceptaría marcas a kilómetros del frente.
+
+Obra.poligono es una lista de vértices [[lat, lon], ...]. Al guardar la obra se
+precalcula su caja (lat/lon mínimas y máximas): un punto fuera de la caja se
+rechaza con cuatro comparaciones, y solo los de adentro pasan por el test de
+punto en polígono (ray casting, O(vértices)). Sin polígono se usa el círculo.
+"""
+import math
+
+# Un grado mide ~111.195 m con el radio de calcular_distancia; se usa menos para que la caja sobre
+METROS_POR_GRADO = 111000
+
+
+def normalizar(vertices):
+    """
+    Lista de (lat, lon) en float, sin repetir el primer vértice al final.
+    Lanza ValueError si no forma un polígono.
+    """
+    try:
+        puntos = [(float(lat), float(lon)) for lat, lon in vertices]
+    except (TypeError, ValueError):
+        raise ValueError("Cada vértice debe ser [latitud, longitud].")
+    if len(puntos) > 1 and puntos[0] == puntos[-1]:
+        puntos.pop()
+    if len(puntos) < 3:
+        raise ValueError("El polígono necesita al menos 3 vértices.")
+    if any(not (-90 <= lat <= 90 and -180 <= lon <= 180) for lat, lon in puntos):
+        raise ValueError("Hay vértices con coordenadas fuera de rango.")
+    return puntos
+
+
+def caja(puntos):
+    """(lat_min, lat_max, lon_min, lon_max) de los vértices."""
+    lats = [lat for lat, _ in puntos]
+    lons = [lon for _, lon in puntos]
+    return min(lats), max(lats), min(lons), max(lons)
+
+
+def caja_circulo(lat, lon, radio):
+    """Caja que contiene un círculo de `radio` metros (un poco holgada, nunca corta)."""
+    d_lat = radio / METROS_POR_GRADO
+    d_lon = radio / (METROS_POR_GRADO * max(math.cos(math.radians(lat)), 0.01))
+    return lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+
+
+def en_caja(lat, lon, lat_min, lat_max, lon_min, lon_max):
+    return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+
+def en_poligono(lat, lon, puntos):
+    """Ray casting: cuenta cuántos lados cruza un rayo hacia el este desde el punto."""
+    dentro = False
+    lat_j, lon_j = puntos[-1]
+    for lat_i, lon_i in puntos:
+        if (lat_i > lat) != (lat_j > lat):
+            cruce = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < cruce:
+                dentro = not dentro
+        lat_j, lon_j = lat_i, lon_i
+    return dentro
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import fraude_ip
+from registro.models import SospechaIP
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca IPs y subredes /24 desde las que marcaron muchos trabajadores distintos en pocos "
+        "minutos. Solo revisa los días con asistencias nuevas desde la última corrida; "
+        "el resultado queda en el admin (Sospechas de IP)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ventana', type=int, help="Minutos de la ventana (por defecto FRAUDE_IP_VENTANA_MINUTOS o 15).")
+        parser.add_argument('--minimo-ip', type=int, help="Trabajadores distintos para sospechar de una IP (por defecto 5).")
+        parser.add_argument('--minimo-red', type=int, help="Trabajadores distintos para sospechar de una subred (por defecto 10).")
+        parser.add_argument('--desde-cero', action='store_true', help="Ignora la marca de agua y revisa todo el historial.")
+
+    def handle(self, *args, **opts):
+        for opcion in ('ventana', 'minimo_ip', 'minimo_red'):
+            if opts[opcion] is not None and opts[opcion] < 1:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser mayor que 0.")
+
+        fechas, guardadas = fraude_ip.analizar_nuevas(
+            opts['ventana'], opts['minimo_ip'], opts['minimo_red'], desde_cero=opts['desde_cero'],
+        )
+        if not fechas:
+            self.stdout.write("No hay asistencias nuevas desde la última corrida.")
+            return
+        pendientes = SospechaIP.objects.filter(revisada=False).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(fechas)} días analizados, {guardadas} sospechas encontradas ({pendientes} sin revisar en total)."
+        ))
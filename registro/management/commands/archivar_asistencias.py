@@ -0,0 +1,67 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import archivo, particiones
+from registro.models import ArchivoAsistencia, Asistencia
+
+
+def _mes(texto):
+    try:
+        return datetime.strptime(texto, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f"Mes inválido '{texto}', usa el formato AAAA-MM.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Archiva meses cerrados de Asistencia en archivos gzip JSON Lines de solo lectura "
+        "(manteniendo los totales por obra en el balance) o rehidrata un mes para auditoría."
+    )
+
+    def add_arguments(self, parser):
+        grupo = parser.add_mutually_exclusive_group(required=True)
+        grupo.add_argument('--mes', help="Archiva un solo mes (AAAA-MM).")
+        grupo.add_argument('--antes-de', help="Archiva todos los meses anteriores a AAAA-MM.")
+        grupo.add_argument('--rehidratar', help="Devuelve a la tabla un mes archivado (AAAA-MM).")
+
+    def handle(self, *args, **opts):
+        if opts['rehidratar']:
+            mes = _mes(opts['rehidratar'])
+            try:
+                total = archivo.rehidratar_mes(mes)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"{mes:%Y-%m}: {total} registros rehidratados."))
+            return
+
+        if opts['mes']:
+            meses = [_mes(opts['mes'])]
+        else:
+            limite = min(_mes(opts['antes_de']), particiones.inicio_mes(date.today()))
+            primera = Asistencia.objects.filter(fecha__lt=limite).order_by('fecha').values_list('fecha', flat=True).first()
+            ya_archivados = set(ArchivoAsistencia.objects.values_list('periodo', flat=True))
+            meses = []
+            inicio = particiones.inicio_mes(primera) if primera else limite
+            while inicio < limite:
+                if inicio not in ya_archivados:
+                    meses.append(inicio)
+                inicio = particiones.mes_siguiente(inicio)
+
+        for mes in meses:
+            try:
+                total = archivo.archivar_mes(mes)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f"{mes:%Y-%m}: {total} registros archivados.")
+
+        # Turnos que estaban abiertos al archivar: quedan en la tabla viva (un mes no
+        # se vuelve a archivar). Se avisan también los de meses archivados antes
+        archivados = set(ArchivoAsistencia.objects.values_list('periodo', flat=True))
+        for mes in sorted(archivados if opts['antes_de'] else archivados & set(meses)):
+            restantes = archivo.restantes(mes)
+            if restantes:
+                self.stdout.write(self.style.WARNING(
+                    f"{mes:%Y-%m}: {restantes} registros quedaron en la tabla (turnos abiertos al archivar)."
+                ))
+        self.stdout.write(self.style.SUCCESS(f"Listo ({len(meses)} meses)."))
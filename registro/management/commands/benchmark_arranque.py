@@ -0,0 +1,48 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import benchmarks
+from registro.benchmarks import arranque
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el arranque de un worker (imports con -X importtime, tiempo hasta tener WSGI y URLs "
+        "cargadas, memoria residente) y falla si supera ARRANQUE_PRESUPUESTO_MS / ARRANQUE_PRESUPUESTO_RSS_MB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument(
+            '--salida',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks', 'arranque.json'),
+            help="Archivo JSON donde se guardan los resultados de esta corrida.",
+        )
+        parser.add_argument('--linea-base', help="JSON de una corrida anterior para detectar regresiones.")
+        parser.add_argument('--tolerancia', type=float, default=0.20, help="Empeoramiento permitido (0.20 = 20%%).")
+
+    def handle(self, *args, **opts):
+        if opts['repeticiones'] < 1:
+            raise CommandError("--repeticiones debe ser mayor que 0.")
+
+        resultados = arranque.ejecutar(opts['repeticiones'])
+        resultados['meta'] = benchmarks.metadatos()
+
+        m = resultados['escenarios']['arranque']
+        self.stdout.write(f"arranque {m['media_ms']:>8.1f} ms  imports {m['importacion_ms']:>8.1f} ms  rss {m['rss_mb']} MB")
+        for i in resultados['imports_mas_caros'][:5]:
+            self.stdout.write(f"  {i['acumulado_ms']:>8.1f} ms  {i['modulo']}")
+
+        benchmarks.guardar_resultados(opts['salida'], resultados)
+        self.stdout.write(f"Resultados guardados en {opts['salida']}")
+
+        problemas = arranque.fuera_de_presupuesto(resultados)
+        if opts['linea_base']:
+            problemas += benchmarks.comparar_con_linea_base(
+                resultados, benchmarks.cargar_resultados(opts['linea_base']), opts['tolerancia']
+            )
+        if problemas:
+            raise CommandError("Arranque fuera de presupuesto:\n  " + "\n  ".join(problemas))
+        self.stdout.write(self.style.SUCCESS("Arranque dentro del presupuesto."))
@@ -0,0 +1,52 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import benchmarks
+from registro.benchmarks import checkin
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula la ráfaga de marcas del inicio de turno (API y panel) sobre una "
+        "base SQLite temporal y reporta throughput, p50/p95/p99 y queries por request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--obras', type=int, default=5)
+        parser.add_argument('--trabajadores', type=int, default=100)
+        parser.add_argument('--concurrencia', type=int, default=8)
+        parser.add_argument(
+            '--salida',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks', 'checkin_asistencia.json'),
+            help="Archivo JSON donde se guardan los resultados de esta corrida.",
+        )
+        parser.add_argument('--linea-base', help="JSON de una corrida anterior para detectar regresiones.")
+        parser.add_argument('--tolerancia', type=float, default=0.20, help="Empeoramiento permitido (0.20 = 20%%).")
+
+    def handle(self, *args, **opts):
+        if opts['trabajadores'] < 2 or opts['obras'] < 1:
+            raise CommandError("Se necesitan al menos 1 obra y 2 trabajadores.")
+
+        with benchmarks.base_de_datos_aislada():
+            resultados = checkin.ejecutar(opts['obras'], opts['trabajadores'], opts['concurrencia'])
+        resultados['meta'] = benchmarks.metadatos()
+
+        for nombre, m in resultados['escenarios'].items():
+            self.stdout.write(
+                f"{nombre:<16} {m['throughput_rps']:>8.1f} req/s  "
+                f"p50 {m['p50_ms']:>8.1f} ms  p95 {m['p95_ms']:>8.1f} ms  p99 {m['p99_ms']:>8.1f} ms  "
+                f"{m['queries_por_request']:>5.1f} queries/req  {m['errores']} errores"
+            )
+
+        benchmarks.guardar_resultados(opts['salida'], resultados)
+        self.stdout.write(f"Resultados guardados en {opts['salida']}")
+
+        if opts['linea_base']:
+            regresiones = benchmarks.comparar_con_linea_base(
+                resultados, benchmarks.cargar_resultados(opts['linea_base']), opts['tolerancia']
+            )
+            if regresiones:
+                raise CommandError("Regresiones detectadas:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
@@ -0,0 +1,52 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import benchmarks
+from registro.benchmarks import carga_util
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide bytes en el cable y tiempo de punta a punta (con un 3G simulado) de lista_obras y "
+        "marcar_asistencia_api, en formato normal y compacto, con y sin compresión."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--obras', type=int, default=200)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--ancho-kbps', type=int, default=384, help="Ancho de banda simulado (kbit/s).")
+        parser.add_argument('--latencia-ms', type=int, default=300, help="Latencia de ida y vuelta simulada.")
+        parser.add_argument(
+            '--salida',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks', 'carga_util.json'),
+            help="Archivo JSON donde se guardan los resultados de esta corrida.",
+        )
+        parser.add_argument('--linea-base', help="JSON de una corrida anterior para detectar regresiones.")
+        parser.add_argument('--tolerancia', type=float, default=0.20, help="Empeoramiento permitido (0.20 = 20%%).")
+
+    def handle(self, *args, **opts):
+        if opts['obras'] < 1 or opts['repeticiones'] < 1 or opts['ancho_kbps'] < 1:
+            raise CommandError("--obras, --repeticiones y --ancho-kbps deben ser mayores que 0.")
+
+        with benchmarks.base_de_datos_aislada():
+            resultados = carga_util.ejecutar(opts['obras'], opts['repeticiones'], opts['ancho_kbps'], opts['latencia_ms'])
+        resultados['meta'] = benchmarks.metadatos()
+
+        for nombre, m in resultados['escenarios'].items():
+            self.stdout.write(
+                f"{nombre:<28} {m['bytes_respuesta']:>8} bytes ({m['codificacion']:<8})  "
+                f"servidor p50 {m['p50_ms']:>7.1f} ms  punta a punta {m['e2e_ms']:>8.1f} ms"
+            )
+
+        benchmarks.guardar_resultados(opts['salida'], resultados)
+        self.stdout.write(f"Resultados guardados en {opts['salida']}")
+
+        if opts['linea_base']:
+            regresiones = benchmarks.comparar_con_linea_base(
+                resultados, benchmarks.cargar_resultados(opts['linea_base']), opts['tolerancia']
+            )
+            if regresiones:
+                raise CommandError("Regresiones detectadas:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
@@ -0,0 +1,75 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import benchmarks
+from registro.benchmarks import orm
+
+
+def _escalas(texto):
+    try:
+        escalas = [int(parte) for parte in texto.split(',') if parte.strip()]
+    except ValueError:
+        raise CommandError(f"Escalas inválidas '{texto}', usa números separados por coma (10000,100000).")
+    if not escalas or min(escalas) < 100:
+        raise CommandError("Cada escala debe ser de al menos 100 asistencias.")
+    return escalas
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide Asistencia.save(), BalanceObra.actualizar_balance(), ReporteImproductivo.calcular_impacto() "
+        "y el dashboard del jefe con historiales sintéticos de distinto tamaño (una base SQLite temporal "
+        "por escala) y reporta latencias y queries por llamada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', default=','.join(str(e) for e in orm.ESCALAS), help="Asistencias por escala, separadas por coma.")
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--anios', type=int, default=2, help="Años de historial en que se reparten las asistencias.")
+        parser.add_argument(
+            '--salida',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks', 'orm.json'),
+            help="Archivo JSON donde se guardan los resultados de esta corrida.",
+        )
+        parser.add_argument('--linea-base', help="JSON de una corrida anterior para detectar regresiones.")
+        parser.add_argument('--tolerancia', type=float, default=0.20, help="Empeoramiento permitido (0.20 = 20%%).")
+
+    def handle(self, *args, **opts):
+        escalas = _escalas(opts['escalas'])
+        if opts['repeticiones'] < 1 or opts['anios'] < 1:
+            raise CommandError("--repeticiones y --anios deben ser mayores que 0.")
+
+        resultados = {
+            'parametros': {'escalas': escalas, 'repeticiones': opts['repeticiones'], 'anios': opts['anios']},
+            'datos': {},
+            'escenarios': {},
+        }
+        for filas in escalas:
+            with benchmarks.base_de_datos_aislada():
+                generacion, escenarios = orm.ejecutar_escala(filas, opts['repeticiones'], opts['anios'])
+            resultados['datos'][filas] = generacion
+            resultados['escenarios'].update(escenarios)
+            self.stdout.write(
+                f"{filas} asistencias: {generacion['obras']} obras, {generacion['trabajadores']} trabajadores, "
+                f"{generacion['incidentes']} incidentes generados en {generacion['segundos']} s"
+            )
+            for nombre, m in escenarios.items():
+                if 'p50_ms' in m:
+                    self.stdout.write(
+                        f"  {nombre:<32} p50 {m['p50_ms']:>8.1f} ms  p95 {m['p95_ms']:>8.1f} ms  "
+                        f"{m['queries_por_llamada']:>5.1f} queries (máx {m['queries_max']})"
+                    )
+        resultados['meta'] = benchmarks.metadatos()
+
+        benchmarks.guardar_resultados(opts['salida'], resultados)
+        self.stdout.write(f"Resultados guardados en {opts['salida']}")
+
+        if opts['linea_base']:
+            regresiones = benchmarks.comparar_con_linea_base(
+                resultados, benchmarks.cargar_resultados(opts['linea_base']), opts['tolerancia']
+            )
+            if regresiones:
+                raise CommandError("Regresiones detectadas:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import agregados, balances, turnos
+
+
+class Command(BaseCommand):
+    help = (
+        "Marca las asistencias que quedaron sin salida (salida_automatica) y, con --cerrar, "
+        "las cierra con 0 horas para que el jefe corrija la hora real. Todo en un UPDATE; "
+        "después recalcula el balance de las obras afectadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=1, help="Antigüedad mínima del turno abierto (1 = de ayer o antes).")
+        parser.add_argument('--cerrar', action='store_true', help="Además de marcarlos, cerrarlos (hora_salida = hora_entrada).")
+        parser.add_argument('--dry-run', action='store_true', help="Solo cuenta los turnos olvidados.")
+
+    def handle(self, *args, **opts):
+        if opts['dias'] < 1:
+            raise CommandError("--dias debe ser 1 o más (el turno de hoy todavía puede cerrarse).")
+
+        if opts['dry_run']:
+            pendientes = turnos.turnos_olvidados(opts['dias'])
+            if not opts['cerrar']:
+                pendientes = pendientes.filter(salida_automatica=False)
+            pendientes = pendientes.count()
+            self.stdout.write(f"{pendientes} turnos olvidados (dry-run, no se modificó nada).")
+            return
+
+        total, obras = turnos.cerrar_olvidados(opts['dias'], cerrar=opts['cerrar'])
+        if opts['cerrar'] and obras:
+            balances.reconstruir(obras)
+        for obra_id in obras:
+            agregados.invalidar_obra(obra_id)
+        accion = "cerrados" if opts['cerrar'] else "marcados"
+        self.stdout.write(self.style.SUCCESS(f"{total} turnos olvidados {accion} en {len(obras)} obras."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from registro import particiones
+
+
+class Command(BaseCommand):
+    help = "Crea por adelantado las particiones mensuales de Asistencia (solo PostgreSQL). Correr 1 vez al mes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=3, help="Meses hacia adelante a preparar.")
+
+    def handle(self, *args, **opts):
+        if not particiones.es_particionada():
+            self.stdout.write("La tabla de asistencias no está particionada (SQLite u origen sin migrar). Nada que hacer.")
+            return
+        creadas = particiones.asegurar_particiones(opts['meses'])
+        for nombre in creadas:
+            self.stdout.write(f"Creada {nombre}")
+        self.stdout.write(self.style.SUCCESS(f"{len(creadas)} particiones nuevas."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from registro.benchmarks import sinteticos
+from registro.models import Asistencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena la base configurada con datos sintéticos realistas (obras, jefes, trabajadores, años de "
+        "asistencia con jitter de GPS e incidentes) para pruebas de carga. Usa bulk_create por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, required=True, help="Asistencias a generar (ej. 10000, 100000, 1000000).")
+        parser.add_argument('--anios', type=int, default=2, help="Años de historial.")
+        parser.add_argument('--prefijo', default='sint', help="Prefijo de usuarios y obras (para generar varias tandas).")
+        parser.add_argument('--lote', type=int, default=5000, help="Asistencias por bulk_create.")
+        parser.add_argument('--semilla', type=int, help="Semilla para repetir exactamente los mismos datos.")
+        parser.add_argument('--agregar', action='store_true', help="Permite generar sobre una base que ya tiene asistencias.")
+
+    def handle(self, *args, **opts):
+        if opts['filas'] < 1 or opts['anios'] < 1 or opts['lote'] < 1:
+            raise CommandError("--filas, --anios y --lote deben ser mayores que 0.")
+        if not opts['agregar'] and Asistencia.objects.exists():
+            raise CommandError("La base ya tiene asistencias; usa --agregar si de verdad quieres mezclar datos sintéticos.")
+
+        resumen = sinteticos.generar(opts['filas'], opts['anios'], opts['prefijo'], opts['lote'], opts['semilla'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['asistencias']} asistencias, {resumen['incidentes']} incidentes, {resumen['obras']} obras y "
+            f"{resumen['trabajadores']} trabajadores en {resumen['segundos']} s ({resumen['filas_por_segundo']} filas/s)."
+        ))
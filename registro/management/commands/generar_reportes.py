@@ -0,0 +1,45 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from registro import particiones, reportes
+from registro.models import Obra
+
+
+def _mes(texto):
+    try:
+        return datetime.strptime(texto, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f"Mes inválido '{texto}', usa el formato AAAA-MM.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera el reporte mensual en PDF (balance, sueldos, incidentes, multas y cumplimiento) "
+        "de cada obra, en paralelo. Los que no cambiaron desde la última vez salen del caché."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mes', help="Mes del reporte (AAAA-MM). Por defecto, el mes anterior.")
+        parser.add_argument('--obra', type=int, action='append', help="Id de obra (se puede repetir). Por defecto, todas.")
+        parser.add_argument('--procesos', type=int, default=os.cpu_count() or 1, help="Procesos en paralelo (1 = secuencial).")
+        parser.add_argument('--forzar', action='store_true', help="Regenera aunque esté en caché.")
+
+    def handle(self, *args, **opts):
+        mes = _mes(opts['mes']) if opts['mes'] else particiones.inicio_mes(particiones.inicio_mes(date.today()) - timedelta(days=1))
+        if opts['procesos'] < 1:
+            raise CommandError("--procesos debe ser 1 o más.")
+        obras = Obra.objects.filter(id__in=opts['obra']) if opts['obra'] else Obra.objects.all()
+
+        inicio = time.perf_counter()
+        resultados = reportes.generar_todos(mes.year, mes.month, obras, procesos=opts['procesos'], forzar=opts['forzar'])
+        segundos = time.perf_counter() - inicio
+
+        for obra_id, ruta, en_cache in resultados:
+            self.stdout.write(f"Obra {obra_id}: {ruta}{' (caché)' if en_cache else ''}")
+        nuevos = sum(1 for _, _, en_cache in resultados if not en_cache)
+        self.stdout.write(self.style.SUCCESS(
+            f"{mes:%Y-%m}: {len(resultados)} reportes ({nuevos} generados, {len(resultados) - nuevos} del caché) en {segundos:.1f} s."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from registro import subidas
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las subidas de fotos vencidas (SUBIDAS_HORAS) que nunca se usaron en una marca "
+        "o reporte, junto con sus bloques en SUBIDAS_DIR. Pensado para correr una vez al día."
+    )
+
+    def handle(self, *args, **opts):
+        borrados = subidas.limpiar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f"{borrados} archivos de subidas vencidas borrados."))
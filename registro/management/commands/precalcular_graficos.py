@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from registro import agregados
+from registro.admin import GraficoAsincronoMixin
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula por adelantado los gráficos del admin (histórico y ventanas de "
+        "30/90 días) para que el primer usuario no espere. Pensado para cron, "
+        "con un caché compartido (CACHE_BACKEND=archivo o similar)."
+    )
+
+    def handle(self, *args, **opts):
+        for dias in (None,) + GraficoAsincronoMixin.VENTANAS_DIAS:
+            agregados.grafico_balances(dias)
+            agregados.grafico_perdidas(dias)
+        agregados.total_sin_leer()
+        self.stdout.write(self.style.SUCCESS("Gráficos del admin precalculados."))
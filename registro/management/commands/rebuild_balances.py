@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from registro import balances
+
+
+def _iniciar_proceso():
+    # Con 'spawn' el hijo parte sin Django configurado; con 'fork' esto no hace nada
+    django.setup()
+
+
+def _reconstruir_lote(obra_ids, aplicar):
+    try:
+        return balances.reconstruir(obra_ids, aplicar=aplicar)
+    finally:
+        connections.close_all()
+
+
+def _fecha(texto):
+    fecha = parse_date(texto or '')
+    if not fecha:
+        raise CommandError(f"Fecha inválida '{texto}', usa el formato AAAA-MM-DD.")
+    return fecha
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye BalanceObra de todas las obras (o de las que tuvieron movimiento en un "
+        "rango de fechas) con queries agrupadas por obra y bulk_update. Los totales siempre "
+        "son históricos; el rango solo elige qué obras revisar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Solo obras con asistencias o reportes desde AAAA-MM-DD.")
+        parser.add_argument('--hasta', help="Solo obras con asistencias o reportes hasta AAAA-MM-DD.")
+        parser.add_argument('--dry-run', action='store_true', help="Muestra las diferencias sin guardar nada.")
+        parser.add_argument('--lote', type=int, default=500, help="Obras por lote.")
+        parser.add_argument('--procesos', type=int, default=1, help="Procesos en paralelo (uno por lote).")
+
+    def handle(self, *args, **opts):
+        desde = _fecha(opts['desde']) if opts['desde'] else None
+        hasta = _fecha(opts['hasta']) if opts['hasta'] else None
+        if opts['lote'] < 1 or opts['procesos'] < 1:
+            raise CommandError("--lote y --procesos deben ser mayores que 0.")
+
+        obra_ids = balances.obras_con_movimiento(desde, hasta)
+        lotes = [obra_ids[i:i + opts['lote']] for i in range(0, len(obra_ids), opts['lote'])]
+        aplicar = not opts['dry_run']
+
+        if opts['procesos'] > 1 and len(lotes) > 1:
+            # Las conexiones abiertas no se pueden compartir con los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=opts['procesos'], initializer=_iniciar_proceso) as pool:
+                resultados = pool.map(_reconstruir_lote, lotes, [aplicar] * len(lotes))
+                diferencias = [d for lote in resultados for d in lote]
+        else:
+            diferencias = [d for lote in lotes for d in balances.reconstruir(lote, aplicar=aplicar)]
+
+        for d in diferencias:
+            if not d['cambios']:
+                self.stdout.write(f"{d['obra']} (#{d['obra_id']}): sin balance, se crea.")
+                continue
+            detalle = ", ".join(f"{campo}: {antes} -> {despues}" for campo, (antes, despues) in d['cambios'].items())
+            self.stdout.write(f"{d['obra']} (#{d['obra_id']}): {detalle}")
+
+        resumen = f"{len(obra_ids)} obras revisadas, {len(diferencias)} con diferencias"
+        if opts['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{resumen} (dry-run, no se guardó nada)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{resumen}, balances actualizados."))
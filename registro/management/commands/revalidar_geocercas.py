@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from registro import agregados
+from registro.models import Asistencia, Obra
+
+LOTE = 2000
+
+
+def revalidar_obra(obra, desde=None, hasta=None, aplicar=True):
+    """
+    Marca como inválidas las entradas válidas de `obra` que caen fuera de su
+    geocerca actual. Devuelve (revisadas, fuera). No vuelve a validar las
+    inválidas: pueden serlo por viaje imposible, que no se guarda aparte.
+    """
+    qs = Asistencia.objects.filter(obra=obra, entrada_valida=True)
+    if desde:
+        qs = qs.filter(fecha__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__lte=hasta)
+
+    # 1. Fuera de la caja (o sin GPS): se resuelve en SQL, sin traer filas
+    lat_min, lat_max, lon_min, lon_max = obra.caja()
+    en_caja = Q(
+        latitud_entrada__gte=lat_min, latitud_entrada__lte=lat_max,
+        longitud_entrada__gte=lon_min, longitud_entrada__lte=lon_max,
+    )
+    fuera_caja = qs.exclude(en_caja)
+    revisadas = qs.count()
+    fuera = fuera_caja.update(entrada_valida=False) if aplicar else fuera_caja.count()
+
+    # 2. Dentro de la caja: test exacto en Python, por lotes de id
+    ids_fuera = []
+    candidatas = qs.filter(en_caja).order_by('id').values_list('id', 'latitud_entrada', 'longitud_entrada')
+    for asistencia_id, latitud, longitud in candidatas.iterator(chunk_size=LOTE):
+        if not obra.contiene(latitud, longitud):
+            ids_fuera.append(asistencia_id)
+    fuera += len(ids_fuera)
+    if aplicar:
+        for i in range(0, len(ids_fuera), LOTE):
+            Asistencia.objects.filter(id__in=ids_fuera[i:i + LOTE]).update(entrada_valida=False)
+        if fuera:
+            agregados.invalidar_obra(obra.id)
+    return revisadas, fuera
+
+
+def _fecha(texto):
+    fecha = parse_date(texto or '')
+    if not fecha:
+        raise CommandError(f"Fecha inválida '{texto}', usa el formato AAAA-MM-DD.")
+    return fecha
+
+
+class Command(BaseCommand):
+    help = (
+        "Vuelve a revisar la geocerca (polígono o círculo) de asistencias ya registradas, por ejemplo "
+        "después de dibujar el polígono de una obra. Las que quedan fuera se marcan como inválidas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--obra', type=int, action='append', help="Id de obra (se puede repetir). Por defecto, las que tienen polígono.")
+        parser.add_argument('--desde', help="Solo asistencias desde AAAA-MM-DD.")
+        parser.add_argument('--hasta', help="Solo asistencias hasta AAAA-MM-DD.")
+        parser.add_argument('--dry-run', action='store_true', help="Solo cuenta, no modifica nada.")
+
+    def handle(self, *args, **opts):
+        desde = _fecha(opts['desde']) if opts['desde'] else None
+        hasta = _fecha(opts['hasta']) if opts['hasta'] else None
+        obras = Obra.objects.filter(id__in=opts['obra']) if opts['obra'] else Obra.objects.filter(poligono__isnull=False)
+
+        total_fuera = 0
+        for obra in obras.order_by('id'):
+            revisadas, fuera = revalidar_obra(obra, desde, hasta, aplicar=not opts['dry_run'])
+            total_fuera += fuera
+            modo = "polígono" if obra.poligono else f"círculo de {obra.radio_permitido} m"
+            self.stdout.write(f"{obra.nombre} ({modo}): {revisadas} entradas válidas revisadas, {fuera} fuera de la geocerca.")
+
+        if opts['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{total_fuera} entradas quedarían inválidas (dry-run, no se guardó nada)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{total_fuera} entradas marcadas como inválidas."))
@@ -0,0 +1,157 @@
+"""
+Métricas en memoria del proceso (histogramas con buckets fijos y contadores)
+para el pipeline de asistencia, exportables en formato de texto Prometheus.
+
+Cada worker de gunicorn tiene sus propias métricas; Prometheus las suma al
+hacer scrape de cada worker. Con METRICAS_HABILITADAS = False, medir()
+devuelve un contexto vacío y el costo es una lectura de settings.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+# Buckets en segundos: desde 50 µs (haversine) hasta 2.5 s (save completo lento)
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_lock = threading.Lock()
+_registro = {}
+
+
+def habilitadas():
+    return getattr(settings, 'METRICAS_HABILITADAS', True)
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiqueta, buckets=BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.buckets = buckets
+        self.series = {}  # valor_etiqueta -> [conteos por bucket..., +Inf], suma
+
+    def observar(self, valor_etiqueta, segundos):
+        indice = bisect_left(self.buckets, segundos)
+        with _lock:
+            serie = self.series.get(valor_etiqueta)
+            if serie is None:
+                serie = self.series[valor_etiqueta] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += segundos
+
+    def exportar(self):
+        lineas = []
+        for valor, (conteos, suma) in sorted(self.series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ('+Inf',), conteos):
+                acumulado += conteo
+                lineas.append(f'{self.nombre}_bucket{{{self.etiqueta}="{valor}",le="{limite}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_sum{{{self.etiqueta}="{valor}"}} {suma:.6f}')
+            lineas.append(f'{self.nombre}_count{{{self.etiqueta}="{valor}"}} {acumulado}')
+        return lineas
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.series = {}  # tupla de valores -> total
+
+    def incrementar(self, *valores, cantidad=1):
+        if not habilitadas():
+            return
+        with _lock:
+            self.series[valores] = self.series.get(valores, 0) + cantidad
+
+    def exportar(self):
+        lineas = []
+        for valores, total in sorted(self.series.items()):
+            etiquetas = ','.join(f'{e}="{v}"' for e, v in zip(self.etiquetas, valores))
+            lineas.append(f'{self.nombre}{{{etiquetas}}} {total}')
+        return lineas
+
+
+def _registrar(metrica):
+    with _lock:
+        return _registro.setdefault(metrica.nombre, metrica)
+
+
+def histograma(nombre, ayuda, etiqueta='etapa'):
+    return _registrar(Histograma(nombre, ayuda, etiqueta))
+
+
+def contador(nombre, ayuda, etiquetas):
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+class _Cronometro:
+    __slots__ = ('histograma', 'etapa', 'inicio')
+
+    def __init__(self, histograma, etapa):
+        self.histograma = histograma
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histograma.observar(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+class _Nulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULO = _Nulo()
+
+
+def medir(histograma, etapa):
+    """with medir(HIST, 'etapa'): ... registra la duración en el histograma."""
+    if not habilitadas():
+        return _NULO
+    return _Cronometro(histograma, etapa)
+
+
+def exportar_prometheus():
+    lineas = []
+    # Con el candado todo el recorrido: una observación a medias dejaría los
+    # buckets desfasados de _count, y una serie nueva cambia el dict que se itera
+    with _lock:
+        for metrica in sorted(_registro.values(), key=lambda m: m.nombre):
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.exportar())
+    return '\n'.join(lineas) + '\n'
+
+
+def reiniciar():
+    """Limpia todas las series (útil en tests)."""
+    with _lock:
+        for metrica in _registro.values():
+            metrica.series.clear()
+
+
+# --- MÉTRICAS DEL PIPELINE DE ASISTENCIA ---
+ASISTENCIA_SAVE = histograma(
+    'registro_asistencia_save_segundos', 'Duración de cada etapa de Asistencia.save()'
+)
+REPORTE_IMPACTO = histograma(
+    'registro_reporte_impacto_segundos', 'Duración de cada etapa de ReporteImproductivo.calcular_impacto()'
+)
+RECHAZOS = contador(
+    'registro_asistencia_rechazos_total', 'Marcas de entrada rechazadas por obra y motivo', ('obra', 'motivo')
+)
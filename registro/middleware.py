@@ -0,0 +1,118 @@
+import gzip
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+try:  # Opcional: si no está instalado se usa solo gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('registro.sql')
+
+
+class _ContadorQueries:
+    """execute_wrapper que acumula cantidad, tiempo total y la query más lenta."""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.total_ms = 0.0
+        self.lenta_ms = 0.0
+        self.lenta_sql = ''
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = (time.perf_counter() - inicio) * 1000
+            self.cantidad += 1
+            self.total_ms += duracion
+            if duracion > self.lenta_ms:
+                self.lenta_ms, self.lenta_sql = duracion, sql
+
+
+class MetricasSQLMiddleware:
+    """
+    Mide las queries de cada request (sin depender de DEBUG), las expone en el
+    header Server-Timing y deja en el log 'registro.sql' las requests que se
+    pasan del umbral global o del presupuesto declarado por la vista.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.umbral_queries = getattr(settings, 'SQL_UMBRAL_QUERIES', 30)
+        self.umbral_ms = getattr(settings, 'SQL_UMBRAL_MS', 500)
+        self.server_timing = getattr(settings, 'SQL_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        contador = _ContadorQueries()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(contador))
+            response = self.get_response(request)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={contador.total_ms:.1f};desc="{contador.cantidad} queries", '
+                f'db-lenta;dur={contador.lenta_ms:.1f}'
+            )
+
+        presupuesto = getattr(request, 'presupuesto_queries', None)
+        excede_presupuesto = presupuesto is not None and contador.cantidad > presupuesto
+        if excede_presupuesto or contador.cantidad > self.umbral_queries or contador.total_ms > self.umbral_ms:
+            logger.warning(
+                "%s %s: %d queries (presupuesto %s) en %.1f ms. Más lenta (%.1f ms): %s",
+                request.method, request.path, contador.cantidad, presupuesto,
+                contador.total_ms, contador.lenta_ms, contador.lenta_sql[:300],
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.presupuesto_queries = getattr(view_func, 'presupuesto_queries', None)
+
+
+class CompresionAPIMiddleware:
+    """
+    Comprime las respuestas JSON de la API (/v1/) según Accept-Encoding: brotli
+    si está instalado y el cliente lo acepta, si no gzip. Las respuestas más
+    chicas que COMPRESION_MINIMO_BYTES se mandan tal cual (el encabezado
+    costaría más de lo que se ahorra). Solo la API: las páginas HTML llevan el
+    token CSRF y comprimirlas abre la puerta a BREACH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefijo = getattr(settings, 'COMPRESION_PREFIJO', '/v1/')
+        self.minimo = getattr(settings, 'COMPRESION_MINIMO_BYTES', 512)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not request.path.startswith(self.prefijo):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (
+            response.streaming or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+            or len(response.content) < self.minimo
+        ):
+            return response
+
+        aceptadas = {c.split(';')[0].strip() for c in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')}
+        if brotli and 'br' in aceptadas:
+            codificacion, comprimido = 'br', brotli.compress(response.content, quality=5)
+        elif 'gzip' in aceptadas:
+            codificacion, comprimido = 'gzip', gzip.compress(response.content, compresslevel=6, mtime=0)
+        else:
+            return response
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = codificacion
+        return response
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from registro import particiones
+
+
+def particionar_asistencia(apps, schema_editor):
+    """
+    Convierte registro_asistencia en tabla particionada por mes (solo PostgreSQL).
+    La PK pasa a ser (id, fecha) porque PostgreSQL exige incluir la columna de
+    partición; nada apunta con FK a Asistencia, así que el cambio es transparente.
+    """
+    conexion = schema_editor.connection
+    if conexion.vendor != 'postgresql' or particiones.es_particionada(conexion.alias):
+        return
+
+    tabla = particiones.TABLA
+    plana = f'{tabla}_plana'
+    with conexion.cursor() as c:
+        # Índices (menos la PK) y FKs actuales, para recrearlos con el mismo nombre
+        c.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE contype = 'p' AND conrelid = %s::regclass)",
+            [tabla, tabla],
+        )
+        indices = [fila[0] for fila in c.fetchall()]
+        c.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' AND conrelid = %s::regclass",
+            [tabla],
+        )
+        foraneas = c.fetchall()
+        c.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [tabla])
+        es_identity = c.fetchone()[0] != ''
+        c.execute(f"SELECT MIN(fecha), MAX(fecha) FROM {tabla}")
+        minima, maxima = c.fetchone()
+
+        c.execute(f'ALTER TABLE {tabla} RENAME TO {plana}')
+        c.execute(
+            f'CREATE TABLE {tabla} (LIKE {plana} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (fecha)'
+        )
+        c.execute(f'ALTER TABLE {tabla} ADD PRIMARY KEY (id, fecha)')
+        c.execute(f'CREATE TABLE {particiones.PARTICION_DEFAULT} PARTITION OF {tabla} DEFAULT')
+
+        # Una partición por cada mes con datos (los próximos meses, al final)
+        if minima:
+            inicio = particiones.inicio_mes(minima)
+            while inicio <= maxima:
+                particiones.crear_particion_mes(c, inicio)
+                inicio = particiones.mes_siguiente(inicio)
+
+        c.execute(f'INSERT INTO {tabla} OVERRIDING SYSTEM VALUE SELECT * FROM {plana}')
+        if es_identity:
+            c.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {tabla}",
+                [tabla],
+            )
+        else:
+            # Columna serial antigua: la secuencia pasa a ser de la tabla nueva
+            c.execute("SELECT pg_get_serial_sequence(%s, 'id')", [plana])
+            secuencia = c.fetchone()[0]
+            if secuencia:
+                c.execute(f'ALTER SEQUENCE {secuencia} OWNED BY {tabla}.id')
+
+        c.execute(f'DROP TABLE {plana}')
+        for definicion in indices:
+            c.execute(definicion)
+        for nombre, definicion in foraneas:
+            c.execute(f'ALTER TABLE {tabla} ADD CONSTRAINT {nombre} {definicion}')
+
+    particiones.asegurar_particiones(using=conexion.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0007_alter_asistencia_latitud_entrada_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='balanceobra',
+            name='total_sueldos_archivados',
+            field=models.DecimalField(decimal_places=0, default=0, max_digits=15),
+        ),
+        migrations.CreateModel(
+            name='ArchivoAsistencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes archivado')),
+                ('registros', models.PositiveIntegerField(default=0)),
+                ('total_horas', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_pagado', models.DecimalField(decimal_places=0, default=0, max_digits=15)),
+                ('archivo', models.CharField(max_length=255)),
+                ('sha256', models.CharField(max_length=64)),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True)),
+                ('obra', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='registro.obra')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('periodo', 'obra'), name='archivo_asistencia_periodo_obra')],
+            },
+        ),
+        migrations.RunPython(particionar_asistencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0008_archivo_asistencia_y_particiones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['-fecha', '-id'], name='asistencia_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['obra', '-fecha'], name='asistencia_obra_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['trabajador', '-fecha'], name='asistencia_trab_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0009_indices_asistencia_admin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perfil',
+            index=models.Index(fields=['rol', 'rut'], name='perfil_rol_rut_idx'),
+        ),
+    ]
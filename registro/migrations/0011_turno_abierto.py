@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def apuntar_turnos_abiertos(apps, schema_editor):
+    # Los turnos que ya estaban abiertos pasan a ser el turno_abierto de su trabajador
+    Asistencia = apps.get_model('registro', 'Asistencia')
+    Perfil = apps.get_model('registro', 'Perfil')
+    abiertos = {}
+    filas = Asistencia.objects.filter(hora_salida__isnull=True).order_by('trabajador_id', 'fecha', 'id')
+    for trabajador_id, asistencia_id in filas.values_list('trabajador_id', 'id').iterator():
+        abiertos[trabajador_id] = asistencia_id  # queda el más reciente
+    perfiles = [Perfil(pk=trabajador_id, turno_abierto_id=asistencia_id) for trabajador_id, asistencia_id in abiertos.items()]
+    Perfil.objects.bulk_update(perfiles, ['turno_abierto'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0010_indice_perfil_rol_rut'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asistencia',
+            name='salida_automatica',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='perfil',
+            name='turno_abierto',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='registro.asistencia'),
+        ),
+        migrations.RunPython(apuntar_turnos_abiertos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0011_turno_abierto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reporteimproductivo',
+            index=models.Index(fields=['fecha', 'obra'], name='reporte_fecha_obra_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def calcular_redes(apps, schema_editor):
+    # Solo filas con IP (las de la web); se recorre por lotes de id
+    import ipaddress
+    Asistencia = apps.get_model('registro', 'Asistencia')
+    pendientes = Asistencia.objects.filter(ip_registro__isnull=False, red_registro__isnull=True).order_by('id')
+    ultimo = 0
+    while True:
+        lote = list(pendientes.filter(id__gt=ultimo).only('id', 'ip_registro')[:2000])
+        if not lote:
+            break
+        for asistencia in lote:
+            ip = ipaddress.ip_address(asistencia.ip_registro)
+            asistencia.red_registro = str(ipaddress.ip_network(f"{ip}/{24 if ip.version == 4 else 64}", strict=False))
+        Asistencia.objects.bulk_update(lote, ['red_registro'])
+        ultimo = lote[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0012_indice_reporte_fecha'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaAnalisis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('fecha_ejecucion', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SospechaIP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('IP', 'IP'), ('RED', 'Subred')], max_length=3)),
+                ('direccion', models.CharField(max_length=43)),
+                ('fecha', models.DateField()),
+                ('trabajadores', models.PositiveIntegerField(help_text='Máximo de trabajadores distintos dentro de la ventana')),
+                ('registros', models.PositiveIntegerField(help_text='Marcas de ese día desde la IP o subred')),
+                ('hora_desde', models.TimeField()),
+                ('hora_hasta', models.TimeField()),
+                ('obras', models.CharField(blank=True, max_length=255)),
+                ('revisada', models.BooleanField(default=False)),
+                ('fecha_deteccion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sospecha de IP',
+                'verbose_name_plural': 'Sospechas de IP',
+            },
+        ),
+        migrations.AddField(
+            model_name='asistencia',
+            name='red_registro',
+            field=models.CharField(blank=True, editable=False, max_length=43, null=True),
+        ),
+        migrations.RunPython(calcular_redes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['fecha', 'ip_registro'], name='asistencia_fecha_ip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['fecha', 'red_registro'], name='asistencia_fecha_red_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sospechaip',
+            index=models.Index(fields=['-trabajadores', '-fecha'], name='sospecha_ip_ranking_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='sospechaip',
+            constraint=models.UniqueConstraint(fields=('tipo', 'direccion', 'fecha'), name='sospecha_ip_tipo_direccion_fecha'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0013_analisis_ip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='obra',
+            name='caja_lat_max',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='obra',
+            name='caja_lat_min',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='obra',
+            name='caja_lon_max',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='obra',
+            name='caja_lon_min',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='obra',
+            name='poligono',
+            field=models.JSONField(blank=True, help_text='Vértices [[latitud, longitud], ...]. Vacío = círculo de radio_permitido.', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0014_geocerca_poligono'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='version_token',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registro', '0016_subidas_foto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asistencia',
+            index=models.Index(fields=['trabajador', '-fecha', '-id'], include=('obra', 'hora_entrada', 'hora_salida', 'horas_trabajadas', 'monto_pago_dia', 'entrada_valida'), name='asistencia_trab_fecha_id_idx'),
+        ),
+        # El índice nuevo cubre al viejo (mismo prefijo): se borra después de crearlo
+        migrations.RemoveIndex(
+            model_name='asistencia',
+            name='asistencia_trab_fecha_idx',
+        ),
+    ]
@@ -1,11 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from decimal import Decimal
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+import ipaddress
 import math
 import uuid # <--- IMPORTANTE: Para generar IDs únicos de celular
+from .metricas import medir, ASISTENCIA_SAVE, REPORTE_IMPACTO, RECHAZOS
+from . import geocercas
 
 class Perfil(models.Model):
     ROLES = [
@@ -22,6 +26,31 @@ class Perfil(models.Model):
 
     # NUEVO: Huella digital del dispositivo autorizado (Device Binding)
     dispositivo_id = models.CharField(max_length=100, blank=True, null=True, help_text="ID único del celular vinculado")
+    # Sube con "Resetear Celular": invalida los refresh tokens de la APK (registro/tokens.py)
+    version_token = models.PositiveIntegerField(default=0, editable=False)
+
+    # Asistencia sin salida del trabajador (la mantiene registro/turnos.py). Sin
+    # constraint en la BD: en PostgreSQL la PK de la tabla particionada es (id, fecha).
+    turno_abierto = models.ForeignKey(
+        'Asistencia', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        db_constraint=False, related_name='+',
+    )
+
+    class Meta:
+        # Buscador de trabajadores: filtra por rol y recorre en orden de RUT (los
+        # prefijos de nombre y RUT se revisan fila a fila, ver api.buscar_trabajadores)
+        indexes = [models.Index(fields=['rol', 'rut'], name='perfil_rol_rut_idx')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Tarifas tal como vinieron de la BD, para detectar cambios sin otra query
+        instancia._tarifas_originales = (instancia.__dict__.get('sueldo_diario'), instancia.__dict__.get('valor_hora'))
+        return instancia
+
+    def tarifas_cambiaron(self):
+        originales = getattr(self, '_tarifas_originales', None)
+        return originales is not None and originales != (self.sueldo_diario, self.valor_hora)
 
     def __str__(self):
         return f"{self.usuario.get_full_name()} ({self.rol})"
@@ -33,6 +62,14 @@ class Obra(models.Model):
     longitud = models.DecimalField(max_digits=20, decimal_places=10)
     
     radio_permitido = models.IntegerField(default=50)
+
+    # Geocerca opcional con forma de polígono (obras lineales); si está, reemplaza al círculo
+    poligono = models.JSONField(null=True, blank=True, help_text="Vértices [[latitud, longitud], ...]. Vacío = círculo de radio_permitido.")
+    # Caja del polígono, se recalcula en save()
+    caja_lat_min = models.FloatField(null=True, editable=False)
+    caja_lat_max = models.FloatField(null=True, editable=False)
+    caja_lon_min = models.FloatField(null=True, editable=False)
+    caja_lon_max = models.FloatField(null=True, editable=False)
     
     presupuesto_total = models.DecimalField(max_digits=15, decimal_places=0)
     
@@ -45,6 +82,40 @@ class Obra(models.Model):
     jefe_obra = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, limit_choices_to={'rol': 'JEFE'})
     activa = models.BooleanField(default=True)
 
+    def clean(self):
+        if self.poligono:
+            try:
+                geocercas.normalizar(self.poligono)
+            except ValueError as e:
+                raise ValidationError({'poligono': str(e)})
+
+    def save(self, *args, **kwargs):
+        if self.poligono:
+            self.poligono = [list(p) for p in geocercas.normalizar(self.poligono)]
+            self.caja_lat_min, self.caja_lat_max, self.caja_lon_min, self.caja_lon_max = geocercas.caja(self.poligono)
+        else:
+            self.poligono = None
+            self.caja_lat_min = self.caja_lat_max = self.caja_lon_min = self.caja_lon_max = None
+        super().save(*args, **kwargs)
+
+    def caja(self):
+        """(lat_min, lat_max, lon_min, lon_max) de la geocerca; en modo círculo, la caja del círculo."""
+        if self.poligono:
+            return self.caja_lat_min, self.caja_lat_max, self.caja_lon_min, self.caja_lon_max
+        return geocercas.caja_circulo(float(self.latitud), float(self.longitud), self.radio_permitido)
+
+    def contiene(self, latitud, longitud):
+        """¿El punto está dentro de la geocerca de la obra (polígono o círculo)?"""
+        try:
+            latitud, longitud = float(latitud), float(longitud)
+        except (TypeError, ValueError):
+            return False
+        if not geocercas.en_caja(latitud, longitud, *self.caja()):
+            return False
+        if self.poligono:
+            return geocercas.en_poligono(latitud, longitud, self.poligono)
+        return Asistencia.calcular_distancia(self.latitud, self.longitud, latitud, longitud) <= self.radio_permitido
+
     def __str__(self):
         return self.nombre
 
@@ -61,8 +132,12 @@ class BalanceObra(models.Model):
     presupuesto_restante = models.DecimalField(max_digits=15, decimal_places=0, default=0)
     es_rentable = models.BooleanField(default=True)
 
+    # Sueldos de meses ya archivados (ya no están en la tabla de Asistencia)
+    total_sueldos_archivados = models.DecimalField(max_digits=15, decimal_places=0, default=0)
+
     def actualizar_balance(self):
         pagos = Asistencia.objects.filter(obra=self.obra).aggregate(total=models.Sum('monto_pago_dia'))['total'] or 0
+        pagos += self.total_sueldos_archivados
         perdidas_op = ReporteImproductivo.objects.filter(obra=self.obra).aggregate(total=models.Sum('dinero_perdido'))['total'] or 0
         
         # Calcular Multas por Atraso
@@ -101,16 +176,46 @@ class Asistencia(models.Model):
 
     # NUEVO: Guardamos la IP para detectar "granjas de clicks" o redes sospechosas
     ip_registro = models.GenericIPAddressField(blank=True, null=True)
+    # Subred de ip_registro (/24 en IPv4, /64 en IPv6) para agrupar por red en SQL
+    red_registro = models.CharField(max_length=43, blank=True, null=True, editable=False)
+    # Turno que quedó sin salida y lo cerró o marcó el comando cerrar_turnos_olvidados
+    salida_automatica = models.BooleanField(default=False)
     modificado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='asistencias_modificadas')
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Índices para el admin con muchas filas: orden (-fecha, -id) y filtros por obra/trabajador
+        indexes = [
+            models.Index(fields=['-fecha', '-id'], name='asistencia_fecha_id_idx'),
+            models.Index(fields=['obra', '-fecha'], name='asistencia_obra_fecha_idx'),
+            # Historial del trabajador (/v1/api/mis-asistencias/) y viaje imposible. En
+            # PostgreSQL es covering: página y totales salen del índice sin tocar la tabla
+            models.Index(
+                fields=['trabajador', '-fecha', '-id'], name='asistencia_trab_fecha_id_idx',
+                include=['obra', 'hora_entrada', 'hora_salida', 'horas_trabajadas', 'monto_pago_dia', 'entrada_valida'],
+            ),
+            # Análisis de IPs por día (registro/fraude_ip.py)
+            models.Index(fields=['fecha', 'ip_registro'], name='asistencia_fecha_ip_idx'),
+            models.Index(fields=['fecha', 'red_registro'], name='asistencia_fecha_red_idx'),
+        ]
+
     def save(self, *args, **kwargs):
+        with medir(ASISTENCIA_SAVE, 'total'):
+            self._save_instrumentado(*args, **kwargs)
+
+    def _save_instrumentado(self, *args, **kwargs):
+        es_nueva = not self.pk
+
         # --- SEGURIDAD ANTI-FRAUDE: VIAJES IMPOSIBLES ---
         # Si es un registro nuevo, validamos que no se haya "teletransportado"
-        if not self.pk:
-            ultima_asistencia = Asistencia.objects.filter(
-                trabajador=self.trabajador
-            ).order_by('-fecha', '-hora_entrada').first()
+        if es_nueva:
+            # Parte válida; la velocidad o la geocerca la pueden invalidar abajo
+            self.entrada_valida = True
+
+            with medir(ASISTENCIA_SAVE, 'viaje_imposible'):
+                ultima_asistencia = Asistencia.objects.filter(
+                    trabajador=self.trabajador
+                ).order_by('-fecha', '-hora_entrada').first()
 
             if ultima_asistencia:
                 ahora = timezone.now()
@@ -127,44 +232,52 @@ class Asistencia(models.Model):
                 lon_ant = ultima_asistencia.longitud_salida or ultima_asistencia.longitud_entrada
 
                 if lat_ant and lon_ant:
-                    distancia_km = self.calcular_distancia(
-                        lat_ant, lon_ant, 
-                        self.latitud_entrada, self.longitud_entrada
-                    ) / 1000 
+                    with medir(ASISTENCIA_SAVE, 'haversine'):
+                        distancia_km = self.calcular_distancia(
+                            lat_ant, lon_ant, 
+                            self.latitud_entrada, self.longitud_entrada
+                        ) / 1000 
 
                     # REGLA: Si la velocidad es > 800 km/h, marcamos como inválido (fraude GPS)
                     if horas_diferencia > 0.1 and (distancia_km / horas_diferencia) > 800:
                         self.entrada_valida = False 
+                        RECHAZOS.incrementar(self.obra_id, 'velocidad')
         # --- FIN SEGURIDAD ---
 
         if not self.hora_entrada:
             self.hora_entrada = timezone.now().time()
 
-        dist_in = self.calcular_distancia(self.obra.latitud, self.obra.longitud, self.latitud_entrada, self.longitud_entrada)
-        
-        # Solo validamos radio si no fue marcado ya como fraude por velocidad
-        if getattr(self, 'entrada_valida', True): 
-            self.entrada_valida = dist_in <= self.obra.radio_permitido
+        self.red_registro = self.red_de_ip(self.ip_registro)
+
+        with medir(ASISTENCIA_SAVE, 'geocerca'):
+            # Solo validamos la geocerca si no fue marcado ya como fraude por velocidad
+            if getattr(self, 'entrada_valida', True): 
+                self.entrada_valida = self.obra.contiene(self.latitud_entrada, self.longitud_entrada)
+                if es_nueva and not self.entrada_valida:
+                    RECHAZOS.incrementar(self.obra_id, 'geocerca')
 
         if self.hora_salida:
-            dt_entrada = timezone.datetime.combine(self.fecha, self.hora_entrada)
-            dt_salida = timezone.datetime.combine(self.fecha, self.hora_salida)
-            
-            if timezone.is_naive(dt_entrada): dt_entrada = timezone.make_aware(dt_entrada)
-            if timezone.is_naive(dt_salida): dt_salida = timezone.make_aware(dt_salida)
+            with medir(ASISTENCIA_SAVE, 'salario'):
+                dt_entrada = timezone.datetime.combine(self.fecha, self.hora_entrada)
+                dt_salida = timezone.datetime.combine(self.fecha, self.hora_salida)
+                
+                if timezone.is_naive(dt_entrada): dt_entrada = timezone.make_aware(dt_entrada)
+                if timezone.is_naive(dt_salida): dt_salida = timezone.make_aware(dt_salida)
 
-            diferencia = dt_salida - dt_entrada
-            self.horas_trabajadas = Decimal(diferencia.total_seconds() / 3600)
-            
-            if self.horas_trabajadas >= 8:
-                 self.monto_pago_dia = self.trabajador.sueldo_diario
-            else:
-                 self.monto_pago_dia = self.trabajador.valor_hora * self.horas_trabajadas
+                diferencia = dt_salida - dt_entrada
+                self.horas_trabajadas = Decimal(diferencia.total_seconds() / 3600)
+                
+                if self.horas_trabajadas >= 8:
+                     self.monto_pago_dia = self.trabajador.sueldo_diario
+                else:
+                     self.monto_pago_dia = self.trabajador.valor_hora * self.horas_trabajadas
 
-        super().save(*args, **kwargs)
+        with medir(ASISTENCIA_SAVE, 'guardado'):
+            super().save(*args, **kwargs)
         
-        balance, created = BalanceObra.objects.get_or_create(obra=self.obra)
-        balance.actualizar_balance()
+        with medir(ASISTENCIA_SAVE, 'balance'):
+            balance, created = BalanceObra.objects.get_or_create(obra=self.obra)
+            balance.actualizar_balance()
 
     @staticmethod
     def calcular_distancia(lat1, lon1, lat2, lon2):
@@ -180,9 +293,83 @@ class Asistencia(models.Model):
         a = math.sin(delta_phi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2)**2
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         return R * c
+
+    @staticmethod
+    def red_de_ip(ip):
+        if not ip:
+            return None
+        try:
+            ip = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        return str(ipaddress.ip_network(f"{ip}/{24 if ip.version == 4 else 64}", strict=False))
     
     def __str__(self): return f"{self.fecha} - {self.trabajador}"
 
+class ArchivoAsistencia(models.Model):
+    # Resumen por obra de un mes de asistencias archivado en disco (gzip JSON Lines)
+    periodo = models.DateField(help_text="Primer día del mes archivado")
+    obra = models.ForeignKey(Obra, on_delete=models.CASCADE)
+    registros = models.PositiveIntegerField(default=0)
+    total_horas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_pagado = models.DecimalField(max_digits=15, decimal_places=0, default=0)
+    archivo = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64)
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'obra'], name='archivo_asistencia_periodo_obra'),
+        ]
+
+    def __str__(self): return f"{self.periodo:%Y-%m} - {self.obra} ({self.registros} registros)"
+
+class SospechaIP(models.Model):
+    # Una IP o subred desde la que marcaron muchos trabajadores distintos en poco tiempo
+    TIPOS = [('IP', 'IP'), ('RED', 'Subred')]
+    tipo = models.CharField(max_length=3, choices=TIPOS)
+    direccion = models.CharField(max_length=43)
+    fecha = models.DateField()
+    trabajadores = models.PositiveIntegerField(help_text="Máximo de trabajadores distintos dentro de la ventana")
+    registros = models.PositiveIntegerField(help_text="Marcas de ese día desde la IP o subred")
+    hora_desde = models.TimeField()
+    hora_hasta = models.TimeField()
+    obras = models.CharField(max_length=255, blank=True)
+    revisada = models.BooleanField(default=False)
+    fecha_deteccion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Sospecha de IP"
+        verbose_name_plural = "Sospechas de IP"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'direccion', 'fecha'], name='sospecha_ip_tipo_direccion_fecha'),
+        ]
+        indexes = [models.Index(fields=['-trabajadores', '-fecha'], name='sospecha_ip_ranking_idx')]
+
+    def __str__(self): return f"{self.get_tipo_display()} {self.direccion} ({self.fecha}): {self.trabajadores} trabajadores"
+
+class SubidaFoto(models.Model):
+    # Subida reanudable en curso (registro/subidas.py); los bytes están en SUBIDAS_DIR/<id>.part
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subidas_foto')
+    tamano = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    extension = models.CharField(max_length=5, default='.jpg')
+    recibido = models.PositiveIntegerField(default=0)
+    completada = models.BooleanField(default=False)
+    creada = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    def __str__(self): return f"{self.pk} ({self.recibido}/{self.tamano} bytes)"
+
+class MarcaAnalisis(models.Model):
+    # Marca de agua de los análisis incrementales: último id ya procesado
+    nombre = models.CharField(max_length=50, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    fecha_ejecucion = models.DateTimeField(auto_now=True)
+
+    def __str__(self): return f"{self.nombre}: hasta #{self.ultimo_id}"
+
 class ReporteImproductivo(models.Model):
     obra = models.ForeignKey(Obra, on_delete=models.CASCADE)
     jefe_obra = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, related_name='reportes_creados')
@@ -202,25 +389,66 @@ class ReporteImproductivo(models.Model):
     dinero_perdido = models.DecimalField(max_digits=12, decimal_places=0, default=0)
     leido = models.BooleanField(default=False, verbose_name="¿Leído por Admin?")
 
+    class Meta:
+        # Gráficos del admin con ventana de 30/90 días
+        indexes = [models.Index(fields=['fecha', 'obra'], name='reporte_fecha_obra_idx')]
+
     def calcular_impacto(self):
-        inicio = timezone.datetime.combine(self.fecha, self.hora_inicio)
-        fin = timezone.datetime.combine(self.fecha, self.hora_fin)
-        duracion_horas = Decimal((fin - inicio).total_seconds() / 3600)
-        
-        costo_total = 0
-        for trabajador in self.trabajadores_afectados.all():
-            costo_total += trabajador.valor_hora * duracion_horas
+        with medir(REPORTE_IMPACTO, 'total'):
+            inicio = timezone.datetime.combine(self.fecha, self.hora_inicio)
+            fin = timezone.datetime.combine(self.fecha, self.hora_fin)
+            duracion_horas = Decimal((fin - inicio).total_seconds() / 3600)
             
-        self.horas_perdidas_totales = duracion_horas
-        self.dinero_perdido = costo_total
-        self.save()
-        
-        balance, created = BalanceObra.objects.get_or_create(obra=self.obra)
-        balance.actualizar_balance()
+            costo_total = 0
+            with medir(REPORTE_IMPACTO, 'trabajadores'):
+                for trabajador in self.trabajadores_afectados.all():
+                    costo_total += trabajador.valor_hora * duracion_horas
+                
+            self.horas_perdidas_totales = duracion_horas
+            self.dinero_perdido = costo_total
+            with medir(REPORTE_IMPACTO, 'guardado'):
+                self.save()
+            
+            with medir(REPORTE_IMPACTO, 'balance'):
+                balance, created = BalanceObra.objects.get_or_create(obra=self.obra)
+                balance.actualizar_balance()
 
     def __str__(self): return f"Pérdida: ${self.dinero_perdido} - {self.motivo}"
 
 @receiver(m2m_changed, sender=ReporteImproductivo.trabajadores_afectados.through)
 def actualizar_costo_improductivo(sender, instance, action, **kwargs):
     if action in ["post_add", "post_remove", "post_clear"]:
-        instance.calcular_impacto()
\ No newline at end of file
+        instance.calcular_impacto()
+
+@receiver(post_save, sender=Perfil)
+def recalcular_sueldos_por_tarifa(sender, instance, created, **kwargs):
+    # Si cambió la tarifa, se recalcula el mes en curso (los meses anteriores
+    # ya se pagaron; para corregirlos usar la acción del admin)
+    if not created and instance.tarifas_cambiaron():
+        from .nomina import recalcular_sueldos
+        recalcular_sueldos([instance.pk], desde=timezone.now().date().replace(day=1))
+    instance._tarifas_originales = (instance.sueldo_diario, instance.valor_hora)
+
+# --- INVALIDACIÓN DEL CACHÉ DE AGREGADOS (registro/agregados.py) ---
+@receiver([post_save, post_delete], sender=Asistencia)
+@receiver([post_save, post_delete], sender=ReporteImproductivo)
+@receiver([post_save, post_delete], sender=BalanceObra)
+def invalidar_agregados(sender, instance, **kwargs):
+    from . import agregados
+    agregados.invalidar_obra(instance.obra_id)
+
+@receiver([post_save, post_delete], sender=Obra)
+def invalidar_agregados_obra(sender, instance, **kwargs):
+    from . import agregados
+    agregados.invalidar_obra(instance.pk)
+
+@receiver(m2m_changed, sender=ReporteImproductivo.trabajadores_afectados.through)
+def invalidar_agregados_afectados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    from . import agregados
+    if not reverse:
+        agregados.invalidar_obra(instance.obra_id)
+    elif pk_set:
+        for obra_id in set(ReporteImproductivo.objects.filter(pk__in=pk_set).values_list('obra_id', flat=True)):
+            agregados.invalidar_obra(obra_id)
@@ -0,0 +1,105 @@
+"""
+Motor de nómina: totales por trabajador y obra para un período, calculados
+con una sola query agrupada, y recálculo masivo de sueldos cuando cambian
+las tarifas de un trabajador.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Round
+
+from .models import Asistencia, BalanceObra, Perfil
+
+CAMPOS_CSV = [
+    'rut', 'nombre', 'obra', 'dias', 'turnos', 'turnos_abiertos', 'horas',
+    'monto', 'dias_gps_invalido', 'monto_gps_invalido', 'monto_a_pagar',
+]
+
+
+def calcular_nomina(desde=None, hasta=None, obras=None, base=None, excluir_gps_invalido=False):
+    """
+    Devuelve una fila (dict) por trabajador y obra. Los días con entrada fuera
+    de la geocerca siempre se informan; con excluir_gps_invalido=True además
+    se descuentan de monto_a_pagar.
+    """
+    qs = base if base is not None else Asistencia.objects.all()
+    if desde:
+        qs = qs.filter(fecha__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__lte=hasta)
+    if obras is not None:
+        qs = qs.filter(obra__in=obras)
+
+    invalida = Q(entrada_valida=False)
+    filas = qs.values(
+        'trabajador', 'trabajador__rut', 'trabajador__usuario__first_name',
+        'trabajador__usuario__last_name', 'obra', 'obra__nombre',
+    ).annotate(
+        dias=Count('fecha', distinct=True),
+        turnos=Count('id'),
+        turnos_abiertos=Count('id', filter=Q(hora_salida__isnull=True)),
+        horas=Sum('horas_trabajadas'),
+        monto=Sum('monto_pago_dia'),
+        dias_gps_invalido=Count('fecha', filter=invalida, distinct=True),
+        monto_gps_invalido=Sum('monto_pago_dia', filter=invalida),
+    ).order_by('obra__nombre', 'trabajador__rut')
+
+    resultado = []
+    for f in filas:
+        monto = f['monto'] or Decimal(0)
+        monto_invalido = f['monto_gps_invalido'] or Decimal(0)
+        resultado.append({
+            'trabajador_id': f['trabajador'],
+            'rut': f['trabajador__rut'],
+            'nombre': f"{f['trabajador__usuario__first_name']} {f['trabajador__usuario__last_name']}".strip(),
+            'obra_id': f['obra'],
+            'obra': f['obra__nombre'],
+            'dias': f['dias'],
+            'turnos': f['turnos'],
+            'turnos_abiertos': f['turnos_abiertos'],
+            'horas': f['horas'] or Decimal(0),
+            'monto': monto,
+            'dias_gps_invalido': f['dias_gps_invalido'],
+            'monto_gps_invalido': monto_invalido,
+            'monto_a_pagar': monto - monto_invalido if excluir_gps_invalido else monto,
+        })
+    return resultado
+
+
+def totales(filas):
+    return {
+        'trabajadores': len({f['trabajador_id'] for f in filas}),
+        'horas': sum((f['horas'] for f in filas), Decimal(0)),
+        'monto': sum((f['monto'] for f in filas), Decimal(0)),
+        'monto_a_pagar': sum((f['monto_a_pagar'] for f in filas), Decimal(0)),
+    }
+
+
+def recalcular_sueldos(trabajadores, desde=None, hasta=None):
+    """
+    Recalcula monto_pago_dia de los turnos cerrados con la tarifa ACTUAL de
+    cada trabajador, en un solo UPDATE (misma regla que Asistencia.save():
+    sueldo_diario si trabajó 8 horas o más, si no valor_hora * horas).
+    Después actualiza una vez el balance de cada obra afectada.
+    Devuelve la cantidad de asistencias recalculadas.
+    """
+    qs = Asistencia.objects.filter(trabajador__in=trabajadores, hora_salida__isnull=False)
+    if desde:
+        qs = qs.filter(fecha__gte=desde)
+    if hasta:
+        qs = qs.filter(fecha__lte=hasta)
+
+    tarifa = Perfil.objects.filter(pk=OuterRef('trabajador_id'))
+    monto = Case(
+        When(horas_trabajadas__gte=8, then=Subquery(tarifa.values('sueldo_diario')[:1])),
+        default=Round(Subquery(tarifa.values('valor_hora')[:1]) * F('horas_trabajadas')),
+        output_field=DecimalField(max_digits=10, decimal_places=0),
+    )
+
+    obras = list(qs.values_list('obra', flat=True).distinct().order_by())
+    actualizadas = qs.update(monto_pago_dia=monto)
+
+    for obra_id in obras:
+        balance, _ = BalanceObra.objects.get_or_create(obra_id=obra_id)
+        balance.actualizar_balance()
+    return actualizadas
@@ -0,0 +1,71 @@
+"""
+Paginación para tablas grandes: conteos estimados en vez de COUNT(*) completo
+y cursores keyset sobre (fecha, id) para avanzar sin OFFSET.
+"""
+from datetime import date
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def codificar_cursor(fecha, pk):
+    return f"{fecha.isoformat()}_{pk}"
+
+
+def decodificar_cursor(texto):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    try:
+        fecha, pk = (texto or '').split('_')
+        return date.fromisoformat(fecha), int(pk)
+    except ValueError:
+        return None
+
+
+def despues_del_cursor(queryset, cursor, campo_fecha='fecha'):
+    """Filtra las filas que vienen después del cursor en orden (-fecha, -id)."""
+    fecha, pk = cursor
+    return queryset.filter(
+        Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, 'pk__lt': pk})
+    )
+
+
+def estimar_filas(tabla, using='default'):
+    """
+    Estimación de PostgreSQL (pg_class.reltuples), sumando las particiones si
+    la tabla está particionada. Devuelve None en otros motores.
+    """
+    conexion = connections[using]
+    if conexion.vendor != 'postgresql':
+        return None
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint FROM pg_class c "
+            "WHERE c.oid = to_regclass(%s) "
+            "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))",
+            [tabla, tabla],
+        )
+        return cursor.fetchone()[0]
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Sin filtros usa la estimación del motor; con filtros cuenta como máximo
+    TOPE filas (COUNT sobre un subquery con LIMIT), así nunca recorre la
+    tabla completa solo para dibujar el paginador.
+    """
+    TOPE = 10000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        self.es_estimado = False
+        if not qs.query.where:
+            estimado = estimar_filas(qs.model._meta.db_table, qs.db)
+            if estimado and estimado > self.TOPE:
+                self.es_estimado = True
+                return estimado
+        total = qs[:self.TOPE].count()
+        self.es_estimado = total >= self.TOPE
+        return total
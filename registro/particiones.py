@@ -0,0 +1,88 @@
+"""
+Particionado mensual (RANGE por fecha) de registro_asistencia en PostgreSQL.
+
+La conversión de la tabla la hace la migración 0008. Estas funciones crean las
+particiones de los meses que vienen y eliminan las de meses ya archivados.
+En SQLite la tabla es plana y todo esto se omite.
+"""
+from datetime import date
+
+from django.db import connections, transaction
+
+TABLA = 'registro_asistencia'
+PARTICION_DEFAULT = f'{TABLA}_default'
+
+
+def inicio_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def mes_siguiente(inicio):
+    return date(inicio.year + (inicio.month == 12), inicio.month % 12 + 1, 1)
+
+
+def nombre_particion(inicio):
+    return f'{TABLA}_p{inicio:%Y%m}'
+
+
+def es_particionada(using='default'):
+    conexion = connections[using]
+    if conexion.vendor != 'postgresql':
+        return False
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLA])
+        fila = cursor.fetchone()
+    return bool(fila) and fila[0] == 'p'
+
+
+def existe_particion(cursor, inicio):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [nombre_particion(inicio)])
+    return cursor.fetchone()[0]
+
+
+def crear_particion_mes(cursor, inicio):
+    """
+    Crea la partición del mes si falta. Las filas de ese mes que hayan caído en
+    la partición default se mueven antes del ATTACH (si no, PostgreSQL lo rechaza).
+    """
+    if existe_particion(cursor, inicio):
+        return False
+    nombre = nombre_particion(inicio)
+    desde, hasta = inicio.isoformat(), mes_siguiente(inicio).isoformat()
+    cursor.execute(f'CREATE TABLE {nombre} (LIKE {TABLA} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH movidas AS (DELETE FROM {PARTICION_DEFAULT} WHERE fecha >= %s AND fecha < %s RETURNING *) '
+        f'INSERT INTO {nombre} SELECT * FROM movidas',
+        [desde, hasta],
+    )
+    cursor.execute(f"ALTER TABLE {TABLA} ATTACH PARTITION {nombre} FOR VALUES FROM ('{desde}') TO ('{hasta}')")
+    return True
+
+
+def asegurar_particiones(meses_adelante=3, desde=None, using='default'):
+    """Crea las particiones desde `desde` (por defecto el mes actual) hasta N meses adelante."""
+    if not es_particionada(using):
+        return []
+    creadas = []
+    inicio = inicio_mes(desde or date.today())
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for _ in range(meses_adelante + 1):
+            if crear_particion_mes(cursor, inicio):
+                creadas.append(nombre_particion(inicio))
+            inicio = mes_siguiente(inicio)
+    return creadas
+
+
+def eliminar_particion_mes(inicio, using='default'):
+    """
+    Borra de golpe la partición de un mes ya archivado. Devuelve False si la
+    tabla no está particionada o el mes no tiene partición propia (en ese caso
+    el llamador borra las filas con un DELETE normal).
+    """
+    if not es_particionada(using):
+        return False
+    with connections[using].cursor() as cursor:
+        if not existe_particion(cursor, inicio):
+            return False
+        cursor.execute(f'DROP TABLE {nombre_particion(inicio)}')
+    return True
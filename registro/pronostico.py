@@ -0,0 +1,190 @@
+"""
+Pronóstico del gasto de cada obra (columnas de proyección del admin de
+BalanceObra y /v1/api/pronosticos/).
+
+El promedio de toda la vida de la obra no ve tendencias, trata igual un
+lunes que un domingo y tarda meses en notar un incidente. Acá, por obra:
+  1. Serie diaria del gasto (sueldos + pérdidas por incidentes) de las
+     últimas VENTANA_DIAS con datos vivos (lo archivado ya no está en la tabla).
+  2. Factor por día de la semana (domingo ~0, sábado medio día...).
+  3. Recta por mínimos cuadrados ponderados sobre la serie sin estacionalidad,
+     con pesos que decaen a la mitad cada VIDA_MEDIA_DIAS: lo reciente manda.
+  4. Proyección día a día con la tendencia amortiguada (AMORTIGUACION) y una
+     banda de ±Z desviaciones de los residuos acumulados.
+De ahí salen el costo final estimado (con banda), el día en que se acaba la
+caja (temprano/estimado/tarde) y la diferencia contra el presupuesto.
+
+Son 2 queries (GROUP BY obra, fecha) para todas las obras que falten en el
+caché. Cada pronóstico se guarda con la versión de su obra (registro/agregados.py),
+así que dura hasta que entra una marca, un incidente o cambia el balance. Eso
+vale con un caché compartido; con LocMemCache dura a lo más AGREGADOS_TTL.
+Sin NumPy: con un par de cientos de puntos por obra las sumas en Python alcanzan.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import agregados
+from .models import Asistencia, ReporteImproductivo
+from .replicas import en_primaria
+
+VENTANA_DIAS = 120
+VIDA_MEDIA_DIAS = 28
+AMORTIGUACION = 0.98     # la pendiente pierde 2 % por día proyectado
+Z = 1.2816               # banda del 80 %
+DIAS_EXTRA = 365         # cuánto después del término se sigue buscando el fin de la caja
+MINIMO_SEMANAS = 2       # con menos historia no hay factores por día de semana
+
+
+def _ttl():
+    # Con un caché por proceso la versión de la obra no se entera de lo que escriben
+    # los otros workers: ahí el pronóstico dura lo mismo que los agregados
+    if not agregados.cache_compartido():
+        return min(getattr(settings, 'PRONOSTICO_TTL', 24 * 3600), getattr(settings, 'AGREGADOS_TTL', 300))
+    return getattr(settings, 'PRONOSTICO_TTL', 24 * 3600)
+
+
+def series(obra_ids, desde, hasta):
+    """{obra_id: {fecha: gasto}} con sueldos e incidentes entre `desde` y `hasta`."""
+    gasto = defaultdict(lambda: defaultdict(float))
+    for modelo, campo in ((Asistencia, 'monto_pago_dia'), (ReporteImproductivo, 'dinero_perdido')):
+        filas = modelo.objects.filter(obra_id__in=obra_ids, fecha__range=(desde, hasta)) \
+            .values('obra', 'fecha').annotate(total=Sum(campo)).order_by()
+        for f in filas:
+            gasto[f['obra']][f['fecha']] += float(f['total'] or 0)
+    return gasto
+
+
+def ajustar(diaria, primer_dia):
+    """
+    Modelo de una serie diaria (lista de gastos desde `primer_dia`, sin huecos):
+    factores por día de semana, nivel y pendiente al último día, y desviación de
+    los residuos. None si la obra no ha gastado nada.
+    """
+    n = len(diaria)
+    media = sum(diaria) / n if n else 0
+    if media <= 0:
+        return None
+
+    factores = [1.0] * 7
+    if n >= 7 * MINIMO_SEMANAS:
+        por_dia = [[] for _ in range(7)]
+        for t, y in enumerate(diaria):
+            por_dia[(primer_dia.weekday() + t) % 7].append(y)
+        factores = [sum(v) / len(v) / media for v in por_dia]
+
+    # Mínimos cuadrados ponderados sobre el gasto sin estacionalidad.
+    # Los días sin trabajo (factor 0) no aportan información de nivel.
+    puntos = []
+    for t, y in enumerate(diaria):
+        f = factores[(primer_dia.weekday() + t) % 7]
+        if f > 0:
+            puntos.append((t, y / f, 0.5 ** ((n - 1 - t) / VIDA_MEDIA_DIAS)))
+    peso = sum(w for _, _, w in puntos)
+    t_medio = sum(w * t for t, _, w in puntos) / peso
+    z_medio = sum(w * z for _, z, w in puntos) / peso
+    varianza_t = sum(w * (t - t_medio) ** 2 for t, _, w in puntos)
+    pendiente = sum(w * (t - t_medio) * (z - z_medio) for t, z, w in puntos) / varianza_t if varianza_t else 0.0
+    corte = z_medio - pendiente * t_medio
+    sigma = math.sqrt(sum(w * (z - corte - pendiente * t) ** 2 for t, z, w in puntos) / peso)
+    return {
+        'factores': factores,
+        'nivel': corte + pendiente * (n - 1),
+        'pendiente': pendiente,
+        'sigma': sigma,
+    }
+
+
+def proyectar(modelo, balance, hoy):
+    """Costo final, fin de la caja y diferencia con el presupuesto de un balance."""
+    obra = balance.obra
+    gastado = float(balance.total_pagado_sueldos + balance.total_perdido_improductivo + balance.total_multas_proyectadas)
+    caja = float(balance.presupuesto_restante)
+    termino = max(obra.fecha_termino_estimada, hoy - timedelta(days=1))
+
+    # Día a día con índices enteros (fechas solo al final): son cientos de días por obra
+    factores, nivel, pendiente, sigma = modelo['factores'], modelo['nivel'], modelo['pendiente'], modelo['sigma']
+    dias_obra = (termino - hoy).days + 1
+    total_dias = dias_obra + DIAS_EXTRA
+    semana = hoy.weekday()
+    acumulado = varianza = tendencia = 0.0
+    costo = None
+    # temprano <= estimado <= tarde: se buscan en ese orden, índice del día en que se cruza la caja
+    cruces = [0, 0, 0] if caja <= 0 else []
+    for k in range(total_dias):
+        if k == dias_obra:
+            costo = acumulado, math.sqrt(varianza)
+            if len(cruces) == 3:
+                break
+        tendencia = (tendencia + pendiente) * AMORTIGUACION
+        f = factores[(semana + k) % 7]
+        acumulado += max(0.0, nivel + tendencia) * f
+        varianza += (sigma * f) ** 2
+        banda = Z * math.sqrt(varianza)
+        while len(cruces) < 3 and acumulado + banda * (1 - len(cruces)) >= caja:
+            cruces.append(k)
+    if costo is None:
+        costo = acumulado, math.sqrt(varianza)
+    fechas = [hoy + timedelta(days=k) for k in cruces] + [None] * (3 - len(cruces))
+    agotamiento = dict(zip(('temprano', 'estimado', 'tarde'), fechas))
+
+    futuro, desviacion = costo
+    estimado = gastado + futuro
+    return {
+        'obra_id': obra.pk,
+        'calculado': hoy,
+        'gasto_diario': round(nivel, 0),
+        'tendencia_diaria': round(pendiente, 2),
+        'costo_final': {
+            'estimado': round(estimado),
+            'bajo': round(max(gastado, estimado - Z * desviacion)),
+            'alto': round(estimado + Z * desviacion),
+        },
+        'diferencia': round(float(obra.presupuesto_total) - estimado),
+        'agotamiento': agotamiento,
+        'dias_caja': (agotamiento['estimado'] - hoy).days if agotamiento['estimado'] else None,
+    }
+
+
+def _calcular(balances, hoy):
+    ayer = hoy - timedelta(days=1)
+    desde = ayer - timedelta(days=VENTANA_DIAS - 1)
+    gasto = series([b.obra_id for b in balances], desde, ayer)
+    resultado = {}
+    for balance in balances:
+        dias = gasto.get(balance.obra_id)
+        # Desde el primer día con datos vivos (o el inicio de la obra, si fue después)
+        primer_dia = max(min(dias) if dias else hoy, balance.obra.fecha_inicio, desde)
+        diaria = [dias.get(primer_dia + timedelta(days=t), 0.0) for t in range((ayer - primer_dia).days + 1)] if dias else []
+        modelo = ajustar(diaria, primer_dia)
+        resultado[balance.obra_id] = proyectar(modelo, balance, hoy) if modelo else None
+    return resultado
+
+
+def para_balances(balances):
+    """
+    {obra_id: pronóstico o None (sin gasto todavía)} de los BalanceObra dados
+    (con select_related('obra')). Lo que no está en caché se calcula en bloque.
+    """
+    balances = list(balances)
+    # Día local: con el de UTC, desde las ~21:00 el día en curso (a medias) pasaba a
+    # ser `ayer`, el punto con más peso de la recta
+    hoy = timezone.localdate()
+    versiones = agregados.versiones([b.obra_id for b in balances])
+    claves = {b.obra_id: f'agregados:{b.obra_id}:{versiones[b.obra_id]}:pronostico:{hoy}' for b in balances}
+    en_cache = cache.get_many(list(claves.values()))
+    resultado = {obra_id: en_cache[clave] for obra_id, clave in claves.items() if clave in en_cache}
+
+    faltan = [b for b in balances if b.obra_id not in resultado]
+    if faltan:
+        # Se guarda bajo la versión actual: no puede salir de una réplica atrasada
+        with en_primaria():
+            nuevos = _calcular(faltan, hoy)
+        cache.set_many({claves[obra_id]: p for obra_id, p in nuevos.items()}, timeout=_ttl())
+        resultado.update(nuevos)
+    return resultado
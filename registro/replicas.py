@@ -0,0 +1,108 @@
+"""
+Ruteo opcional de lecturas pesadas a una réplica de solo lectura.
+
+Nada va a la réplica por defecto: cada vista o export lo pide explícitamente
+con `en_replica()` o `@lecturas_en_replica`. Dentro de ese bloque, apenas hay
+una escritura (o una transacción abierta en la primaria) el resto de las
+lecturas vuelve a la primaria para leer lo recién escrito, y si la réplica va
+más atrasada que REPLICA_LAG_MAXIMO segundos también se lee de la primaria.
+
+Sin DATABASE_REPLICA_URL el alias no existe y todo queda en 'default'; con
+REPLICA_LECTURAS = False tampoco se lee de la réplica aunque exista.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+_estado = ContextVar('registro_replica', default=None)
+_lag_cache = {'hasta': 0.0, 'lag': 0.0}
+
+
+def replica_configurada():
+    return REPLICA in settings.DATABASES and getattr(settings, 'REPLICA_LECTURAS', True)
+
+
+@contextmanager
+def en_replica():
+    token = _estado.set({'escribio': False})
+    try:
+        yield
+    finally:
+        _estado.reset(token)
+
+
+@contextmanager
+def en_primaria():
+    """Dentro de un en_replica(), vuelve a leer de la primaria (para lo que se guarda en caché)."""
+    token = _estado.set(None)
+    try:
+        yield
+    finally:
+        _estado.reset(token)
+
+
+def lecturas_en_replica(view_func):
+    # Va DEBAJO de login_required: la sesión y el usuario se leen de la primaria
+    @wraps(view_func)
+    def wrapper_func(*args, **kwargs):
+        with en_replica():
+            return view_func(*args, **kwargs)
+    return wrapper_func
+
+
+def lag_replica():
+    """
+    Segundos de atraso de la réplica (0 si no es PostgreSQL en recuperación).
+    Se consulta como mucho cada REPLICA_LAG_CACHE segundos.
+    """
+    ahora = time.monotonic()
+    if ahora < _lag_cache['hasta']:
+        return _lag_cache['lag']
+    lag = 0.0
+    conexion = connections[REPLICA]
+    if conexion.vendor == 'postgresql':
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN pg_is_in_recovery() "
+                "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+            )
+            lag = float(cursor.fetchone()[0])
+    _lag_cache.update(hasta=ahora + getattr(settings, 'REPLICA_LAG_CACHE', 5), lag=lag)
+    return lag
+
+
+def replica_al_dia():
+    return lag_replica() <= getattr(settings, 'REPLICA_LAG_MAXIMO', 10)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or estado['escribio'] or not replica_configurada():
+            return None
+        # Dentro de una transacción abierta en la primaria se lee de ella (ve sus propios cambios)
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPLICA if replica_al_dia() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado['escribio'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplica tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las migraciones se aplican en la primaria; la réplica las recibe por replicación.
+        # Una réplica SQLite es un archivo aparte sin replicación: necesita sus tablas
+        return db != REPLICA or connections[db].vendor == 'sqlite'
@@ -0,0 +1,278 @@
+"""
+Reporte mensual por obra en PDF: balance, sueldos, incidentes, multas y
+cumplimiento de asistencia.
+
+Cada sección sale de una query agrupada (nada de recorrer filas en Python).
+El PDF queda en REPORTES_DIR con una huella de los datos en el nombre: si
+nada cambió, pedir el reporte de nuevo es leer un archivo. La huella sale de
+los mismos totales del reporte (conteos, sumas y máximos de id), así que
+cualquier marca, corrección o incidente hasta el cierre del mes genera un
+PDF nuevo, y los meses cerrados se generan una sola vez.
+
+`generar_todos` arma el mes de todas las obras en un pool de procesos
+(ReportLab es CPU puro: con hilos no se gana nada por el GIL).
+"""
+import calendar
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Q, Sum
+
+from . import nomina
+from .models import ArchivoAsistencia, Asistencia, Obra, ReporteImproductivo
+
+# Subirlo cuando cambie el diseño del PDF: invalida todo lo cacheado
+FORMATO = 1
+
+
+def directorio():
+    return getattr(settings, 'REPORTES_DIR', os.path.join(settings.BASE_DIR, 'reportes'))
+
+
+def periodo(anio, mes):
+    return date(anio, mes, 1), date(anio, mes, calendar.monthrange(anio, mes)[1])
+
+
+def totales(obra, desde, hasta):
+    """
+    Totales del mes y acumulados al cierre del período (3 queries). Sirven
+    para la sección de balance y, sin más queries, para la huella.
+    """
+    del_mes = Q(fecha__gte=desde)
+    asistencias = Asistencia.objects.filter(obra=obra, fecha__lte=hasta).aggregate(
+        turnos=Count('id', filter=del_mes), ultimo=Max('id', filter=del_mes),
+        horas=Sum('horas_trabajadas', filter=del_mes), monto=Sum('monto_pago_dia', filter=del_mes),
+        validas=Count('id', filter=del_mes & Q(entrada_valida=True)),
+        cerradas=Count('hora_salida', filter=del_mes),
+        sueldos_acumulados=Sum('monto_pago_dia'),
+    )
+    reportes = ReporteImproductivo.objects.filter(obra=obra, fecha__lte=hasta).aggregate(
+        incidentes=Count('id', filter=del_mes), ultimo_reporte=Max('id', filter=del_mes),
+        perdido=Sum('dinero_perdido', filter=del_mes), horas_perdidas=Sum('horas_perdidas_totales', filter=del_mes),
+        dias_retraso=Sum('dias_retraso_obra', filter=del_mes),
+        perdido_acumulado=Sum('dinero_perdido'), dias_acumulados=Sum('dias_retraso_obra'),
+    )
+    archivos = ArchivoAsistencia.objects.filter(obra=obra, periodo__lte=desde).aggregate(
+        archivado=Sum('total_pagado'), archivado_mes=Max('sha256', filter=Q(periodo=desde)),
+    )
+    resultado = {**asistencias, **reportes, **archivos}
+    for campo in ('horas', 'monto', 'sueldos_acumulados', 'perdido', 'horas_perdidas', 'dias_retraso',
+                  'perdido_acumulado', 'dias_acumulados', 'archivado'):
+        resultado[campo] = resultado[campo] or Decimal(0)
+    return resultado
+
+
+def huella(obra, totales_periodo):
+    """Versión de los datos del reporte: cambia con cualquier marca, corrección o incidente hasta el cierre."""
+    partes = [FORMATO, sorted(totales_periodo.items()), obra.nombre, obra.presupuesto_total, obra.valor_multa_dia]
+    return hashlib.sha256(repr(partes).encode()).hexdigest()[:16]
+
+
+def calcular(obra, desde, hasta, totales_periodo):
+    """Datos de todas las secciones del reporte."""
+    t = totales_periodo
+    filas = nomina.calcular_nomina(desde, hasta, obras=[obra.pk])
+    incidentes = list(
+        ReporteImproductivo.objects.filter(obra=obra, fecha__range=(desde, hasta)).order_by('fecha')
+        .values_list('fecha', 'motivo', 'horas_perdidas_totales', 'dinero_perdido', 'dias_retraso_obra')
+    )
+
+    # Cumplimiento: un grupo por día
+    por_dia = list(Asistencia.objects.filter(obra=obra, fecha__range=(desde, hasta)).values('fecha').annotate(
+        presentes=Count('trabajador', distinct=True),
+        validas=Count('id', filter=Q(entrada_valida=True)),
+    ).order_by('fecha'))
+
+    # Balance al cierre del período, con la misma regla que BalanceObra.actualizar_balance
+    sueldos = t['sueldos_acumulados'] + t['archivado']
+    multas = t['dias_acumulados'] * obra.valor_multa_dia
+    restante = obra.presupuesto_total - sueldos - t['perdido_acumulado'] - multas
+
+    return {
+        'obra': obra.nombre,
+        'desde': desde,
+        'hasta': hasta,
+        'balance': {
+            'presupuesto': obra.presupuesto_total, 'sueldos': sueldos, 'perdido': t['perdido_acumulado'],
+            'multas': multas, 'restante': restante,
+            'rentable': restante > obra.presupuesto_total * Decimal('0.10'),
+        },
+        'sueldos': filas,
+        'totales_sueldos': nomina.totales(filas),
+        'archivado': ArchivoAsistencia.objects.filter(obra=obra, periodo=desde).first() if t['archivado_mes'] else None,
+        'incidentes': incidentes,
+        'perdido': t['perdido'],
+        'horas_perdidas': t['horas_perdidas'],
+        'dias_retraso': t['dias_retraso'],
+        'multas': t['dias_retraso'] * obra.valor_multa_dia,
+        'por_dia': por_dia,
+        'turnos': t['turnos'],
+        'pct_validas': _porcentaje(t['validas'], t['turnos']),
+        'pct_cerradas': _porcentaje(t['cerradas'], t['turnos']),
+    }
+
+
+def _porcentaje(parte, total):
+    return round(100 * parte / total, 1) if total else None
+
+
+def _pesos(valor):
+    return f"${int(valor or 0):,}".replace(',', '.')
+
+
+def renderizar(datos):
+    """PDF (bytes) con las secciones de `datos`."""
+    # ReportLab se importa recién acá (ver benchmarks/arranque.py)
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    estilos = getSampleStyleSheet()
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ])
+
+    def tabla(filas):
+        t = Table(filas, repeatRows=1)
+        t.setStyle(estilo_tabla)
+        return t
+
+    def seccion(titulo):
+        return [Spacer(1, 12), Paragraph(titulo, estilos['Heading2'])]
+
+    elementos = [
+        Paragraph(f"Reporte mensual: {datos['obra']}", estilos['Title']),
+        Paragraph(f"Período {datos['desde']:%d-%m-%Y} al {datos['hasta']:%d-%m-%Y}", estilos['Normal']),
+    ]
+
+    # 1. Balance acumulado al cierre del período
+    balance = datos['balance']
+    elementos += seccion("Balance al cierre del período")
+    elementos.append(tabla([
+        ['Presupuesto', 'Sueldos', 'Pérdidas', 'Multas', 'Restante', 'Rentable'],
+        [_pesos(balance['presupuesto']), _pesos(balance['sueldos']), _pesos(balance['perdido']),
+         _pesos(balance['multas']), _pesos(balance['restante']), 'Sí' if balance['rentable'] else 'No'],
+    ]))
+
+    # 2. Sueldos del mes
+    elementos += seccion("Sueldos del mes")
+    if datos['sueldos']:
+        filas = [['RUT', 'Nombre', 'Días', 'Horas', 'Monto', 'Días GPS inválido']]
+        filas += [[f['rut'], f['nombre'], f['dias'], f['horas'], _pesos(f['monto']), f['dias_gps_invalido']] for f in datos['sueldos']]
+        suma = datos['totales_sueldos']
+        filas.append(['Total', f"{suma['trabajadores']} trabajadores", '', suma['horas'], _pesos(suma['monto']), ''])
+        elementos.append(tabla(filas))
+    elif datos['archivado']:
+        archivado = datos['archivado']
+        elementos.append(Paragraph(
+            f"Mes archivado: {archivado.registros} registros, {archivado.total_horas} horas, "
+            f"{_pesos(archivado.total_pagado)} pagados.", estilos['Normal']))
+    else:
+        elementos.append(Paragraph("Sin asistencias en el período.", estilos['Normal']))
+
+    # 3. Incidentes y multas
+    elementos += seccion("Incidentes y multas")
+    if datos['incidentes']:
+        filas = [['Fecha', 'Motivo', 'Horas perdidas', 'Dinero perdido', 'Días de atraso']]
+        filas += [[f"{fecha:%d-%m}", motivo[:60], horas, _pesos(dinero), dias] for fecha, motivo, horas, dinero, dias in datos['incidentes']]
+        elementos.append(tabla(filas))
+    elementos.append(Paragraph(
+        f"{len(datos['incidentes'])} incidentes, {datos['horas_perdidas']} horas y {_pesos(datos['perdido'])} perdidos. "
+        f"{datos['dias_retraso']} días de atraso: {_pesos(datos['multas'])} en multas proyectadas.", estilos['Normal']))
+
+    # 4. Cumplimiento de asistencia
+    elementos += seccion("Cumplimiento de asistencia")
+    elementos.append(Paragraph(
+        f"{datos['turnos']} turnos en {len(datos['por_dia'])} días. "
+        f"Entradas dentro de la geocerca: {datos['pct_validas'] if datos['pct_validas'] is not None else '-'}%. "
+        f"Turnos con salida registrada: {datos['pct_cerradas'] if datos['pct_cerradas'] is not None else '-'}%.",
+        estilos['Normal']))
+    if datos['por_dia']:
+        grafico = Drawing(480, 160)
+        barras = VerticalBarChart()
+        barras.x, barras.y, barras.width, barras.height = 30, 20, 440, 120
+        barras.data = [[d['presentes'] for d in datos['por_dia']], [d['validas'] for d in datos['por_dia']]]
+        barras.categoryAxis.categoryNames = [f"{d['fecha']:%d}" for d in datos['por_dia']]
+        barras.categoryAxis.labels.fontSize = 6
+        barras.valueAxis.valueMin = 0
+        barras.bars[0].fillColor = colors.grey
+        barras.bars[1].fillColor = colors.green
+        grafico.add(barras)
+        elementos.append(grafico)
+        elementos.append(Paragraph("Gris: trabajadores presentes por día. Verde: entradas válidas.", estilos['Normal']))
+
+    elementos += [Spacer(1, 24), Paragraph("Generado por Sistema Subcontractor App", estilos['Normal'])]
+
+    salida = io.BytesIO()
+    SimpleDocTemplate(salida, pagesize=letter, title=f"Reporte {datos['obra']}").build(elementos)
+    return salida.getvalue()
+
+
+def ruta(obra_id, desde, version):
+    return os.path.join(directorio(), f"obra-{obra_id}", f"{desde:%Y-%m}-{version}.pdf")
+
+
+def generar(obra, anio, mes, forzar=False):
+    """Devuelve (ruta del PDF, True si ya estaba en caché)."""
+    desde, hasta = periodo(anio, mes)
+    totales_periodo = totales(obra, desde, hasta)
+    destino = ruta(obra.pk, desde, huella(obra, totales_periodo))
+    if os.path.exists(destino) and not forzar:
+        return destino, True
+
+    pdf = renderizar(calcular(obra, desde, hasta, totales_periodo))
+    carpeta = os.path.dirname(destino)
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(pdf)
+    os.replace(temporal, destino)  # atómico: nadie lee un PDF a medio escribir
+
+    # Las versiones anteriores del mismo mes ya no sirven
+    prefijo = f"{desde:%Y-%m}-"
+    for nombre in os.listdir(carpeta):
+        if nombre.startswith(prefijo) and nombre.endswith('.pdf') and os.path.join(carpeta, nombre) != destino:
+            os.remove(os.path.join(carpeta, nombre))
+    return destino, False
+
+
+def _iniciar_proceso():
+    # Con spawn el proceso hijo parte sin Django; con fork ya viene configurado
+    import django
+    django.setup()
+
+
+def _generar_por_id(obra_id, anio, mes, forzar):
+    obra = Obra.objects.get(pk=obra_id)
+    destino, en_cache = generar(obra, anio, mes, forzar)
+    return obra_id, destino, en_cache
+
+
+def generar_todos(anio, mes, obras=None, procesos=None, forzar=False):
+    """
+    Genera el reporte del mes de cada obra. Devuelve [(obra_id, ruta, en_caché)].
+    Con procesos=1 corre en el mismo proceso (tests, SQLite en memoria).
+    """
+    obras = obras if obras is not None else Obra.objects.all()
+    ids = list(obras.order_by('id').values_list('id', flat=True))
+    if procesos == 1 or len(ids) <= 1:
+        return [_generar_por_id(obra_id, anio, mes, forzar) for obra_id in ids]
+
+    # Las conexiones abiertas no se pueden compartir con los procesos hijos
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        futuros = [pool.submit(_generar_por_id, obra_id, anio, mes, forzar) for obra_id in ids]
+        return [futuro.result() for futuro in futuros]
@@ -5,7 +5,25 @@ from .models import Obra, Asistencia
 class ObraSerializer(serializers.ModelSerializer):
     class Meta:
         model = Obra
-        fields = ['id', 'nombre', 'direccion', 'latitud', 'longitud', 'radio_permitido']
+        fields = ['id', 'nombre', 'direccion', 'latitud', 'longitud', 'radio_permitido', 'poligono']
+
+# Versión compacta para conexiones lentas (?formato=compacto o X-Formato: compacto):
+# claves de una o dos letras y coordenadas como números con 6 decimales (~10 cm)
+DECIMALES_COORDENADA = 6
+
+def _coordenada(valor):
+    return round(float(valor), DECIMALES_COORDENADA)
+
+class ObraCompactaSerializer(serializers.BaseSerializer):
+    def to_representation(self, obra):
+        datos = {
+            'i': obra.id, 'n': obra.nombre,
+            'la': _coordenada(obra.latitud), 'lo': _coordenada(obra.longitud),
+            'r': obra.radio_permitido,
+        }
+        if obra.poligono:
+            datos['p'] = [[_coordenada(lat), _coordenada(lon)] for lat, lon in obra.poligono]
+        return datos
 
 # Traduce el envío de asistencia (lo que la app nos manda)
 class AsistenciaSerializer(serializers.ModelSerializer):
@@ -0,0 +1,201 @@
+"""
+Subidas reanudables de fotos (selfies de entrada/salida y evidencia de reportes).
+
+Protocolo (API /v1/api/subidas/):
+  1. POST subidas/ {tamano, sha256?, nombre?}  -> {id, offset: 0, bloque_maximo}
+  2. PUT subidas/<id>/?offset=N con el bloque como cuerpo crudo y su SHA-256
+     en X-Checksum -> {offset: N + len(bloque)}. Si se corta, GET subidas/<id>/
+     dice desde qué offset seguir.
+  3. POST subidas/<id>/finalizar/ -> revisa tamaño y SHA-256 del archivo completo.
+La marca (o el reporte) manda `subida_id` en vez del archivo. La subida se
+borra cuando la marca o el reporte quedan guardados; si no, sirve para reintentar.
+
+Los bloques se escriben directo a SUBIDAS_DIR/<id>.part por partes de 64 KB:
+nunca se arma el archivo completo en memoria. Al usarse, el archivo se mueve
+(no se copia) a MEDIA_ROOT, o se sube desde disco a Supabase (ver
+registro/almacenamiento.py). Las subidas vencidas las borra `limpiar_subidas`.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils import timezone
+
+from .models import SubidaFoto
+
+LECTURA = 64 * 1024
+EXTENSIONES = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+
+class SubidaInvalida(Exception):
+    pass
+
+
+class OffsetIncorrecto(SubidaInvalida):
+    # El cliente debe consultar el offset actual y seguir desde ahí
+    pass
+
+
+def directorio():
+    return getattr(settings, 'SUBIDAS_DIR', os.path.join(settings.BASE_DIR, 'subidas'))
+
+
+def bloque_maximo():
+    return getattr(settings, 'SUBIDAS_BLOQUE_MAXIMO', 1024 * 1024)
+
+
+def ruta(subida):
+    return os.path.join(directorio(), f"{subida.pk}.part")
+
+
+def crear(usuario, tamano, sha256='', nombre=''):
+    maximo = getattr(settings, 'SUBIDAS_MAXIMO_BYTES', 15 * 1024 * 1024)
+    if not 0 < tamano <= maximo:
+        raise SubidaInvalida(f"El tamaño debe estar entre 1 y {maximo} bytes")
+    extension = os.path.splitext(nombre or '')[1].lower()
+    subida = SubidaFoto.objects.create(
+        usuario_id=usuario.pk, tamano=tamano, sha256=(sha256 or '').lower(),
+        extension=extension if extension in EXTENSIONES else '.jpg',
+        expira=timezone.now() + timedelta(hours=getattr(settings, 'SUBIDAS_HORAS', 24)),
+    )
+    os.makedirs(directorio(), exist_ok=True)
+    open(ruta(subida), 'wb').close()
+    return subida
+
+
+def obtener(subida_id, usuario):
+    try:
+        subida = SubidaFoto.objects.filter(pk=subida_id, usuario_id=usuario.pk, expira__gt=timezone.now()).first()
+    except ValidationError:  # id que no es UUID
+        subida = None
+    if subida is None:
+        raise SubidaInvalida("La subida no existe o venció")
+    return subida
+
+
+def recibir_bloque(subida, offset, flujo, largo, checksum):
+    """
+    Escribe `largo` bytes de `flujo` en `offset`. Devuelve el nuevo offset.
+    Si el checksum no coincide, el archivo vuelve a quedar como estaba.
+    """
+    if subida.completada:
+        raise SubidaInvalida("La subida ya fue finalizada")
+    if offset != subida.recibido:
+        raise OffsetIncorrecto(f"Offset esperado: {subida.recibido}")
+    if not 0 < largo <= bloque_maximo() or offset + largo > subida.tamano:
+        raise SubidaInvalida(f"El bloque debe tener entre 1 y {bloque_maximo()} bytes y no pasarse del tamaño total")
+
+    digest = hashlib.sha256()
+    escritos = 0
+    with open(ruta(subida), 'r+b') as destino:
+        destino.seek(offset)
+        while escritos < largo:
+            parte = flujo.read(min(LECTURA, largo - escritos))
+            if not parte:
+                break
+            digest.update(parte)
+            destino.write(parte)
+            escritos += len(parte)
+        if escritos != largo or digest.hexdigest() != (checksum or '').lower():
+            destino.truncate(offset)
+            raise SubidaInvalida("El bloque llegó incompleto o con checksum distinto, reenvíalo")
+
+    # Condicional: si otro PUT ya avanzó el offset, este no cuenta
+    if not SubidaFoto.objects.filter(pk=subida.pk, recibido=offset).update(recibido=offset + largo):
+        subida.refresh_from_db(fields=['recibido'])
+        raise OffsetIncorrecto("Otro envío avanzó la subida; sigue desde el offset actual")
+    subida.recibido = offset + largo
+    return subida.recibido
+
+
+def finalizar(subida):
+    if subida.recibido != subida.tamano:
+        raise SubidaInvalida(f"Faltan bytes: van {subida.recibido} de {subida.tamano}")
+    if subida.sha256:
+        digest = hashlib.sha256()
+        with open(ruta(subida), 'rb') as archivo:
+            for parte in iter(lambda: archivo.read(LECTURA), b''):
+                digest.update(parte)
+        if digest.hexdigest() != subida.sha256:
+            # El archivo no sirve: se parte de cero
+            open(ruta(subida), 'wb').close()
+            SubidaFoto.objects.filter(pk=subida.pk).update(recibido=0)
+            raise SubidaInvalida("El archivo completo no coincide con el SHA-256 declarado, súbelo de nuevo")
+    SubidaFoto.objects.filter(pk=subida.pk).update(completada=True)
+    subida.completada = True
+
+
+class ArchivoSubido(File):
+    # Con temporary_file_path el storage mueve el archivo en vez de copiarlo
+    # (igual que los TemporaryUploadedFile de Django) y ImageField lo valida desde disco
+    def __init__(self, subida):
+        super().__init__(open(ruta(subida), 'rb'), name=f"{subida.pk.hex}{subida.extension}")
+        self._ruta = ruta(subida)
+        self.usado = False
+
+    def temporary_file_path(self):
+        return self._ruta
+
+
+def borrar(subida):
+    try:
+        os.remove(ruta(subida))
+    except FileNotFoundError:
+        pass
+    subida.delete()
+
+
+@contextmanager
+def usar(subida_id, usuario, respaldo=None):
+    """
+    Entrega el archivo de una subida finalizada (o `respaldo`, la foto que vino
+    en el multipart, si no hay subida_id). La subida se borra al salir solo si
+    el llamador la marcó con consumida(): si el formulario no valida, la marca
+    se ignora o algo falla, el cliente reintenta con el mismo subida_id.
+    """
+    if not subida_id:
+        yield respaldo
+        return
+    subida = obtener(subida_id, usuario)
+    if not subida.completada:
+        raise SubidaInvalida("La subida no está finalizada")
+    if not os.path.exists(ruta(subida)):
+        # El storage ya movió el archivo en un intento que después falló
+        borrar(subida)
+        raise SubidaInvalida("La subida ya no tiene archivo, súbela de nuevo")
+    archivo = ArchivoSubido(subida)
+    try:
+        yield archivo
+    finally:
+        archivo.close()
+        if archivo.usado:
+            borrar(subida)
+
+
+def consumida(archivo):
+    """Avisa a usar() que el archivo quedó guardado en una marca o reporte."""
+    if isinstance(archivo, ArchivoSubido):
+        archivo.usado = True
+
+
+def limpiar_vencidas():
+    """Borra las subidas vencidas y los .part huérfanos. Devuelve cuántos archivos borró."""
+    borrados = 0
+    for subida in SubidaFoto.objects.filter(expira__lte=timezone.now()).iterator():
+        if os.path.exists(ruta(subida)):
+            borrados += 1
+        borrar(subida)
+
+    if os.path.isdir(directorio()):
+        vigentes = {f"{pk}.part" for pk in SubidaFoto.objects.values_list('pk', flat=True)}
+        limite = timezone.now().timestamp() - getattr(settings, 'SUBIDAS_HORAS', 24) * 3600
+        for nombre in os.listdir(directorio()):
+            completo = os.path.join(directorio(), nombre)
+            if nombre.endswith('.part') and nombre not in vigentes and os.path.getmtime(completo) < limite:
+                os.remove(completo)
+                borrados += 1
+    return borrados
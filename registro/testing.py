@@ -0,0 +1,30 @@
+"""
+Helpers para tests: verificar que una vista respete el presupuesto de queries
+que declara con @presupuesto_queries.
+"""
+from urllib.parse import urlparse
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+
+class PresupuestoQueriesMixin:
+    """Mixin para TestCase. Usa self.client."""
+
+    def assertPresupuestoQueries(self, metodo, url, *args, **kwargs):
+        vista = resolve(urlparse(url).path).func
+        maximo = getattr(vista, 'presupuesto_queries', None)
+        if maximo is None:
+            self.fail(f"La vista de {url} no declara @presupuesto_queries")
+
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = getattr(self.client, metodo)(url, *args, **kwargs)
+
+        if len(ctx.captured_queries) > maximo:
+            detalle = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, 1))
+            self.fail(
+                f"{metodo.upper()} {url} hizo {len(ctx.captured_queries)} queries "
+                f"(presupuesto: {maximo}):\n{detalle}"
+            )
+        return respuesta
@@ -1,3 +1,1220 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, router
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import agregados, almacenamiento, archivo, correcciones, fraude_ip, metricas, nomina, pronostico, replicas, reportes, tokens, turnos
+from .benchmarks import arranque, orm, sinteticos
+from .forms import ReporteIncidenteForm
+from .models import ArchivoAsistencia, Asistencia, BalanceObra, Obra, Perfil, ReporteImproductivo, SospechaIP, SubidaFoto
+from .testing import PresupuestoQueriesMixin
+from .views import get_client_ip
+
+MEDIA_TEMPORAL = tempfile.mkdtemp(prefix='test_registro_media_')
+
+
+def jpeg(lado=8):
+    buffer = io.BytesIO()
+    Image.new('RGB', (lado, lado), (200, 120, 80)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def crear_perfil(username, rol, **kwargs):
+    usuario = User.objects.create_user(username=username, password='clave-segura-123', first_name=username.title())
+    return Perfil.objects.create(usuario=usuario, rut=f"{username[:8]}-{rol[0]}", rol=rol, **kwargs)
+
+
+def crear_obra(jefe, nombre="Edificio Centro", **kwargs):
+    datos = dict(
+        nombre=nombre, direccion="Av. Grecia 1000",
+        latitud='-23.6509000', longitud='-70.3975000', radio_permitido=100,
+        presupuesto_total=100_000_000, valor_multa_dia=500_000,
+        fecha_inicio=date.today() - timedelta(days=30),
+        fecha_termino_estimada=date.today() + timedelta(days=90),
+        jefe_obra=jefe,
+    )
+    datos.update(kwargs)
+    return Obra.objects.create(**datos)
+
+
+class DatosBaseMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jefe = crear_perfil('jefe', 'JEFE')
+        cls.trabajador = crear_perfil(
+            'trabajador', 'TRABAJADOR', sueldo_diario=40000, valor_hora=5000, dispositivo_id='celu-1'
+        )
+        cls.obra = crear_obra(cls.jefe)
+
+    def foto(self):
+        return SimpleUploadedFile('selfie.jpg', jpeg(), content_type='image/jpeg')
+
+    def marcar_datos(self, **extra):
+        datos = {'obra_id': self.obra.id, 'latitud': '-23.6509100', 'longitud': '-70.3975100', 'foto': self.foto()}
+        datos.update(extra)
+        return datos
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEMPORAL)
+class PresupuestoQueriesTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TEMPORAL, ignore_errors=True)
+
+    def login_trabajador(self):
+        self.client.force_login(self.trabajador.usuario)
+        self.client.cookies['dispositivo_seguro'] = 'celu-1'
+
+    def test_home(self):
+        self.client.force_login(self.trabajador.usuario)
+        self.assertPresupuestoQueries('get', reverse('home'))
+
+    def test_panel_trabajador(self):
+        self.login_trabajador()
+        self.assertPresupuestoQueries('get', reverse('panel_trabajador'))
+
+    @override_settings(TURNO_DOBLE_TOQUE_SEGUNDOS=0)
+    def test_panel_trabajador_entrada_y_salida(self):
+        self.login_trabajador()
+        url = reverse('panel_trabajador')
+        self.assertPresupuestoQueries('post', url, self.marcar_datos(marcar_entrada='1'))
+        self.assertPresupuestoQueries('post', url, self.marcar_datos(marcar_salida='1'))
+        self.assertIsNotNone(Asistencia.objects.get().hora_salida)
+
+    def test_dashboard_jefe(self):
+        # Varias filas: el presupuesto no debe crecer con la cantidad de trabajadores
+        otros = [crear_perfil(f'obrero{i}', 'TRABAJADOR') for i in range(3)]
+        for perfil in [self.trabajador] + otros:
+            Asistencia.objects.create(
+                trabajador=perfil, obra=self.obra,
+                latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+            )
+        self.client.force_login(self.jefe.usuario)
+        respuesta = self.assertPresupuestoQueries('get', reverse('dashboard_jefe'))
+        self.assertEqual(respuesta.context['presentes'], 4)
+
+    def test_crear_reporte(self):
+        self.client.force_login(self.jefe.usuario)
+        url = reverse('crear_reporte')
+        self.assertPresupuestoQueries('get', url)
+        datos = {
+            'hora_inicio': '10:00', 'hora_fin': '12:00', 'motivo': 'Lluvia',
+            'dias_retraso_obra': '1', 'trabajadores_afectados': [self.trabajador.pk],
+        }
+        respuesta = self.assertPresupuestoQueries('post', url, datos)
+        self.assertRedirects(respuesta, reverse('dashboard_jefe'), fetch_redirect_response=False)
+
+    def test_api_lista_obras(self):
+        self.client.force_login(self.trabajador.usuario)
+        self.assertPresupuestoQueries('get', reverse('api_obras'))
+
+    @override_settings(TURNO_DOBLE_TOQUE_SEGUNDOS=0)
+    def test_api_marcar_entrada_y_salida(self):
+        self.client.force_login(self.trabajador.usuario)
+        url = reverse('api_marcar')
+        self.assertEqual(self.assertPresupuestoQueries('post', url, self.marcar_datos()).status_code, 201)
+        self.assertEqual(self.assertPresupuestoQueries('post', url, self.marcar_datos()).status_code, 200)
+
+    def test_server_timing(self):
+        self.client.force_login(self.trabajador.usuario)
+        respuesta = self.client.get(reverse('api_obras'))
+        self.assertIn('db;dur=', respuesta['Server-Timing'])
+
+
+class MetricasTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        metricas.reiniciar()
+
+    def marcar(self, lat, lon):
+        return Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, latitud_entrada=lat, longitud_entrada=lon,
+        )
+
+    def test_geocerca_valida_y_rechazo_contado(self):
+        self.assertTrue(self.marcar('-23.6509100', '-70.3975100').entrada_valida)
+        lejos = self.marcar('-23.7000000', '-70.3975100')
+        self.assertFalse(lejos.entrada_valida)
+        self.assertEqual(metricas.RECHAZOS.series, {(self.obra.id, 'geocerca'): 1})
+
+    def test_endpoint_solo_staff(self):
+        self.marcar('-23.6509100', '-70.3975100')
+        self.client.force_login(self.jefe.usuario)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 302)
+
+        staff = User.objects.create_user('auditor', password='x', is_staff=True)
+        self.client.force_login(staff)
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('# TYPE registro_asistencia_save_segundos histogram', texto)
+        self.assertIn('registro_asistencia_save_segundos_count{etapa="geocerca"} 1', texto)
+
+    @override_settings(METRICAS_HABILITADAS=False)
+    def test_deshabilitadas(self):
+        self.marcar('-23.7000000', '-70.3975100')
+        self.assertEqual(metricas.ASISTENCIA_SAVE.series, {})
+        self.assertEqual(metricas.RECHAZOS.series, {})
+
+    def test_exportar_espera_al_candado(self):
+        # Mientras alguien observa, el export no puede leer las series a medias
+        resultado = []
+        with metricas._lock:
+            hilo = threading.Thread(target=lambda: resultado.append(metricas.exportar_prometheus()))
+            hilo.start()
+            hilo.join(0.1)
+            self.assertTrue(hilo.is_alive())
+        hilo.join(1)
+        self.assertIn('# TYPE registro_asistencia_save_segundos histogram', resultado[0])
+
+
+class ArchivoAsistenciaTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp(prefix='test_archivo_')
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def test_archivar_y_rehidratar_mes_cerrado(self):
+        mes_pasado = (date.today().replace(day=1) - timedelta(days=1)).replace(day=10)
+        for i in range(3):
+            a = Asistencia.objects.create(
+                trabajador=self.trabajador, obra=self.obra, fecha=mes_pasado + timedelta(days=i),
+                latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+            )
+            a.hora_salida = (datetime.combine(a.fecha, a.hora_entrada) + timedelta(hours=2)).time()
+            a.save()
+        balance = BalanceObra.objects.get(obra=self.obra)
+        antes = (balance.total_pagado_sueldos, balance.presupuesto_restante)
+        originales = list(Asistencia.objects.order_by('id').values())
+
+        with self.settings(ARCHIVO_ASISTENCIAS_DIR=self.directorio):
+            self.assertEqual(archivo.archivar_mes(mes_pasado), 3)
+            self.assertFalse(Asistencia.objects.exists())
+            resumen = ArchivoAsistencia.objects.get()
+            self.assertEqual((resumen.registros, resumen.total_pagado), (3, antes[0]))
+
+            balance.refresh_from_db()
+            balance.actualizar_balance()
+            self.assertEqual((balance.total_pagado_sueldos, balance.presupuesto_restante), antes)
+
+            with self.assertRaises(ValueError):
+                archivo.archivar_mes(date.today())
+
+            self.assertEqual(archivo.rehidratar_mes(mes_pasado), 3)
+
+        self.assertEqual(list(Asistencia.objects.order_by('id').values()), originales)
+        self.assertFalse(ArchivoAsistencia.objects.exists())
+        balance.refresh_from_db()
+        self.assertEqual(balance.total_sueldos_archivados, 0)
+
+    def test_turno_abierto_no_se_archiva(self):
+        mes_pasado = (date.today().replace(day=1) - timedelta(days=1)).replace(day=10)
+        cerrado = turno(self.trabajador, self.obra, mes_pasado, 2)
+        abierto = Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, fecha=mes_pasado + timedelta(days=1),
+            latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+        Perfil.objects.filter(pk=self.trabajador.pk).update(turno_abierto=abierto)
+
+        with self.settings(ARCHIVO_ASISTENCIAS_DIR=self.directorio):
+            self.assertEqual(archivo.archivar_mes(mes_pasado), 1)
+            self.assertEqual([f['id'] for f in archivo.leer_archivo(mes_pasado)], [cerrado.pk])
+            self.assertEqual(archivo.restantes(mes_pasado), 1)
+            # El mes ya está archivado: el comando no lo repite, pero avisa lo que quedó
+            salida = io.StringIO()
+            call_command('archivar_asistencias', '--antes-de', f'{date.today():%Y-%m}', stdout=salida)
+            self.assertIn(f'{mes_pasado:%Y-%m}: 1 registros quedaron en la tabla', salida.getvalue())
+        self.assertEqual(list(Asistencia.objects.values_list('id', flat=True)), [abierto.pk])
+        self.assertEqual(Perfil.objects.get(pk=self.trabajador.pk).turno_abierto_id, abierto.pk)
+        self.assertEqual(ArchivoAsistencia.objects.get().registros, 1)
+
+
+def turno(trabajador, obra, fecha, horas, lat='-23.6509100'):
+    """Crea una asistencia y la cierra `horas` después de la entrada."""
+    a = Asistencia.objects.create(
+        trabajador=trabajador, obra=obra, fecha=fecha, latitud_entrada=lat, longitud_entrada='-70.3975100',
+    )
+    a.hora_salida = (datetime.combine(fecha, a.hora_entrada) + timedelta(hours=horas)).time()
+    a.save()
+    return a
+
+
+class NominaTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        self.hoy = date.today()
+        self.ayer = self.hoy - timedelta(days=1)
+        turno(self.trabajador, self.obra, self.ayer, 2)                  # 2h * 5000
+        turno(self.trabajador, self.obra, self.hoy, 1, lat='-23.7000')   # fuera de la geocerca
+
+    def test_totales_por_trabajador_y_obra(self):
+        fila, = nomina.calcular_nomina(self.ayer, self.hoy, excluir_gps_invalido=True)
+        self.assertEqual((fila['dias'], fila['turnos'], fila['dias_gps_invalido']), (2, 2, 1))
+        self.assertEqual(fila['monto'], 15000)
+        self.assertEqual(fila['monto_a_pagar'], 10000)
+
+    def test_cambio_de_tarifa_recalcula_el_mes(self):
+        self.trabajador.valor_hora = 6000
+        self.trabajador.save()
+        montos = Asistencia.objects.filter(fecha__gte=self.hoy.replace(day=1)).values_list('monto_pago_dia', flat=True)
+        self.assertTrue(all(m in (6000, 12000) for m in montos))
+        balance = BalanceObra.objects.get(obra=self.obra)
+        self.assertEqual(balance.total_pagado_sueldos, sum(Asistencia.objects.values_list('monto_pago_dia', flat=True)))
+
+    def test_api_solo_admin_o_jefe(self):
+        url = f"{reverse('api_nomina')}?desde={self.ayer}&hasta={self.hoy}"
+        self.client.force_login(self.trabajador.usuario)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.jefe.usuario)
+        datos = self.assertPresupuestoQueries('get', url).json()
+        self.assertEqual(datos['totales']['trabajadores'], 1)
+        self.assertEqual(self.client.get(reverse('api_nomina')).status_code, 400)
+        self.assertEqual(self.client.get(url + '&obra_id=abc').status_code, 400)
+
+
+class AdminAsistenciaTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123')
+        self.client.force_login(self.admin)
+        otra = crear_obra(self.jefe, nombre="Bodega Norte")
+        hoy = date.today()
+        Asistencia.objects.bulk_create([
+            Asistencia(trabajador=self.trabajador, obra=self.obra if i % 2 else otra, fecha=hoy - timedelta(days=i // 2))
+            for i in range(7)
+        ])
+        self.url = reverse('admin:registro_asistencia_changelist')
+
+    def test_recorre_todo_por_cursor(self):
+        vistos, url = [], self.url
+        with mock.patch.object(admin.site._registry[Asistencia], 'list_per_page', 3):
+            while url:
+                cl = self.client.get(url).context['cl']
+                vistos += [a.pk for a in cl.result_list]
+                url = cl.url_siguiente and self.url + cl.url_siguiente
+        esperado = list(Asistencia.objects.order_by('-fecha', '-id').values_list('pk', flat=True))
+        self.assertEqual(vistos, esperado)
+
+    def test_keyset_sin_la_pagina_offset(self):
+        with mock.patch.object(admin.site._registry[Asistencia], 'list_per_page', 3):
+            siguiente = self.client.get(self.url).context['cl'].url_siguiente
+            with CaptureQueriesContext(connection) as ctx, \
+                    mock.patch.object(ChangeList, 'get_results', autospec=True) as base:
+                cl = self.client.get(self.url + siguiente).context['cl']
+        base.assert_not_called()
+        self.assertEqual((len(cl.result_list), cl.result_count, cl.multi_page), (3, 7, True))
+        consultas = [q['sql'] for q in ctx.captured_queries if 'registro_asistencia' in q['sql']]
+        self.assertFalse([q for q in consultas if 'OFFSET' in q])
+        self.assertEqual(len(consultas), 2)   # el conteo con tope y la página por cursor
+
+    def test_filtro_autocompletar(self):
+        respuesta = self.client.get(self.url, {'obra__id__exact': self.obra.pk})
+        self.assertEqual(len(respuesta.context['cl'].result_list), 3)
+        self.assertContains(respuesta, 'data-field-name="trabajador"')
+        buscar = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'Trab', 'app_label': 'registro', 'model_name': 'asistencia', 'field_name': 'trabajador',
+        })
+        self.assertEqual([r['id'] for r in buscar.json()['results']], [str(self.trabajador.pk)])
+
+    def test_orden_por_columna_usa_paginacion_normal(self):
+        cl = self.client.get(self.url, {'o': '1'}).context['cl']
+        self.assertFalse(cl.keyset)
+        self.assertEqual(cl.result_count, 7)
+
+
+class SelectorTrabajadoresTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        self.ausente = crear_perfil('ausente', 'TRABAJADOR')
+        Asistencia.objects.create(trabajador=self.trabajador, obra=self.obra, latitud_entrada='-23.6509100', longitud_entrada='-70.3975100')
+
+    def test_solo_presentes_pero_valida_cualquiera(self):
+        form = ReporteIncidenteForm(obra=self.obra)
+        opciones = [valor for valor, _ in form.fields['trabajadores_afectados'].widget.choices]
+        self.assertEqual(opciones, [self.trabajador.pk])
+
+        datos = {'hora_inicio': '10:00', 'hora_fin': '11:00', 'motivo': 'Corte de luz', 'dias_retraso_obra': '0',
+                 'trabajadores_afectados': [self.trabajador.pk, self.ausente.pk]}
+        form = ReporteIncidenteForm(datos, obra=self.obra)
+        with self.assertNumQueries(1):  # validación con un solo pk__in
+            self.assertTrue(form.is_valid())
+        self.assertIn((self.ausente.pk, str(self.ausente)), form.fields['trabajadores_afectados'].widget.choices)
+
+    def test_buscador(self):
+        url = reverse('api_trabajadores')
+        self.client.force_login(self.trabajador.usuario)
+        self.assertEqual(self.client.get(url, {'q': 'au'}).status_code, 403)
+
+        self.client.force_login(self.jefe.usuario)
+        datos = self.assertPresupuestoQueries('get', url + '?q=Aus').json()
+        self.assertEqual([t['id'] for t in datos['resultados']], [self.ausente.pk])
+        self.assertFalse(datos['hay_mas'])
+        self.assertEqual(self.client.get(url, {'q': 'a'}).status_code, 400)
+
+
+class RebuildBalancesTests(DatosBaseMixin, TestCase):
+
+    def test_dry_run_y_reconstruccion(self):
+        turno(self.trabajador, self.obra, date.today(), 2)
+        sin_balance = crear_obra(self.jefe, nombre="Bodega Norte")
+        correcto = BalanceObra.objects.get(obra=self.obra)
+        BalanceObra.objects.filter(pk=correcto.pk).update(total_pagado_sueldos=1, presupuesto_restante=0, es_rentable=False)
+
+        salida = io.StringIO()
+        call_command('rebuild_balances', '--dry-run', stdout=salida)
+        self.assertIn('total_pagado_sueldos: 1 -> 10000', salida.getvalue())
+        self.assertFalse(BalanceObra.objects.filter(obra=sin_balance).exists())
+
+        call_command('rebuild_balances', stdout=io.StringIO())
+        reconstruido = BalanceObra.objects.get(obra=self.obra)
+        for campo in ('total_pagado_sueldos', 'presupuesto_restante', 'es_rentable'):
+            self.assertEqual(getattr(reconstruido, campo), getattr(correcto, campo))
+        self.assertTrue(BalanceObra.objects.filter(obra=sin_balance).exists())
+
+        salida = io.StringIO()
+        call_command('rebuild_balances', '--desde', str(date.today()), stdout=salida)
+        self.assertIn('1 obras revisadas, 0 con diferencias', salida.getvalue())
+
+
+@mock.patch.object(replicas, 'replica_configurada', return_value=True)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def test_solo_lee_de_la_replica_cuando_se_pide(self, _):
+        self.assertEqual(router.db_for_read(Asistencia), 'default')
+        with mock.patch.object(replicas, 'lag_replica', return_value=0):
+            with replicas.en_replica():
+                self.assertEqual(router.db_for_read(Asistencia), 'replica')
+                self.assertEqual(router.db_for_write(Asistencia), 'default')
+                # Después de escribir se lee de la primaria
+                self.assertEqual(router.db_for_read(Asistencia), 'default')
+            self.assertEqual(router.db_for_read(Asistencia), 'default')
+
+    def test_replica_atrasada_usa_la_primaria(self, _):
+        with mock.patch.object(replicas, 'lag_replica', return_value=60), replicas.en_replica():
+            self.assertEqual(router.db_for_read(Asistencia), 'default')
+
+
+@override_settings(REPLICA_LECTURAS=True)
+class ReplicaSQLiteTests(DatosBaseMixin, TransactionTestCase):
+    # 'replica' es una segunda base SQLite de prueba: no recibe lo que se escribe en 'default'.
+    # TransactionTestCase: dentro del atomic de TestCase el router siempre lee de la primaria
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.setUpTestData()
+        self.asistencia = Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+
+    def test_lee_de_la_replica_y_escribe_en_la_primaria(self):
+        with mock.patch.dict(replicas._lag_cache, {'hasta': 0.0, 'lag': 0.0}), replicas.en_replica():
+            self.assertFalse(Asistencia.objects.exists())
+            Asistencia.objects.filter(pk=self.asistencia.pk).update(salida_automatica=True)
+            # Después de escribir se lee de la primaria
+            self.assertTrue(Asistencia.objects.get(pk=self.asistencia.pk).salida_automatica)
+        self.assertFalse(Asistencia.objects.using('replica').exists())
+
+    def test_replica_atrasada_lee_de_la_primaria(self):
+        with mock.patch.dict(replicas._lag_cache, {'hasta': float('inf'), 'lag': 60.0}), replicas.en_replica():
+            self.assertEqual(list(Asistencia.objects.values_list('pk', flat=True)), [self.asistencia.pk])
+
+    @override_settings(REPLICA_LECTURAS=False)
+    def test_interruptor_apagado(self):
+        with replicas.en_replica():
+            self.assertTrue(Asistencia.objects.exists())
+
+    def test_agregados_en_cache_se_calculan_en_la_primaria(self):
+        cache.clear()
+        with mock.patch.dict(replicas._lag_cache, {'hasta': 0.0, 'lag': 0.0}), replicas.en_replica():
+            self.assertEqual(agregados.asistencia_hoy(self.obra.id)['presentes'], 1)
+            self.assertFalse(Asistencia.objects.exists())   # lo demás sigue en la réplica
+
+
+class AgregadosTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def marcar(self):
+        return Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+
+    def test_cache_e_invalidacion(self):
+        self.assertEqual(agregados.asistencia_hoy(self.obra.id)['presentes'], 0)
+        with self.assertNumQueries(0):
+            agregados.asistencia_hoy(self.obra.id)
+        self.marcar()
+        self.assertEqual(agregados.asistencia_hoy(self.obra.id), {'presentes': 1, 'alertas_gps': 0})
+
+        reporte = ReporteImproductivo.objects.create(
+            obra=self.obra, jefe_obra=self.jefe, hora_inicio=time(10), hora_fin=time(11), motivo='Lluvia',
+        )
+        self.assertEqual(agregados.reportes_sin_leer(self.obra.id), 1)
+        ReporteImproductivo.objects.filter(pk=reporte.pk).update(leido=True)  # sin señales
+        self.assertEqual(agregados.reportes_sin_leer(self.obra.id), 1)
+        ReporteImproductivo.objects.get(pk=reporte.pk).trabajadores_afectados.add(self.trabajador)
+        self.assertEqual(agregados.reportes_sin_leer(self.obra.id), 0)
+
+    def test_dia_local_de_noche(self):
+        # 02:00 UTC del 15 son las 23:00 del 14 en Santiago: el conteo es del 14
+        Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, fecha=date(2026, 1, 14),
+            latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+        ahora = datetime(2026, 1, 15, 2, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=ahora):
+            self.assertEqual(agregados.asistencia_hoy(self.obra.id)['presentes'], 1)
+            self.assertEqual(agregados._desde(1), date(2026, 1, 13))
+
+    def test_estampida_sirve_el_ultimo_valor(self):
+        calculos = []
+        agregados.obtener(self.obra.id, 'prueba', lambda: calculos.append(1) or 'viejo')
+        agregados.invalidar_obra(self.obra.id)
+        # Otro request tiene el candado de la versión nueva
+        clave = f'agregados:{self.obra.id}:{agregados.version(self.obra.id)}:prueba'
+        cache.add(f'{clave}:calculando', 1)
+        self.assertEqual(agregados.obtener(self.obra.id, 'prueba', lambda: calculos.append(1) or 'nuevo'), 'viejo')
+        self.assertEqual(len(calculos), 1)
+        cache.delete(f'{clave}:calculando')
+        self.assertEqual(agregados.obtener(self.obra.id, 'prueba', lambda: 'nuevo'), 'nuevo')
+
+    def test_grafico_admin_por_ventana(self):
+        BalanceObra.objects.get_or_create(obra=self.obra)
+        ReporteImproductivo.objects.create(
+            obra=self.obra, jefe_obra=self.jefe, fecha=date.today() - timedelta(days=60),
+            hora_inicio=time(10), hora_fin=time(11), motivo='Lluvia', dinero_perdido=5000,
+        )
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123'))
+        url = reverse('admin:registro_reporteimproductivo_grafico')
+
+        self.assertEqual(self.client.get(url).json()['datos'], [{'obra': self.obra.nombre, 'total': 5000.0}])
+        self.assertEqual(self.client.get(url, {'dias': 30}).json(), {'dias': 30, 'datos': []})
+        self.assertEqual(len(self.client.get(url, {'dias': 90}).json()['datos']), 1)
+        # Ventana no ofrecida: histórico completo
+        self.assertIsNone(self.client.get(url, {'dias': 7}).json()['dias'])
+
+        cache.clear()
+        call_command('precalcular_graficos', stdout=io.StringIO())
+        with self.assertNumQueries(0):
+            for dias in (None, 30, 90):
+                agregados.grafico_balances(dias)
+                agregados.grafico_perdidas(dias)
+
+
+class TurnosTests(DatosBaseMixin, TestCase):
+
+    def marcar(self, **kwargs):
+        return turnos.marcar(self.trabajador, self.obra, '-23.6509100', '-70.3975100', **kwargs)
+
+    def test_doble_toque_no_abre_ni_cierra_otro_turno(self):
+        estado, turno = self.marcar()
+        self.assertEqual(estado, turnos.ENTRADA)
+        self.assertEqual(self.marcar()[0], turnos.REPETIDA)
+        self.assertEqual(self.marcar(accion=turnos.ENTRADA)[0], turnos.REPETIDA)
+        self.assertEqual(Asistencia.objects.count(), 1)
+
+        perfil = Perfil.objects.get(pk=self.trabajador.pk)
+        self.assertEqual(perfil.turno_abierto_id, turno.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(turnos.turno_abierto(perfil), turno)
+
+        with self.settings(TURNO_DOBLE_TOQUE_SEGUNDOS=0):
+            self.assertEqual(self.marcar()[0], turnos.SALIDA)
+        self.assertIsNone(Perfil.objects.get(pk=self.trabajador.pk).turno_abierto_id)
+
+    def test_cierre_de_turnos_olvidados(self):
+        _, turno = self.marcar()
+        ayer = date.today() - timedelta(days=1)
+        Asistencia.objects.filter(pk=turno.pk).update(fecha=ayer, monto_pago_dia=99999)
+        self.assertIsNone(turnos.turno_abierto(Perfil.objects.get(pk=self.trabajador.pk)))
+
+        call_command('cerrar_turnos_olvidados', '--cerrar', stdout=io.StringIO())
+        turno.refresh_from_db()
+        self.assertTrue(turno.salida_automatica)
+        self.assertEqual((turno.hora_salida, turno.monto_pago_dia), (turno.hora_entrada, 0))
+        self.assertIsNone(Perfil.objects.get(pk=self.trabajador.pk).turno_abierto_id)
+        self.assertEqual(BalanceObra.objects.get(obra=self.obra).total_pagado_sueldos, 0)
+
+    def test_fecha_local_de_noche(self):
+        # 02:00 UTC del 15 son las 23:00 del 14 en Santiago: el turno es del 14
+        ahora = datetime(2026, 1, 15, 2, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=ahora):
+            _, turno = self.marcar()
+            self.assertEqual(turno.fecha, date(2026, 1, 14))
+            self.assertEqual(turnos.turno_abierto(Perfil.objects.get(pk=self.trabajador.pk)), turno)
+
+    def test_cerrar_despues_de_solo_marcar(self):
+        _, turno = self.marcar()
+        Asistencia.objects.filter(pk=turno.pk).update(fecha=date.today() - timedelta(days=1))
+        self.assertEqual(turnos.cerrar_olvidados()[0], 1)
+        self.assertEqual(turnos.cerrar_olvidados()[0], 0)   # marcar dos veces no repite
+
+        self.assertEqual(turnos.cerrar_olvidados(cerrar=True), (1, [self.obra.id]))
+        turno.refresh_from_db()
+        self.assertEqual(turno.hora_salida, turno.hora_entrada)
+        self.assertIsNone(Perfil.objects.get(pk=self.trabajador.pk).turno_abierto_id)
+
+
+class FraudeIPTests(DatosBaseMixin, TestCase):
+
+    def marcas(self, ip, cantidad, fecha=None):
+        hoy = fecha or date.today()
+        trabajadores = [crear_perfil(f"{ip.replace('.', '')[-5:]}{i}", 'TRABAJADOR') for i in range(cantidad)]
+        return Asistencia.objects.bulk_create([
+            Asistencia(trabajador=t, obra=self.obra, fecha=hoy, ip_registro=ip, red_registro=Asistencia.red_de_ip(ip))
+            for t in trabajadores
+        ])
+
+    def test_ip_de_la_marca_ignora_x_forwarded_for_falso(self):
+        # El cliente inventa la primera IP; la del proxy (la de más a la derecha) es la real
+        self.client.force_login(self.trabajador.usuario)
+        datos = self.marcar_datos()
+        del datos['foto']
+        self.client.post(
+            reverse('api_marcar'), datos, HTTP_X_FORWARDED_FOR='6.6.6.6, 181.43.1.10', REMOTE_ADDR='10.0.0.2',
+        )
+        self.assertEqual(Asistencia.objects.get().ip_registro, '181.43.1.10')
+
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6', REMOTE_ADDR='10.0.0.2')
+        with self.settings(PROXIES_CONFIABLES=0):
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+        with self.settings(PROXIES_CONFIABLES=2):   # faltan saltos: el header no es de fiar
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+
+    def test_detecta_ip_y_red_con_ventana_incremental(self):
+        self.marcas('200.1.2.3', 5)
+        repartidas = self.marcas('190.9.9.9', 5)
+        # Mismas 5 personas desde otra IP, pero con una hora de diferencia entre cada una
+        for i, asistencia in enumerate(repartidas):
+            Asistencia.objects.filter(pk=asistencia.pk).update(hora_entrada=time(8 + i))
+
+        fechas, guardadas = fraude_ip.analizar_nuevas(minimo_red=5)
+        self.assertEqual(fechas, [date.today()])
+        self.assertEqual(guardadas, 2)
+        self.assertEqual(
+            sorted(SospechaIP.objects.values_list('tipo', 'direccion', 'trabajadores')),
+            [('IP', '200.1.2.3', 5), ('RED', '200.1.2.0/24', 5)],
+        )
+
+        # Sin filas nuevas no se analiza nada; con una nueva, solo su día
+        self.assertEqual(fraude_ip.analizar_nuevas(minimo_red=5), ([], 0))
+        self.marcas('200.1.2.77', 1)
+        fraude_ip.analizar_nuevas(minimo_red=5)
+        self.assertEqual(SospechaIP.objects.get(tipo='RED').trabajadores, 6)
+
+    def test_pasada_dos_por_lotes(self):
+        for i in range(3):
+            self.marcas(f'200.1.{i}.3', 5)
+        with mock.patch.object(fraude_ip, 'LOTE_CANDIDATOS', 2):
+            self.assertEqual(fraude_ip.analizar_dias([date.today()], minimo_red=20), 3)
+        self.assertEqual(sorted(SospechaIP.objects.values_list('trabajadores', flat=True)), [5, 5, 5])
+
+    def test_api_guarda_la_ip(self):
+        self.client.force_login(self.trabajador.usuario)
+        datos = self.marcar_datos()
+        del datos['foto']
+        self.client.post(reverse('api_marcar'), datos, REMOTE_ADDR='181.43.10.5')
+        asistencia = Asistencia.objects.get(trabajador=self.trabajador)
+        self.assertEqual((asistencia.ip_registro, asistencia.red_registro), ('181.43.10.5', '181.43.10.0/24'))
+
+
+class GeocercaPoligonoTests(DatosBaseMixin, TestCase):
+    # Franja angosta a lo largo de un camino (~2 km de largo, ~100 m de ancho)
+    CAMINO = [[-23.6500, -70.4000], [-23.6500, -70.3800], [-23.6509, -70.3800], [-23.6509, -70.4000]]
+
+    def marcar(self, obra, lat, lon):
+        return Asistencia.objects.create(trabajador=self.trabajador, obra=obra, latitud_entrada=lat, longitud_entrada=lon)
+
+    def test_poligono_reemplaza_al_circulo(self):
+        obra = crear_obra(self.jefe, nombre="Ruta 1", radio_permitido=2000, poligono=self.CAMINO + [self.CAMINO[0]])
+        self.assertEqual(len(obra.poligono), 4)  # se quita el vértice repetido
+        self.assertEqual(obra.caja(), (-23.6509, -23.65, -70.4, -70.38))
+
+        self.assertTrue(obra.contiene('-23.6505', '-70.3850'))
+        self.assertFalse(obra.contiene('-23.6600', '-70.3850'))  # dentro del radio, fuera del camino
+        self.assertFalse(obra.contiene(None, None))
+        self.assertTrue(self.marcar(obra, '-23.6505000', '-70.3900000').entrada_valida)
+
+        obra.poligono = [[-23.65, -70.40], [-23.66, -70.39]]
+        with self.assertRaises(ValidationError):
+            obra.full_clean()
+
+    def test_revalidar_en_bloque(self):
+        dentro = self.marcar(self.obra, '-23.6509100', '-70.3975100')
+        borde = self.marcar(self.obra, '-23.6512000', '-70.3975000')  # ~33 m: dentro del círculo de 100 m
+        self.assertTrue(borde.entrada_valida)
+
+        # Se dibuja un polígono chico alrededor de la primera marca
+        self.obra.poligono = [[-23.6508, -70.3977], [-23.6508, -70.3973], [-23.6510, -70.3973], [-23.6510, -70.3977]]
+        self.obra.save()
+        salida = io.StringIO()
+        call_command('revalidar_geocercas', '--dry-run', stdout=salida)
+        self.assertIn("1 entradas quedarían inválidas", salida.getvalue())
+        self.assertTrue(Asistencia.objects.get(pk=borde.pk).entrada_valida)
+
+        call_command('revalidar_geocercas', stdout=io.StringIO())
+        self.assertEqual(
+            dict(Asistencia.objects.values_list('pk', 'entrada_valida')), {dentro.pk: True, borde.pk: False},
+        )
+
+
+class ArranqueTests(SimpleTestCase):
+
+    def test_arranque_dentro_del_presupuesto(self):
+        resultados = arranque.ejecutar(repeticiones=1)
+        self.assertEqual(arranque.fuera_de_presupuesto(resultados), [])
+        self.assertGreater(resultados['escenarios']['arranque']['importacion_ms'], 0)
+
+    def test_presupuesto_superado(self):
+        resultados = {
+            'escenarios': {'arranque': {'importacion_ms': 900.0, 'rss_mb': 60.0}},
+            'pesados_cargados': ['reportlab'],
+        }
+        with self.settings(ARRANQUE_PRESUPUESTO_MS=500, ARRANQUE_PRESUPUESTO_RSS_MB=100):
+            problemas = arranque.fuera_de_presupuesto(resultados)
+        self.assertEqual(len(problemas), 2)
+        self.assertIn("reportlab", problemas[1])
+
+
+class TokensTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def pedir_token(self, **extra):
+        datos = {'username': 'trabajador', 'password': 'clave-segura-123', 'dispositivo_id': 'celu-1'}
+        datos.update(extra)
+        return self.assertPresupuestoQueries('post', reverse('api_token'), datos)
+
+    def test_login_marca_y_refresco(self):
+        self.assertEqual(self.pedir_token(password='otra').status_code, 401)
+        self.assertEqual(self.pedir_token(dispositivo_id='celu-ajeno').status_code, 403)
+        par = self.pedir_token().json()
+
+        # Con el access no hay sesión ni hash: solo el perfil cuando la vista lo pide
+        cabecera = {'HTTP_AUTHORIZATION': f"Bearer {par['access']}"}
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('api_obras'), **cabecera).status_code, 200)
+        datos = self.marcar_datos()
+        del datos['foto']
+        self.assertEqual(self.client.post(reverse('api_marcar'), datos, **cabecera).status_code, 201)
+
+        # El refresh no sirve como access, ni al revés
+        self.assertEqual(self.client.get(reverse('api_obras'), HTTP_AUTHORIZATION=f"Bearer {par['refresh']}").status_code, 401)
+        url = reverse('api_token_refrescar')
+        self.assertEqual(self.assertPresupuestoQueries('post', url, {'refresh': par['access']}).status_code, 401)
+        self.assertIn('access', self.assertPresupuestoQueries('post', url, {'refresh': par['refresh']}).json())
+
+    def test_resetear_dispositivo_revoca(self):
+        par = self.pedir_token().json()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123'))
+        self.client.post(reverse('admin:registro_perfil_changelist'), {
+            'action': 'resetear_dispositivo', '_selected_action': [self.trabajador.pk],
+        })
+        self.client.logout()
+        self.assertEqual(self.client.post(reverse('api_token_refrescar'), {'refresh': par['refresh']}).status_code, 401)
+        # Vuelve a entrar desde el celular nuevo
+        self.assertEqual(self.pedir_token(dispositivo_id='celu-2').status_code, 200)
+
+    def test_token_vencido(self):
+        with self.settings(JWT_ACCESS_MINUTOS=-1):
+            par = self.pedir_token().json()
+        respuesta = self.client.get(reverse('api_obras'), HTTP_AUTHORIZATION=f"Bearer {par['access']}")
+        self.assertEqual((respuesta.status_code, respuesta['WWW-Authenticate']), (401, 'Bearer'))
+
+
+class CompresionAPITests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(self.trabajador.usuario)
+
+    @override_settings(COMPRESION_MINIMO_BYTES=10)
+    def test_gzip_negociado(self):
+        normal = self.client.get(reverse('api_obras'))
+        self.assertFalse(normal.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', normal['Vary'])
+
+        comprimida = self.client.get(reverse('api_obras'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(comprimida.content)), normal.json())
+
+    def test_respuesta_chica_no_se_comprime(self):
+        respuesta = self.client.get(reverse('api_obras'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(respuesta.has_header('Content-Encoding'))
+
+    def test_formato_compacto(self):
+        self.assertEqual(
+            self.client.get(reverse('api_obras'), {'formato': 'compacto'}).json(),
+            [{'i': self.obra.id, 'n': self.obra.nombre, 'la': -23.6509, 'lo': -70.3975, 'r': 100}],
+        )
+        datos = self.marcar_datos()
+        del datos['foto']
+        respuesta = self.client.post(reverse('api_marcar'), datos, HTTP_X_FORMATO='compacto')
+        self.assertEqual((respuesta.status_code, respuesta.json()), (201, {'e': 1}))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEMPORAL)
+class SubidasTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp(prefix='test_subidas_')
+        self.enterContext(override_settings(SUBIDAS_DIR=self.directorio, SUBIDAS_BLOQUE_MAXIMO=256))
+        self.client.force_login(self.trabajador.usuario)
+        self.foto_bytes = jpeg(64)
+
+    def tearDown(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def enviar(self, subida_id, offset, bloque, checksum=None):
+        return self.client.put(
+            reverse('api_subida', args=[subida_id]) + f'?offset={offset}', bloque,
+            content_type='application/octet-stream',
+            HTTP_X_CHECKSUM=checksum or hashlib.sha256(bloque).hexdigest(),
+        )
+
+    def subir(self):
+        datos = {'tamano': len(self.foto_bytes), 'sha256': hashlib.sha256(self.foto_bytes).hexdigest(), 'nombre': 'selfie.jpg'}
+        subida_id = self.client.post(reverse('api_subidas'), datos).json()['id']
+        offset = 0
+        while offset < len(self.foto_bytes):
+            bloque = self.foto_bytes[offset:offset + 256]
+            offset = self.enviar(subida_id, offset, bloque).json()['offset']
+        self.assertEqual(self.client.post(reverse('api_subida_finalizar', args=[subida_id])).status_code, 200)
+        return subida_id
+
+    def test_reanudar_tras_corte(self):
+        datos = {'tamano': len(self.foto_bytes), 'sha256': hashlib.sha256(self.foto_bytes).hexdigest()}
+        subida_id = self.client.post(reverse('api_subidas'), datos).json()['id']
+        primero = self.foto_bytes[:256]
+        self.assertEqual(self.enviar(subida_id, 0, primero).json()['offset'], 256)
+
+        # Bloque corrupto: se descarta y el offset no avanza
+        self.assertEqual(self.enviar(subida_id, 256, self.foto_bytes[256:512], checksum='0' * 64).status_code, 400)
+        # Reintento del bloque ya recibido: 409 con el offset para seguir
+        conflicto = self.enviar(subida_id, 0, primero)
+        self.assertEqual((conflicto.status_code, conflicto.json()['offset']), (409, 256))
+        self.assertEqual(self.client.get(reverse('api_subida', args=[subida_id])).json()['offset'], 256)
+
+        # Sin terminar no se puede finalizar
+        self.assertEqual(self.client.post(reverse('api_subida_finalizar', args=[subida_id])).status_code, 400)
+
+    def test_marcar_con_subida(self):
+        subida_id = self.subir()
+        datos = self.marcar_datos(subida_id=subida_id)
+        del datos['foto']
+        self.assertEqual(self.assertPresupuestoQueries('post', reverse('api_marcar'), datos).status_code, 201)
+
+        asistencia = Asistencia.objects.get()
+        self.assertTrue(asistencia.foto_entrada.name.endswith('.jpg'))
+        self.assertEqual(asistencia.foto_entrada.read(), self.foto_bytes)
+        # La subida se consumió: ni registro ni bloque en disco
+        self.assertFalse(SubidaFoto.objects.exists())
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    def test_reporte_invalido_no_consume_la_subida(self):
+        self.client.force_login(self.jefe.usuario)
+        subida_id = self.subir()
+        # Sin motivo ni horas el formulario no valida: la subida queda para reintentar
+        respuesta = self.client.post(reverse('crear_reporte'), {'subida_id': subida_id})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.context['form'].errors)
+        self.assertTrue(SubidaFoto.objects.filter(pk=subida_id).exists())
+        self.assertEqual(os.listdir(self.directorio), [f'{subida_id}.part'])
+
+    def test_marca_repetida_no_consume_la_subida(self):
+        self.client.post(reverse('api_marcar'), self.marcar_datos())
+        subida_id = self.subir()
+        datos = self.marcar_datos(subida_id=subida_id)
+        del datos['foto']
+        self.assertEqual(self.client.post(reverse('api_marcar'), datos).json()['estado'], 'repetida')
+        self.assertTrue(SubidaFoto.objects.filter(pk=subida_id).exists())
+
+    def test_subida_ajena_o_vencida(self):
+        subida_id = self.subir()
+        otro = crear_perfil('otro', 'TRABAJADOR')
+        self.client.force_login(otro.usuario)
+        self.assertEqual(self.client.get(reverse('api_subida', args=[subida_id])).status_code, 404)
+
+        SubidaFoto.objects.update(expira=timezone.now() - timedelta(minutes=1))
+        call_command('limpiar_subidas', stdout=io.StringIO())
+        self.assertFalse(SubidaFoto.objects.exists())
+        self.assertEqual(os.listdir(self.directorio), [])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TEMPORAL)
+class AlmacenamientoTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(self.trabajador.usuario)
+
+    def test_subida_directa_y_marca(self):
+        datos = self.client.post(reverse('api_foto_subida'), {'tipo': 'entrada', 'nombre': 'selfie.jpg'}).json()
+        self.assertEqual(datos['metodo'], 'PUT')
+        foto = jpeg()
+        self.client.logout()  # La URL firmada no necesita sesión
+        self.assertEqual(self.client.put(datos['url'], foto, content_type='image/jpeg').status_code, 201)
+        self.assertEqual(self.client.put(datos['url'], foto, content_type='image/jpeg').status_code, 409)
+
+        self.client.force_login(self.trabajador.usuario)
+        marca = self.marcar_datos(foto_clave=datos['clave'])
+        del marca['foto']
+        self.assertEqual(self.client.post(reverse('api_marcar'), marca).status_code, 201)
+        nombre = Asistencia.objects.get().foto_entrada.name
+        self.assertTrue(nombre.startswith('asistencias/entrada/'))
+
+        # La descarga también es firmada y no cambia de carpeta
+        respuesta = self.client.get(Asistencia.objects.get().foto_entrada.url)
+        self.assertEqual(b''.join(respuesta.streaming_content), foto)
+        self.assertEqual(self.client.get(reverse('media_firmada', args=['adulterado'])).status_code, 404)
+
+    def test_clave_ajena_o_sin_subir(self):
+        otro = crear_perfil('otro', 'TRABAJADOR')
+        ajena = almacenamiento.preparar_subida(otro.usuario, 'entrada')['clave']
+        propia = almacenamiento.preparar_subida(self.trabajador.usuario, 'entrada')['clave']
+        for clave in (ajena, propia):
+            marca = self.marcar_datos(foto_clave=clave)
+            del marca['foto']
+            self.assertEqual(self.client.post(reverse('api_marcar'), marca).status_code, 400)
+        with self.assertRaises(almacenamiento.ClaveInvalida):
+            almacenamiento.preparar_subida(self.trabajador.usuario, 'perfil')
+
+
+class ReportesTests(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp(prefix='test_reportes_')
+        self.enterContext(override_settings(REPORTES_DIR=self.directorio))
+        for dia in (3, 4):
+            Asistencia.objects.create(
+                trabajador=self.trabajador, obra=self.obra, fecha=date(2025, 3, dia),
+                latitud_entrada='-23.6509100', longitud_entrada='-70.3975100', hora_salida=time(18, 0),
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def test_cache_por_version_de_datos(self):
+        ruta, en_cache = reportes.generar(self.obra, 2025, 3)
+        self.assertFalse(en_cache)
+        with open(ruta, 'rb') as pdf:
+            self.assertEqual(pdf.read(4), b'%PDF')
+
+        # Sin cambios: solo las queries de la huella
+        with self.assertNumQueries(3):
+            self.assertEqual(reportes.generar(self.obra, 2025, 3), (ruta, True))
+
+        Asistencia.objects.filter(fecha=date(2025, 3, 4)).update(entrada_valida=False)
+        nueva, en_cache = reportes.generar(self.obra, 2025, 3)
+        self.assertFalse(en_cache)
+        self.assertNotEqual(nueva, ruta)
+        self.assertEqual(os.listdir(os.path.dirname(ruta)), [os.path.basename(nueva)])
+
+        # Otro mes no se entera
+        Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, fecha=date(2025, 4, 1),
+            latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+        self.assertEqual(reportes.generar(self.obra, 2025, 3), (nueva, True))
+
+    def test_datos_del_reporte(self):
+        ReporteImproductivo.objects.create(
+            obra=self.obra, jefe_obra=self.jefe, fecha=date(2025, 3, 3),
+            hora_inicio=time(10, 0), hora_fin=time(12, 0), motivo="Lluvia", dias_retraso_obra=1,
+        )
+        desde, hasta = reportes.periodo(2025, 3)
+        datos = reportes.calcular(self.obra, desde, hasta, reportes.totales(self.obra, desde, hasta))
+        self.assertEqual((datos['turnos'], len(datos['por_dia']), datos['pct_validas']), (2, 2, 100.0))
+        self.assertEqual(datos['multas'], 500_000)
+        self.assertEqual(datos['balance']['multas'], 500_000)
+
+    def test_comando_lote(self):
+        otra = crear_obra(self.jefe, nombre="Edificio Norte")
+        salida = io.StringIO()
+        call_command('generar_reportes', mes='2025-03', procesos=1, stdout=salida)
+        self.assertIn("2 reportes (2 generados, 0 del caché)", salida.getvalue())
+        resultados = reportes.generar_todos(2025, 3, Obra.objects.filter(pk=otra.pk), procesos=1)
+        self.assertTrue(resultados[0][2])
+
+
+class SinteticosTests(TestCase):
+
+    def test_generar_con_reglas_de_save(self):
+        resumen = sinteticos.generar(400, anios=1, semilla=7)
+        self.assertEqual(resumen['asistencias'], Asistencia.objects.count())
+        self.assertEqual(resumen['asistencias'], 400)
+        # bulk_create no pisó la hora de entrada ni la de modificación
+        self.assertGreater(Asistencia.objects.values('hora_entrada').distinct().count(), 50)
+        self.assertLess(Asistencia.objects.order_by('fecha_modificacion').first().fecha_modificacion.date(), date.today())
+
+        completa = Asistencia.objects.filter(horas_trabajadas__gte=8).select_related('trabajador').first()
+        self.assertEqual(completa.monto_pago_dia, completa.trabajador.sueldo_diario)
+        self.assertTrue(ReporteImproductivo.trabajadores_afectados.through.objects.exists())
+        self.assertGreater(BalanceObra.objects.get().total_pagado_sueldos, 0)
+
+    def test_benchmark_por_escala(self):
+        _, escenarios = orm.ejecutar_escala(300, repeticiones=2, anios=1)
+        self.assertEqual(escenarios['asistencia_save_300']['n'], 2)
+        self.assertGreater(escenarios['dashboard_jefe_300']['queries_por_llamada'], 0)
+
+
+class ResumenJefeTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def test_queries_constantes_por_obra(self):
+        self.client.force_login(self.jefe.usuario)
+        url = reverse('dashboard_jefe') + '?vista=resumen'
+        with CaptureQueriesContext(connection) as una:
+            self.client.get(url)
+
+        otras = [crear_obra(self.jefe, nombre=f"Obra {i}") for i in range(5)]
+        for obra in [self.obra] + otras:
+            Asistencia.objects.create(
+                trabajador=self.trabajador, obra=obra,
+                latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+            )
+        ReporteImproductivo.objects.create(
+            obra=otras[0], jefe_obra=self.jefe, hora_inicio=time(10, 0), hora_fin=time(11, 0), motivo="Lluvia",
+        )
+        respuesta = self.assertPresupuestoQueries('get', url)
+        self.assertEqual(len(respuesta.context['filas']), 6)
+        self.assertNumQueries(len(una), self.client.get, url)
+
+        filas = {f['obra'].id: f for f in respuesta.context['filas']}
+        self.assertEqual((filas[self.obra.id]['presentes'], filas[self.obra.id]['abiertos']), (1, 1))
+        self.assertEqual(filas[otras[0].id]['ultimo_incidente']['motivo'], "Lluvia")
+        self.assertIsNone(filas[otras[1].id]['ultimo_incidente'])
+        self.assertEqual(respuesta.context['totales']['presentes'], 6)
+
+    def test_dia_local_de_noche(self):
+        # 02:00 UTC del 15 son las 23:00 del 14 en Santiago: el resumen es del 14
+        Asistencia.objects.create(
+            trabajador=self.trabajador, obra=self.obra, fecha=date(2026, 1, 14),
+            latitud_entrada='-23.6509100', longitud_entrada='-70.3975100',
+        )
+        self.client.force_login(self.jefe.usuario)
+        ahora = datetime(2026, 1, 15, 2, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=ahora):
+            respuesta = self.client.get(reverse('dashboard_jefe') + '?vista=resumen')
+        self.assertEqual(respuesta.context['fecha_hoy'], date(2026, 1, 14))
+        fila, = respuesta.context['filas']
+        self.assertEqual((fila['presentes'], fila['abiertos']), (1, 1))
+
+
+class HistorialTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        self.desde = date.today() - timedelta(days=9)
+        self.dias = [self.desde + timedelta(days=i) for i in range(5)]
+        for dia in self.dias:
+            turno(self.trabajador, self.obra, dia, 2)
+        otro = crear_perfil('otro', 'TRABAJADOR', valor_hora=5000)
+        turno(otro, self.obra, self.dias[0], 2)
+        self.client.force_login(self.trabajador.usuario)
+        self.url = reverse('api_mis_asistencias')
+        self.periodo = {'desde': self.desde, 'hasta': date.today()}
+
+    def test_paginas_con_cursor_y_totales(self):
+        primera = self.assertPresupuestoQueries('get', self.url, {**self.periodo, 'limite': 3}).json()
+        self.assertEqual([f['fecha'] for f in primera['resultados']], [str(d) for d in self.dias[:1:-1]])
+        self.assertEqual(primera['totales']['turnos'], 5)
+        self.assertEqual(primera['totales']['dias'], 5)
+        self.assertEqual(float(primera['totales']['monto']), 50000)
+
+        segunda = self.assertPresupuestoQueries(
+            'get', self.url, {**self.periodo, 'limite': 3, 'cursor': primera['siguiente']}
+        ).json()
+        self.assertEqual([f['fecha'] for f in segunda['resultados']], [str(d) for d in self.dias[1::-1]])
+        self.assertIsNone(segunda['siguiente'])
+        self.assertNotIn('totales', segunda)
+
+    def test_campos_seleccionados(self):
+        datos = self.client.get(self.url, {**self.periodo, 'campos': 'fecha,monto_pago_dia'}).json()
+        self.assertEqual(set(datos['resultados'][0]), {'fecha', 'monto_pago_dia'})
+        self.assertEqual(len(datos['resultados']), 5)
+        self.assertEqual(self.client.get(self.url, {'campos': 'fecha,latitud_entrada'}).status_code, 400)
+
+    def test_periodo_y_cursor_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'desde': '2025-02-10', 'hasta': '2025-02-01'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'basura'}).status_code, 400)
+        self.client.force_login(self.jefe.usuario)
+        self.assertEqual(self.client.get(self.url).json()['resultados'], [])
+
+
+class PronosticoTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.hoy = date.today()
+        for i in range(1, 15):
+            dia = self.hoy - timedelta(days=i)
+            if dia.weekday() != 6:
+                turno(self.trabajador, self.obra, dia, 2)   # 10.000 diarios de lunes a sábado
+
+    def test_ajuste_con_tendencia_y_dias_de_semana(self):
+        lunes = date(2025, 1, 6)
+        diaria = [0.0 if t % 7 == 6 else 1000.0 + 10 * t for t in range(84)]
+        modelo = pronostico.ajustar(diaria, lunes)
+        self.assertEqual(modelo['factores'][6], 0)
+        # Sin estacionalidad es el promedio de la semana: 10 por día hábil son ~8,6 por día
+        self.assertAlmostEqual(modelo['pendiente'], 10 * 6 / 7, delta=1)
+        self.assertAlmostEqual(modelo['nivel'], (1000 + 10 * 83) * 6 / 7, delta=50)
+        self.assertIsNone(pronostico.ajustar([0.0] * 30, lunes))
+
+    def test_proyeccion_y_cache_por_version(self):
+        balance = BalanceObra.objects.select_related('obra').get()
+        with self.assertNumQueries(2):
+            p = pronostico.para_balances([balance])[self.obra.id]
+        dias_restantes = (self.obra.fecha_termino_estimada - self.hoy).days + 1
+        costo = p['costo_final']
+        self.assertLessEqual(costo['bajo'], costo['estimado'])
+        self.assertLessEqual(costo['estimado'], costo['alto'])
+        # Sin domingos el gasto futuro es ~6/7 de 10.000 por día
+        futuro = costo['estimado'] - float(balance.total_pagado_sueldos)
+        self.assertAlmostEqual(futuro / dias_restantes, 10000 * 6 / 7, delta=600)
+        self.assertIsNone(p['agotamiento']['estimado'])   # 100M alcanzan de sobra
+
+        with self.assertNumQueries(0):
+            pronostico.para_balances([balance])
+        turno(self.trabajador, self.obra, self.hoy, 9)      # dato nuevo: se recalcula
+        with self.assertNumQueries(2):
+            pronostico.para_balances([balance])
+
+    def test_ttl_acotado_sin_cache_compartido(self):
+        self.assertFalse(agregados.cache_compartido())
+        self.assertEqual(pronostico._ttl(), 300)
+        filebased = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': MEDIA_TEMPORAL}}
+        with self.settings(CACHES=filebased):
+            self.assertEqual(pronostico._ttl(), 24 * 3600)
+
+    def test_dia_local_de_noche(self):
+        # 02:00 UTC del 15 son las 23:00 del 14 en Santiago: el 14 todavía no es `ayer`
+        balance = BalanceObra.objects.select_related('obra').get()
+        ahora = datetime(2026, 1, 15, 2, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=ahora), \
+                mock.patch.object(pronostico, '_calcular', return_value={}) as calcular:
+            pronostico.para_balances([balance])
+        self.assertEqual(calcular.call_args.args[1], date(2026, 1, 14))
+
+    def test_fin_de_caja(self):
+        BalanceObra.objects.update(presupuesto_restante=55000)
+        balance = BalanceObra.objects.select_related('obra').get()
+        agotamiento = pronostico.para_balances([balance])[self.obra.id]['agotamiento']
+        self.assertLessEqual(agotamiento['temprano'], agotamiento['estimado'])
+        self.assertLessEqual(agotamiento['estimado'], agotamiento['tarde'])
+        self.assertTrue(self.hoy + timedelta(days=4) <= agotamiento['estimado'] <= self.hoy + timedelta(days=9))
+
+    def test_api_y_admin(self):
+        crear_obra(self.jefe, nombre="Sin movimiento")
+        self.client.force_login(self.trabajador.usuario)
+        self.assertEqual(self.client.get(reverse('api_pronosticos')).status_code, 403)
+
+        self.client.force_login(self.jefe.usuario)
+        fila, = self.assertPresupuestoQueries('get', reverse('api_pronosticos')).json()['resultados']
+        self.assertEqual(fila['obra_id'], self.obra.id)
+        self.assertIn('alto', fila['costo_final'])
+        self.assertEqual(self.client.get(reverse('api_pronosticos'), {'obra_id': 'abc'}).status_code, 400)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123'))
+        respuesta = self.client.get(reverse('admin:registro_balanceobra_changelist'))
+        self.assertContains(respuesta, 'Cubierto')
+
+
+class CorreccionTests(DatosBaseMixin, PresupuestoQueriesMixin, TestCase):
+
+    def setUp(self):
+        self.lunes = date.today() - timedelta(days=date.today().weekday() + 7)
+        self.cuadrilla = [self.trabajador] + [
+            crear_perfil(f'obrero{i}', 'TRABAJADOR', sueldo_diario=40000, valor_hora=5000) for i in range(2)
+        ]
+        for perfil in self.cuadrilla:
+            for i in range(3):
+                turno(perfil, self.obra, self.lunes + timedelta(days=i), 2)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave-segura-123')
+
+    def test_recalcula_y_actualiza_balance_una_vez(self):
+        qs = Asistencia.objects.filter(trabajador=self.trabajador)
+        with CaptureQueriesContext(connection) as pocas:
+            correcciones.corregir(qs, self.admin, hora_entrada=time(8, 0), hora_salida=time(17, 0))
+        with CaptureQueriesContext(connection) as muchas:
+            resultado = correcciones.corregir(Asistencia.objects.all(), self.admin, hora_entrada=time(8, 0), hora_salida=time(12, 30))
+        self.assertEqual(len(pocas), len(muchas))
+        self.assertEqual(resultado, {'asistencias': 9, 'obras': 1})
+
+        a = Asistencia.objects.select_related('modificado_por').first()
+        self.assertEqual((a.horas_trabajadas, a.monto_pago_dia), (Decimal('4.50'), 22500))
+        self.assertEqual(a.modificado_por, self.admin)
+        self.assertEqual(BalanceObra.objects.get(obra=self.obra).total_pagado_sueldos, 9 * 22500)
+
+    def test_cambio_de_obra_y_salida_invalida(self):
+        otra = crear_obra(self.jefe, nombre="Bodega Norte", latitud='-23.7000000')
+        qs = Asistencia.objects.filter(fecha=self.lunes)
+        correcciones.corregir(qs, self.admin, obra=otra)
+        self.assertFalse(Asistencia.objects.filter(obra=otra, entrada_valida=True).exists())
+        self.assertEqual(BalanceObra.objects.get(obra=otra).total_pagado_sueldos, 3 * 10000)
+        self.assertEqual(BalanceObra.objects.get(obra=self.obra).total_pagado_sueldos, 6 * 10000)
+
+        # De vuelta a una obra que sí las contiene: siguen inválidas (pudo ser viaje imposible)
+        correcciones.corregir(qs, self.admin, obra=self.obra)
+        self.assertFalse(Asistencia.objects.filter(fecha=self.lunes, entrada_valida=True).exists())
+
+        with self.assertRaises(correcciones.CorreccionInvalida):
+            correcciones.corregir(Asistencia.objects.all(), self.admin, hora_salida=time(0, 30))
+        self.assertFalse(Asistencia.objects.filter(hora_salida=time(0, 30)).exists())
+
+    def test_accion_del_admin(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:registro_asistencia_changelist')
+        ids = [str(pk) for pk in Asistencia.objects.filter(trabajador=self.trabajador).values_list('pk', flat=True)]
+        datos = {'action': 'corregir_en_bloque', '_selected_action': ids}
+        self.assertContains(self.client.post(url, datos), 'Aplicar corrección')
+
+        respuesta = self.client.post(url, {**datos, 'aplicar': '1', 'hora_salida': '16:00'})
+        self.assertRedirects(respuesta, url, fetch_redirect_response=False)
+        self.assertEqual(Asistencia.objects.filter(hora_salida=time(16, 0)).count(), 3)
+
+    def test_api_solo_obras_propias(self):
+        url = reverse('api_corregir_asistencias')
+        ajena = crear_obra(crear_perfil('otrojefe', 'JEFE'), nombre="Ajena")
+        turno(self.trabajador, ajena, self.lunes + timedelta(days=4), 2)
+        ids = list(Asistencia.objects.filter(trabajador=self.trabajador).values_list('pk', flat=True))
+
+        self.client.force_login(self.trabajador.usuario)
+        self.assertEqual(self.client.post(url, {'ids': ids, 'hora_salida': '16:00'}, content_type='application/json').status_code, 403)
+
+        self.client.force_login(self.jefe.usuario)
+        respuesta = self.assertPresupuestoQueries('post', url, {'ids': ids, 'hora_salida': '16:00'}, content_type='application/json')
+        self.assertEqual(respuesta.json(), {'asistencias': 3, 'obras': 1, 'ignoradas': 1})
+        self.assertNotEqual(Asistencia.objects.get(obra=ajena).hora_salida, time(16, 0))
+        respuesta = self.client.post(url, {'ids': ids, 'obra_id': ajena.pk}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_api_con_token(self):
+        # Con Bearer request.user es un UsuarioToken, no un User
+        access = tokens.emitir(Perfil.objects.select_related('usuario').get(pk=self.jefe.pk))['access']
+        ids = list(Asistencia.objects.filter(trabajador=self.trabajador).values_list('pk', flat=True))
+        respuesta = self.client.post(
+            reverse('api_corregir_asistencias'), {'ids': ids, 'hora_salida': '16:00'},
+            content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {access}",
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(set(Asistencia.objects.filter(pk__in=ids).values_list('modificado_por', flat=True)), {self.jefe.usuario.pk})
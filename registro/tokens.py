@@ -0,0 +1,132 @@
+"""
+Tokens firmados (JWT HS256) para la APK.
+
+Con Basic, cada marca pagaba un hash PBKDF2 completo de la contraseña. Ahora la
+APK pide un par de tokens una vez (/v1/api/token/) y en cada llamada manda
+`Authorization: Bearer <access>`. Verificar el access es solo el HMAC y la
+expiración: sin base de datos ni hash. El perfil se carga recién cuando la
+vista lo usa.
+
+El access dura JWT_ACCESS_MINUTOS y no se puede revocar antes; el refresh
+(JWT_REFRESH_DIAS) lleva Perfil.version_token, y "Resetear Celular" en el admin
+la incrementa: desde ahí ningún refresh viejo sirve y el trabajador tiene que
+volver a iniciar sesión (y vincular el celular nuevo).
+"""
+from datetime import timedelta
+
+import jwt
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import authentication, exceptions
+
+from .models import Perfil
+
+ALGORITMO = 'HS256'
+ACCESS, REFRESH = 'access', 'refresh'
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def _duracion(tipo):
+    if tipo == ACCESS:
+        return timedelta(minutes=getattr(settings, 'JWT_ACCESS_MINUTOS', 10))
+    return timedelta(days=getattr(settings, 'JWT_REFRESH_DIAS', 30))
+
+
+def _firmar(perfil, tipo, ahora):
+    datos = {
+        'tipo': tipo,
+        'usr': perfil.usuario_id,
+        'perfil': perfil.pk,
+        'rol': perfil.rol,
+        'staff': perfil.usuario.is_staff,
+        'ver': perfil.version_token,
+        'iat': ahora,
+        'exp': ahora + _duracion(tipo),
+    }
+    return jwt.encode(datos, settings.SECRET_KEY, algorithm=ALGORITMO)
+
+
+def emitir(perfil, con_refresh=True):
+    """Par de tokens para el perfil (perfil.usuario debe venir cargado)."""
+    ahora = timezone.now()
+    tokens = {'access': _firmar(perfil, ACCESS, ahora), 'expira_en': int(_duracion(ACCESS).total_seconds())}
+    if con_refresh:
+        tokens['refresh'] = _firmar(perfil, REFRESH, ahora)
+    return tokens
+
+
+def decodificar(token, tipo):
+    try:
+        datos = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITMO], options={'require': ['exp', 'tipo', 'perfil']})
+    except jwt.ExpiredSignatureError:
+        raise TokenInvalido("El token expiró")
+    except jwt.InvalidTokenError:
+        raise TokenInvalido("Token inválido")
+    if datos['tipo'] != tipo:
+        raise TokenInvalido("Tipo de token incorrecto")
+    return datos
+
+
+def refrescar(token):
+    """Access nuevo a partir de un refresh; acá sí se consulta la BD para ver si fue revocado."""
+    datos = decodificar(token, REFRESH)
+    perfil = Perfil.objects.select_related('usuario').filter(pk=datos['perfil'], usuario__is_active=True).first()
+    if perfil is None or perfil.version_token != datos.get('ver'):
+        raise TokenInvalido("Sesión revocada, vuelve a iniciar sesión")
+    return emitir(perfil, con_refresh=False)
+
+
+class UsuarioToken:
+    """
+    Usuario autenticado por token. Lo que viene en el token (id, rol, staff)
+    no toca la BD; perfil y cualquier otro atributo se cargan al usarlos.
+    """
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, datos):
+        self.id = self.pk = datos['usr']
+        self.perfil_id = datos['perfil']
+        self.rol = datos.get('rol')
+        self.is_staff = datos.get('staff', False)
+
+    @cached_property
+    def perfil(self):
+        perfil = Perfil.objects.select_related('usuario').get(pk=self.perfil_id)
+        self.__dict__['_usuario'] = perfil.usuario
+        return perfil
+
+    @cached_property
+    def _usuario(self):
+        return User.objects.get(pk=self.pk)
+
+    def __getattr__(self, nombre):
+        if nombre.startswith('_'):
+            raise AttributeError(nombre)
+        return getattr(self._usuario, nombre)
+
+
+class AutenticacionToken(authentication.BaseAuthentication):
+    palabra = 'Bearer'
+
+    def authenticate(self, request):
+        partes = authentication.get_authorization_header(request).split()
+        if not partes or partes[0].lower() != self.palabra.lower().encode():
+            return None  # Sigue con sesión / Basic
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed("Encabezado Authorization inválido")
+        try:
+            datos = decodificar(partes[1].decode(), ACCESS)
+        except (TokenInvalido, UnicodeDecodeError) as e:
+            raise exceptions.AuthenticationFailed(str(e))
+        return UsuarioToken(datos), datos
+
+    def authenticate_header(self, request):
+        # Con esto DRF responde 401 (y no 403) cuando falta o venció el token
+        return self.palabra
@@ -0,0 +1,126 @@
+"""
+Entrada y salida de turnos con un solo turno abierto por trabajador.
+
+Perfil.turno_abierto apunta a la Asistencia sin salida, así que encontrarla es
+una lectura por PK. Las marcas bloquean la fila del Perfil (select_for_update):
+dos toques simultáneos se ejecutan uno después del otro y el segundo ve el
+turno que abrió el primero. Un segundo toque dentro de VENTANA_DOBLE_TOQUE
+segundos se ignora en vez de cerrar un turno de cero horas.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Asistencia, BalanceObra, Perfil
+
+ENTRADA, SALIDA, REPETIDA, SIN_TURNO = 'entrada', 'salida', 'repetida', 'sin_turno'
+
+
+def _ventana():
+    return getattr(settings, 'TURNO_DOBLE_TOQUE_SEGUNDOS', 60)
+
+
+def _abierto(turno_abierto_id, hoy):
+    # Se filtra también por fecha: en PostgreSQL solo se revisa la partición del mes
+    if not turno_abierto_id:
+        return None
+    return Asistencia.objects.using('default').filter(
+        pk=turno_abierto_id, fecha=hoy, hora_salida__isnull=True
+    ).first()
+
+
+def turno_abierto(perfil):
+    """Asistencia abierta de hoy del trabajador, o None."""
+    return _abierto(perfil.turno_abierto_id, timezone.localdate())
+
+
+def _bloquear_balance(obra_id):
+    """
+    Asistencia.save() recalcula el balance de la obra dentro de esta transacción.
+    En PostgreSQL (READ COMMITTED) dos marcas simultáneas de la misma obra no ven
+    la fila sin commit de la otra y la última pisaría el balance con un total al
+    que le falta una. Con la fila del balance bloqueada, la segunda espera el
+    commit de la primera y su SUM ya la incluye. (Si la obra aún no tiene
+    balance no hay nada que bloquear: lo crea la primera marca.)
+    """
+    list(BalanceObra.objects.select_for_update().filter(obra_id=obra_id).values_list('pk', flat=True))
+
+
+def _recien_abierto(turno):
+    # hora_entrada la pone auto_now_add con la hora local
+    transcurrido = timezone.localtime().replace(tzinfo=None) - datetime.combine(turno.fecha, turno.hora_entrada)
+    return abs(transcurrido) < timedelta(seconds=_ventana())
+
+
+def marcar(perfil, obra=None, latitud=None, longitud=None, foto=None, ip=None, accion=None):
+    """
+    Marca entrada o salida. Con accion=None decide sola (como la APK): si hay
+    turno abierto es salida, si no es entrada. Devuelve (estado, asistencia).
+    """
+    # Fecha y hora locales (America/Santiago), como el default de Asistencia.fecha:
+    # con la de UTC, una entrada después de las ~21:00 quedaba en el día siguiente
+    hoy = timezone.localdate()
+    with transaction.atomic():
+        bloqueado = Perfil.objects.select_for_update().only('id', 'turno_abierto').get(pk=perfil.pk)
+        turno = _abierto(bloqueado.turno_abierto_id, hoy)
+
+        if turno is None:
+            if accion == SALIDA:
+                return SIN_TURNO, None
+            _bloquear_balance(obra.pk)
+            turno = Asistencia(
+                trabajador=perfil, obra=obra, fecha=hoy,
+                latitud_entrada=latitud, longitud_entrada=longitud, foto_entrada=foto, ip_registro=ip,
+            )
+            turno.save()
+            Perfil.objects.filter(pk=perfil.pk).update(turno_abierto=turno)
+            perfil.turno_abierto_id = turno.pk
+            return ENTRADA, turno
+
+        if accion == ENTRADA or _recien_abierto(turno):
+            return REPETIDA, turno
+
+        _bloquear_balance(turno.obra_id)
+        turno.trabajador = perfil
+        turno.hora_salida = timezone.localtime().time()
+        turno.latitud_salida = latitud
+        turno.longitud_salida = longitud
+        if foto:
+            turno.foto_salida = foto
+        turno.save()
+        Perfil.objects.filter(pk=perfil.pk).update(turno_abierto=None)
+        perfil.turno_abierto_id = None
+        return SALIDA, turno
+
+
+def turnos_olvidados(dias=1):
+    """Asistencias sin salida de hace `dias` días o más."""
+    limite = timezone.localdate() - timedelta(days=dias - 1)
+    return Asistencia.objects.filter(hora_salida__isnull=True, fecha__lt=limite)
+
+
+def cerrar_olvidados(dias=1, cerrar=False):
+    """
+    Marca (y con cerrar=True también cierra con 0 horas y $0, para que el jefe
+    corrija la hora real) los turnos olvidados, en un solo UPDATE. Devuelve
+    (cantidad, ids de obras afectadas).
+    """
+    # Para cerrar cuentan también los ya marcados por una corrida anterior sin --cerrar
+    # (siguen sin salida y con Perfil.turno_abierto apuntándoles); para solo marcar, no se repiten
+    qs = turnos_olvidados(dias)
+    if not cerrar:
+        qs = qs.filter(salida_automatica=False)
+    obras = set(qs.values_list('obra', flat=True).distinct().order_by())
+    cambios = {'salida_automatica': True}
+    if cerrar:
+        cambios.update(hora_salida=F('hora_entrada'), horas_trabajadas=0, monto_pago_dia=0)
+
+    with transaction.atomic():
+        ids = list(qs.values_list('id', flat=True)) if cerrar else []
+        total = qs.update(**cambios)
+        if cerrar:
+            Perfil.objects.filter(turno_abierto__in=ids).update(turno_abierto=None)
+    return total, sorted(obras)
@@ -5,5 +5,16 @@ urlpatterns = [
     # Rutas para la App Móvil
     path('api/obras/', api.lista_obras, name='api_obras'),
     path('api/marcar/', api.marcar_asistencia_api, name='api_marcar'),
+    path('api/nomina/', api.nomina_periodo, name='api_nomina'),
+    path('api/trabajadores/', api.buscar_trabajadores, name='api_trabajadores'),
+    path('api/mis-asistencias/', api.mis_asistencias, name='api_mis_asistencias'),
+    path('api/pronosticos/', api.pronosticos_obras, name='api_pronosticos'),
+    path('api/asistencias/corregir/', api.corregir_asistencias, name='api_corregir_asistencias'),
+    path('api/token/', api.obtener_token, name='api_token'),
+    path('api/token/refrescar/', api.refrescar_token, name='api_token_refrescar'),
+    path('api/subidas/', api.crear_subida, name='api_subidas'),
+    path('api/subidas/<uuid:subida_id>/', api.detalle_subida, name='api_subida'),
+    path('api/subidas/<uuid:subida_id>/finalizar/', api.finalizar_subida, name='api_subida_finalizar'),
+    path('api/fotos/subida/', api.url_subida_foto, name='api_foto_subida'),
     
 ]
\ No newline at end of file
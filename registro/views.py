@@ -1,22 +1,34 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
 from django.utils import timezone
 from django.contrib import messages
 from .models import Asistencia, Obra, Perfil, ReporteImproductivo
-from .decorators import solo_trabajadores
+from .decorators import solo_trabajadores, presupuesto_queries
 from .forms import ReporteIncidenteForm  # <--- NUEVO: Importamos el formulario
+from .metricas import exportar_prometheus
+from .replicas import lecturas_en_replica
+from . import agregados, almacenamiento, subidas, turnos
 import uuid  # <--- IMPORTANTE: Para generar el ID único del celular
 
 # --- FUNCIÓN AUXILIAR PARA OBTENER LA IP REAL ---
 def get_client_ip(request):
-    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
+    # Cada proxy agrega a la derecha la IP que le habló: con N proxies confiables la
+    # del cliente es la N-ésima desde la derecha. La primera la pone el cliente a su
+    # gusto (una granja de clics cambiaría de IP en cada marca)
+    proxies = getattr(settings, 'PROXIES_CONFIABLES', 1)
+    saltos = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxies and len(saltos) >= proxies:
+        return saltos[-proxies]
+    return request.META.get('REMOTE_ADDR')
 
 # 1. EL DIRECTOR DE TRÁFICO (Home)
+@presupuesto_queries(3)
 @login_required
 def home(request):
     try:
@@ -31,6 +43,7 @@ def home(request):
         return redirect('/admin/')
 
 # 2. VISTA DEL TRABAJADOR (Con Seguridad Anti-Fraude)
+@presupuesto_queries(19)
 @login_required
 @solo_trabajadores
 def panel_trabajador(request):
@@ -64,19 +77,12 @@ def panel_trabajador(request):
 
     # --- FIN SEGURIDAD ---
 
-    hoy = timezone.now().date()
-    
-    asistencia_activa = Asistencia.objects.filter(
-        trabajador=perfil,
-        fecha=hoy,
-        hora_salida__isnull=True
-    ).first()
+    # Turno abierto: lectura por PK desde la primaria (ver registro/turnos.py)
+    asistencia_activa = turnos.turno_abierto(perfil)
 
     if request.method == 'POST':
         lat = request.POST.get('latitud')
         lon = request.POST.get('longitud')
-        foto = request.FILES.get('foto')
-        
         # Capturamos la IP para auditoría
         ip_cliente = get_client_ip(request)
 
@@ -84,31 +90,32 @@ def panel_trabajador(request):
             messages.error(request, "Error: No se pudo obtener tu ubicación GPS.")
             return redirect('panel_trabajador')
 
-        if 'marcar_entrada' in request.POST:
-            obra_id = request.POST.get('obra_id')
-            obra = get_object_or_404(Obra, id=obra_id)
-            
-            Asistencia.objects.create(
-                trabajador=perfil,
-                obra=obra,
-                latitud_entrada=lat,
-                longitud_entrada=lon,
-                foto_entrada=foto,
-                ip_registro=ip_cliente  # <--- Guardamos la IP aquí
-            )
-            messages.success(request, "¡Entrada marcada exitosamente!")
-
-        elif 'marcar_salida' in request.POST and asistencia_activa:
-            asistencia_activa.hora_salida = timezone.now().time()
-            asistencia_activa.latitud_salida = lat
-            asistencia_activa.longitud_salida = lon
-            
-            if foto:
-                asistencia_activa.foto_salida = foto
-            
-            asistencia_activa.save()
-            messages.success(request, "¡Salida marcada! Buen descanso.")
+        # La foto viene en el formulario, subida por partes (subida_id) o directo al storage (foto_clave)
+        try:
+            with subidas.usar(request.POST.get('subida_id'), request.user, request.FILES.get('foto')) as subida:
+                foto = almacenamiento.foto_directa(request.POST.get('foto_clave'), request.user, subida)
+                estado = None
+                if 'marcar_entrada' in request.POST:
+                    obra_id = request.POST.get('obra_id')
+                    obra = get_object_or_404(Obra, id=obra_id)
             
+                    estado, _ = turnos.marcar(perfil, obra, lat, lon, foto, ip=ip_cliente, accion=turnos.ENTRADA)
+                    if estado == turnos.REPETIDA:
+                        messages.info(request, "Ya tienes un turno abierto.")
+                    else:
+                        messages.success(request, "¡Entrada marcada exitosamente!")
+
+                elif 'marcar_salida' in request.POST:
+                    estado, _ = turnos.marcar(perfil, latitud=lat, longitud=lon, foto=foto, accion=turnos.SALIDA)
+                    if estado == turnos.SALIDA:
+                        messages.success(request, "¡Salida marcada! Buen descanso.")
+                    elif estado == turnos.REPETIDA:
+                        messages.info(request, "Acabas de marcar entrada; espera un minuto para marcar la salida.")
+                if estado in (turnos.ENTRADA, turnos.SALIDA):
+                    subidas.consumida(subida)
+        except subidas.SubidaInvalida as e:
+            messages.error(request, f"Error con la foto: {e}")
+
         return redirect('panel_trabajador')
 
     obras = Obra.objects.filter(activa=True)
@@ -119,7 +126,9 @@ def panel_trabajador(request):
     })
 
 # 3. VISTA DEL JEFE DE OBRA (Dashboard Multi-Obra)
+@presupuesto_queries(10)
 @login_required
+@lecturas_en_replica
 def dashboard_jefe_obra(request):
     try:
         perfil = request.user.perfil
@@ -134,6 +143,14 @@ def dashboard_jefe_obra(request):
     if not mis_obras.exists():
         return render(request, 'registration/error_no_obra.html')
 
+    # Vista general: todas las obras del jefe en una tabla, con queries constantes
+    if request.GET.get('vista') == 'resumen':
+        filas = agregados.resumen_obras(mis_obras.order_by('nombre'))
+        totales = {campo: sum(f[campo] for f in filas) for campo in ('presentes', 'alertas_gps', 'abiertos', 'gasto')}
+        return render(request, 'registration/resumen_jefe.html', {
+            'filas': filas, 'totales': totales, 'fecha_hoy': timezone.localdate(),
+        })
+
     obra_id = request.GET.get('obra_id')
     
     if obra_id:
@@ -141,11 +158,15 @@ def dashboard_jefe_obra(request):
     else:
         obra_actual = mis_obras.first()
 
-    hoy = timezone.now().date()
-    asistencias_hoy = Asistencia.objects.filter(obra=obra_actual, fecha=hoy).order_by('-hora_entrada')
+    hoy = timezone.localdate()
+    asistencias_hoy = Asistencia.objects.filter(obra=obra_actual, fecha=hoy).select_related(
+        'trabajador__usuario'
+    ).order_by('-hora_entrada')
     
-    presentes = asistencias_hoy.count()
-    alertas_gps = asistencias_hoy.filter(entrada_valida=False).count()
+    # Contadores desde el caché (se invalida con cada marca de la obra)
+    conteo = agregados.asistencia_hoy(obra_actual.id)
+    presentes = conteo['presentes']
+    alertas_gps = conteo['alertas_gps']
     
     context = {
         'obra': obra_actual,
@@ -158,6 +179,7 @@ def dashboard_jefe_obra(request):
     return render(request, 'registration/dashboard_jefe.html', context)
 
 # 4. CREAR REPORTE DE INCIDENTE (Nueva Funcionalidad)
+@presupuesto_queries(27)
 @login_required
 def crear_reporte(request):
     try:
@@ -178,22 +200,60 @@ def crear_reporte(request):
         messages.error(request, "No tienes una obra activa asignada para reportar incidentes.")
         return redirect('dashboard_jefe')
 
+    # El selector parte con quienes marcaron asistencia hoy en la obra
+    hoy = timezone.localdate()
     if request.method == 'POST':
-        form = ReporteIncidenteForm(request.POST, request.FILES)
-        if form.is_valid():
-            reporte = form.save(commit=False)
-            reporte.obra = obra_actual      # Asignación automática
-            reporte.jefe_obra = perfil      # Asignación automática
-            reporte.save()                  # Guardamos primero para tener ID
-            
-            form.save_m2m()                 # Guardamos los trabajadores afectados (Many-to-Many)
-            
-            # Forzamos el cálculo de dinero perdido
-            reporte.calcular_impacto() 
-            
-            messages.success(request, "⚠ Incidente reportado. El impacto financiero se ha calculado.")
-            return redirect('dashboard_jefe')
+        # La evidencia puede venir en el formulario o ya subida por partes (subida_id)
+        try:
+            with subidas.usar(request.POST.get('subida_id'), request.user, request.FILES.get('evidencia_foto')) as evidencia:
+                archivos = {'evidencia_foto': evidencia} if evidencia else request.FILES
+                form = ReporteIncidenteForm(request.POST, archivos, obra=obra_actual, fecha=hoy)
+                if form.is_valid():
+                    reporte = form.save(commit=False)
+                    reporte.obra = obra_actual      # Asignación automática
+                    reporte.jefe_obra = perfil      # Asignación automática
+                    reporte.save()                  # Guardamos primero para tener ID
+                    subidas.consumida(evidencia)
+
+                    form.save_m2m()                 # Guardamos los trabajadores afectados (Many-to-Many)
+
+                    # Forzamos el cálculo de dinero perdido
+                    reporte.calcular_impacto()
+
+                    messages.success(request, "⚠ Incidente reportado. El impacto financiero se ha calculado.")
+                    return redirect('dashboard_jefe')
+        except subidas.SubidaInvalida as e:
+            messages.error(request, f"Error con la evidencia: {e}")
+            form = ReporteIncidenteForm(request.POST, obra=obra_actual, fecha=hoy)
     else:
-        form = ReporteIncidenteForm()
+        form = ReporteIncidenteForm(obra=obra_actual, fecha=hoy)
+
+    return render(request, 'registration/crear_reporte.html', {'form': form, 'obra': obra_actual})
+
+# 5. MÉTRICAS PARA PROMETHEUS (Solo Staff)
+@staff_member_required
+def metricas(request):
+    return HttpResponse(exportar_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# 6. URLS FIRMADAS DEL ALMACENAMIENTO LOCAL (en producción las entrega Supabase)
+@csrf_exempt
+def media_firmada(request, token):
+    nombre, operacion = almacenamiento.AlmacenamientoLocal.leer_token(token)
+    if nombre is None:
+        raise Http404("URL vencida o inválida")
+
+    if operacion == 'get' and request.method == 'GET':
+        if not default_storage.exists(nombre):
+            raise Http404("La foto no existe")
+        return FileResponse(default_storage.open(nombre, 'rb'))
+
+    if operacion == 'put' and request.method == 'PUT':
+        largo = int(request.META.get('CONTENT_LENGTH') or 0)
+        if not 0 < largo <= getattr(settings, 'SUBIDAS_MAXIMO_BYTES', 15 * 1024 * 1024):
+            return HttpResponse("Tamaño inválido", status=400)
+        if default_storage.exists(nombre):
+            return HttpResponse("La foto ya fue subida", status=409)
+        default_storage.save(nombre, File(request, name=nombre))
+        return HttpResponse(status=201)
 
-    return render(request, 'registration/crear_reporte.html', {'form': form, 'obra': obra_actual})
\ No newline at end of file
+    return HttpResponse(status=405)